@@ -0,0 +1,257 @@
+"""
+Benchmarks of the CLI actions and of their hot spots on a synthetic CorefUD corpus.
+
+    python benchmarks/run.py [--documents 20] [--sentences 50] [-o results.json]
+
+Each scenario is timed (the best of --repeat runs) and then run once more under
+tracemalloc for its peak memory. The results are written as JSON with the throughput
+in words per second, so that they can be compared across versions.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import chain
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from synthetic import add_noise_to_file, generate_corpus  # noqa: E402
+from text2text_coref.convert import (convert_conllu_file_to_text, convert_text_file_to_conllu,  # noqa: E402
+                                     convert_text_to_conllu, convert_to_text, read_data)
+from text2text_coref.eml_format import convert_conllu_file_to_eml, convert_eml_file_to_conllu  # noqa: E402
+from text2text_coref.json_format import convert_conllu_file_to_json, convert_json_to_conllu  # noqa: E402
+from text2text_coref.output_cleaner import (_correct_tags, _parse_eml_document, _parse_word,  # noqa: E402
+                                            _word_level_edit_distance, clean_file, read_conllu, read_input_file)
+
+ALIGNERS = ["banded", "numpy", "anchored", "linear", "sentence", "full"]
+
+
+class Corpus:
+    """The synthetic gold file and the inputs of all the actions derived from it."""
+
+    def __init__(self, directory, documents, sentences, seed):
+        self.directory = directory
+        self.gold = self.path("gold.conllu")
+        self.words = generate_corpus(self.gold, documents, sentences, seed)
+        self.documents = documents
+        self.text = self.path("gold.txt")
+        self.eml = self.path("gold.eml")
+        self.json = self.path("gold.json")
+        convert_conllu_file_to_text(self.gold, self.text, zero_mentions=True)
+        convert_conllu_file_to_eml(self.gold, self.eml, zero_mentions=True)
+        convert_conllu_file_to_json(self.gold, self.json, zero_mentions=True)
+        self.noisy_text = self.path("noisy.txt")
+        self.noisy_eml = self.path("noisy.eml")
+        add_noise_to_file(self.text, self.noisy_text, "txt", seed)
+        add_noise_to_file(self.eml, self.noisy_eml, "eml", seed)
+        self.cleaned_text = self.path("cleaned.txt")
+        self.cleaned_eml = self.path("cleaned.eml")
+        clean_file(self.noisy_text, self.gold, self.cleaned_text, zero_mentions=True)
+        clean_file(self.noisy_eml, self.gold, self.cleaned_eml, zero_mentions=True, format="eml")
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+
+# Each scenario prepares its input (untimed) and returns the function to measure.
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(function):
+        SCENARIOS[name] = function
+        return function
+    return register
+
+
+@scenario("conllu2text")
+def _conllu2text(corpus):
+    return lambda: convert_conllu_file_to_text(corpus.gold, corpus.path("out.txt"), zero_mentions=True)
+
+
+@scenario("conllu2eml")
+def _conllu2eml(corpus):
+    return lambda: convert_conllu_file_to_eml(corpus.gold, corpus.path("out.eml"), zero_mentions=True)
+
+
+@scenario("conllu2json")
+def _conllu2json(corpus):
+    return lambda: convert_conllu_file_to_json(corpus.gold, corpus.path("out.json"), zero_mentions=True)
+
+
+def _clean(corpus, format, aligner):
+    noisy = corpus.noisy_text if format == "txt" else corpus.noisy_eml
+    return lambda: clean_file(noisy, corpus.gold, corpus.path(f"out.{format}"), zero_mentions=True, format=format,
+                              aligner=aligner)
+
+
+for _aligner in ALIGNERS:
+    for _format in ["txt", "eml"]:
+        scenario(f"clean[{_format},{_aligner}]")(
+            lambda corpus, format=_format, aligner=_aligner: _clean(corpus, format, aligner)
+        )
+
+
+@scenario("text2conllu")
+def _text2conllu(corpus):
+    return lambda: convert_text_file_to_conllu(corpus.cleaned_text, corpus.gold, corpus.path("out.conllu"),
+                                               zero_mentions=True)
+
+
+@scenario("text2conllu[udapi]")
+def _text2conllu_udapi(corpus):
+    return lambda: convert_text_file_to_conllu(corpus.cleaned_text, corpus.gold, corpus.path("out.conllu"),
+                                               zero_mentions=True, streaming=False)
+
+
+@scenario("json2conllu")
+def _json2conllu(corpus):
+    return lambda: convert_json_to_conllu(corpus.json, corpus.gold, corpus.path("out.conllu"),
+                                          use_gold_empty_nodes=True)
+
+
+@scenario("eml2conllu")
+def _eml2conllu(corpus):
+    return lambda: convert_eml_file_to_conllu(corpus.cleaned_eml, corpus.gold, corpus.path("out.conllu"),
+                                              zero_mentions=True)
+
+
+@scenario("_word_level_edit_distance")
+def _edit_distance(corpus):
+    docs = [[_parse_word(word) for word in doc.split()] for doc in read_input_file(corpus.noisy_text)]
+    gold = [list(chain(*doc)) for doc in read_conllu(corpus.gold, True)]
+
+    def run():
+        for words, gold_words in zip(docs, gold):
+            _word_level_edit_distance([word.form for word in words], gold_words, words, gold_zeros=True)
+    return run
+
+
+@scenario("_correct_tags")
+def _correct_tags_scenario(corpus):
+    # the noisy words cut into pieces of the gold sentence lengths
+    sentences = []
+    for doc, gold_doc in zip(read_input_file(corpus.noisy_text), read_conllu(corpus.gold, True)):
+        words = [_parse_word(word) for word in doc.split()]
+        for gold_sentence in gold_doc:
+            sentences.append(words[:len(gold_sentence)])
+            words = words[len(gold_sentence):]
+
+    def run():
+        for sentence in sentences:
+            _correct_tags(sentence)
+    return run
+
+
+@scenario("_parse_eml_document")
+def _parse_eml_document_scenario(corpus):
+    docs = read_input_file(corpus.noisy_eml)
+
+    def run():
+        for doc in docs:
+            _parse_eml_document(doc)
+    return run
+
+
+@scenario("convert_to_text")
+def _convert_to_text(corpus):
+    docs = read_data(corpus.gold)
+    return lambda: convert_to_text(docs, corpus.path("out.txt"), True, True, True)
+
+
+@scenario("convert_text_to_conllu")
+def _convert_text_to_conllu(corpus):
+    with open(corpus.cleaned_text, encoding="utf-8") as f:
+        text_docs = f.read().splitlines()
+    return lambda: convert_text_to_conllu(text_docs, corpus.gold, corpus.path("out.conllu"), True)
+
+
+DEFAULT_SCENARIOS = [
+    "conllu2text", "conllu2eml", "conllu2json", "clean[txt,banded]", "clean[eml,banded]", "text2conllu",
+    "text2conllu[udapi]", "json2conllu", "eml2conllu", "_word_level_edit_distance", "_correct_tags",
+    "_parse_eml_document", "convert_to_text", "convert_text_to_conllu",
+]
+
+
+def measure(name, corpus, repeat, memory=True):
+    seconds = []
+    for _ in range(repeat):
+        function = SCENARIOS[name](corpus)
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    result = {
+        "scenario": name,
+        "words": corpus.words,
+        "seconds": min(seconds),
+        "words_per_second": corpus.words / min(seconds),
+    }
+    if memory:
+        function = SCENARIOS[name](corpus)
+        tracemalloc.start()
+        function()
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def _version():
+    try:
+        from importlib.metadata import version
+        return version("text2text_coref")
+    except Exception:
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks of text2text_coref on a synthetic corpus.")
+    parser.add_argument("scenarios", nargs="*", default=DEFAULT_SCENARIOS,
+                        help=f"Scenarios to run (default: all the actions). Available: {', '.join(SCENARIOS)}")
+    parser.add_argument("-d", "--documents", type=int, default=20, help="Number of documents of the corpus.")
+    parser.add_argument("-s", "--sentences", type=int, default=50, help="Number of sentences per document.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of timed runs of each scenario.")
+    parser.add_argument("--no_memory", dest="memory", action="store_false",
+                        help="Do not measure the peak memory (tracemalloc slows the run down a lot).")
+    parser.add_argument("-o", "--output_filename", default=None, help="JSON file with the results (stdout).")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+    # the known word mismatches of the empty nodes etc. would flood the output
+    logging.disable(logging.WARNING)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = Corpus(directory, args.documents, args.sentences, args.seed)
+        for name in args.scenarios:
+            result = measure(name, corpus, args.repeat, args.memory)
+            print(f"{name:30} {result['seconds']:8.3f}s {result['words_per_second']:12.0f} words/s"
+                  + (f" {result['peak_memory'] / 2 ** 20:8.1f} MiB" if args.memory else ""), file=sys.stderr)
+            results.append(result)
+    report = {
+        "version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"documents": args.documents, "sentences": args.sentences, "words": corpus.words,
+                   "seed": args.seed},
+        "results": results,
+    }
+    if args.output_filename:
+        with open(args.output_filename, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Synthetic CorefUD-style corpora and a simulator of the damage LLMs typically do to
+the annotated text (truncation, repetition, substituted words, dropped or unbalanced
+tags, broken EML brackets).
+"""
+import random
+import re
+
+EMPTY_NODE_FORMS = ["#Gen", "#PersPron", "#Rel"]
+ENTITY_TYPES = ["person", "place", "organization", "object", "event", "abstract"]
+DEPRELS = ["nsubj", "obj", "obl", "nmod", "amod", "det", "case", "advmod", "conj"]
+
+
+def _vocabulary(rng, size):
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "te", "vo", "zi", "pa", "do", "ge"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def _random_tree(rng, n):
+    """Heads (0 for the root) of a random dependency tree over n words."""
+    order = list(range(1, n + 1))
+    rng.shuffle(order)
+    heads = [0] * (n + 1)
+    for i, node in enumerate(order[1:], 1):
+        heads[node] = order[rng.randrange(i)]
+    return heads
+
+
+def _plan_mentions(rng, n, mention_rate, nested_rate, discontinuous_rate):
+    """
+    Well-nested mention spans of a sentence with n words as (words, is_discontinuous).
+    Discontinuous mentions do not overlap with other mentions.
+    """
+    mentions = []
+    i = 1
+    while i <= n:
+        if rng.random() >= mention_rate:
+            i += 1
+            continue
+        length = min(n - i + 1, rng.choice([1, 1, 2, 2, 3, 4, 6]))
+        if length >= 3 and rng.random() < discontinuous_rate:
+            gap = rng.randint(i + 1, i + length - 2)
+            mentions.append(([w for w in range(i, i + length) if w != gap], True))
+        else:
+            mentions.append((list(range(i, i + length)), False))
+            if length >= 2 and rng.random() < nested_rate:
+                start = rng.randint(i, i + length - 1)
+                end = rng.randint(start, min(i + length - 1, start + 2))
+                if end - start + 1 < length:
+                    mentions.append((list(range(start, end + 1)), False))
+        i += length + rng.randint(0, 3)
+    return mentions
+
+
+def _subspans(words):
+    spans = [[words[0]]]
+    for w in words[1:]:
+        if w == spans[-1][-1] + 1:
+            spans[-1].append(w)
+        else:
+            spans.append([w])
+    return spans
+
+
+def _empty_node_deps(rng, i, n, empty):
+    """
+    Enhanced dependencies of an empty node placed after the word i whose parent is
+    elsewhere: a later word, the root or another empty node of the sentence.
+    """
+    others = [k for k in empty if k != i]
+    choices = ["later", "root"] + (["empty"] if others else [])
+    kind = rng.choice(choices)
+    if kind == "later":
+        return f"{rng.randint(i + 1, n)}:nsubj"
+    if kind == "root":
+        return "0:root"
+    return f"{rng.choice(others)}.1:nsubj"
+
+
+def generate_document(rng, doc_id, n_sentences, vocabulary, weights, mention_rate=0.25, nested_rate=0.3,
+                      discontinuous_rate=0.1, empty_node_rate=0.05, coreference_rate=0.6, displaced_empty_rate=0.3):
+    """
+    CoNLL-U lines of one synthetic document. Regular words get random trees, empty nodes
+    carry zero mentions and follow their (only) enhanced parent, except for a
+    displaced_empty_rate share of them attached to a later word, the root or another
+    empty node (which the conversions have to move), entities are reused by later
+    mentions with coreference_rate.
+    """
+    lines = [f"# newdoc id = {doc_id}"]
+    entities = []
+    n_words = 0
+    for s in range(n_sentences):
+        n = rng.randint(5, 30)
+        forms = rng.choices(vocabulary, weights, k=n - 1) + ["."]
+        heads = _random_tree(rng, n)
+        deprels = ["root" if heads[i] == 0 else rng.choice(DEPRELS) for i in range(n + 1)]
+        empty = [i for i in range(1, n) if rng.random() < empty_node_rate]
+
+        # opening/closing brackets of each (regular or empty) node
+        opens, singles, closes = {}, {}, {}
+
+        def entity_of():
+            if entities and rng.random() < coreference_rate:
+                return rng.choice(entities)
+            eid = f"e{len(entities) + 1}"
+            entities.append((eid, rng.choice(ENTITY_TYPES)))
+            return entities[-1]
+
+        for words, discontinuous in _plan_mentions(rng, n - 1, mention_rate, nested_rate, discontinuous_rate):
+            eid, etype = entity_of()
+            spans = _subspans(words)
+            for idx, span in enumerate(spans, 1):
+                name = f"{eid}[{idx}/{len(spans)}]" if discontinuous else eid
+                head = rng.randint(1, len(words))
+                if len(span) == 1:
+                    singles.setdefault(span[0], []).append(f"({name}-{etype}-{head})")
+                else:
+                    # longer (outer) mentions open first and close last
+                    opens.setdefault(span[0], []).append((len(span), f"({name}-{etype}-{head}"))
+                    closes.setdefault(span[-1], []).append((len(span), f"{name})"))
+        for i in empty:
+            if rng.random() < 0.8:
+                eid, etype = entity_of()
+                singles.setdefault(f"{i}.1", []).append(f"({eid}-{etype}-1)")
+
+        def entity_misc(key, misc=()):
+            value = "".join(x for _, x in sorted(opens.get(key, []), key=lambda x: -x[0]))
+            value += "".join(singles.get(key, []))
+            value += "".join(x for _, x in sorted(closes.get(key, []), key=lambda x: x[0]))
+            misc = list(misc) + ([f"Entity={value}"] if value else [])
+            return "|".join(sorted(misc, key=str.lower)) or "_"
+
+        lines.append(f"# sent_id = {doc_id}-s{s + 1}")
+        lines.append(f"# text = {' '.join(forms[:-1])}.")
+        for i in range(1, n + 1):
+            misc = ["SpaceAfter=No"] if i == n - 1 else []
+            lines.append(f"{i}\t{forms[i - 1]}\t{forms[i - 1]}\tX\t_\t_\t{heads[i]}\t{deprels[i]}\t"
+                         f"{heads[i]}:{deprels[i]}\t{entity_misc(i, misc)}")
+            if i in empty:
+                form = rng.choice(EMPTY_NODE_FORMS)
+                deps = _empty_node_deps(rng, i, n, empty) if rng.random() < displaced_empty_rate else f"{i}:nsubj"
+                lines.append(f"{i}.1\t{form}\t{form}\tPRON\t_\t_\t_\t_\t{deps}\t{entity_misc(f'{i}.1')}")
+        lines.append("")
+        n_words += n + len(empty)
+    return lines, n_words
+
+
+def generate_corpus(filename, n_docs=10, n_sentences=40, seed=0, vocabulary_size=2000, **kwargs):
+    """
+    Writes a synthetic CorefUD file and returns its number of (regular and empty) words.
+    The words follow a Zipf distribution over a vocabulary of pseudo-words, so that
+    the corpus has both frequent and unique words like a real text.
+    """
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng, vocabulary_size)
+    weights = [1 / rank for rank in range(1, vocabulary_size + 1)]
+    n_words = 0
+    with open(filename, "w", encoding="utf-8") as f:
+        for d in range(n_docs):
+            lines, doc_words = generate_document(rng, f"synthetic-{d + 1}", n_sentences, vocabulary, weights,
+                                                 **kwargs)
+            if d == 0:
+                lines.insert(1, "# global.Entity = eid-etype-head-other")
+            f.write("\n".join(lines) + "\n")
+            n_words += doc_words
+    return n_words
+
+
+# probabilities of the damage per word (or per document for truncation)
+DEFAULT_NOISE = {
+    "truncate": 0.2,
+    "repeat": 0.005,
+    "substitute": 0.03,
+    "delete": 0.02,
+    "insert": 0.02,
+    "drop_tag": 0.03,
+    "unbalanced_tag": 0.01,
+    "broken_bracket": 0.02,
+}
+
+_WORD_NOISE = ["delete", "substitute", "insert", "repeat", "drop_tag", "unbalanced_tag", "broken_bracket"]
+_EML_WORD = re.compile(r"^((?:<[^/>]*>)*)(.*?)((?:</[^>]*>)*)$")
+_EML_TAGS = re.compile(r"</?e\d+>")
+
+
+def _word_noise(rng, noise):
+    p = rng.random()
+    for kind in _WORD_NOISE:
+        p -= noise[kind]
+        if p < 0:
+            return kind
+    return None
+
+
+def add_noise(document, rng, format="txt", noise=DEFAULT_NOISE):
+    """
+    Damages one document (a line of the text or EML format) like an LLM would:
+    words are substituted, deleted, inserted or repeated in loops, tags are dropped or
+    left unbalanced, EML brackets are broken and the document may be truncated.
+    """
+    words = document.split(" ")
+    out = []
+    for i, word in enumerate(words):
+        kind = _word_noise(rng, noise)
+        if kind == "delete":
+            continue
+        if kind == "substitute":
+            if format == "txt":
+                form, bar, tags = word.partition("|")
+                word = "xyzzy" + bar + tags
+            else:
+                word = _EML_WORD.sub(lambda m: m[1] + "xyzzy" + m[3], word)
+        elif kind == "insert":
+            out.append("xyzzy")
+        elif kind == "repeat":
+            # the model loops over the last few words
+            loop = words[max(0, i - rng.randint(2, 8)):i]
+            for _ in range(rng.randint(1, 4)):
+                out.extend(loop)
+        elif kind == "drop_tag":
+            word = word.partition("|")[0] if format == "txt" else _EML_TAGS.sub("", word)
+        elif kind == "unbalanced_tag":
+            eid = f"e{rng.randint(1, 50)}"
+            if format == "txt":
+                word += f",{eid}]" if "|" in word else f"|[{eid}"
+            else:
+                word = f"<{eid}>{word}" if rng.random() < 0.5 else f"{word}</{eid}>"
+        elif kind == "broken_bracket" and format == "eml" and "<" in word:
+            word = rng.choice([word.replace("<", "", 1), word.replace(">", "", 1), word.replace("</", "/", 1),
+                               word.replace("</", "< /", 1)])
+        out.append(word)
+    if rng.random() < noise["truncate"]:
+        out = out[:rng.randint(0, len(out))]
+    return " ".join(out)
+
+
+def add_noise_to_file(filename, output_filename, format="txt", seed=0, noise=DEFAULT_NOISE):
+    rng = random.Random(seed)
+    with open(filename, encoding="utf-8") as f, open(output_filename, "w", encoding="utf-8") as out:
+        for line in f:
+            out.write(add_noise(line.rstrip("\n"), rng, format, noise) + "\n")
@@ -1,13 +1,81 @@
 import logging
 
 from .convert import convert_text_file_to_conllu, convert_conllu_file_to_text
-from .output_cleaner import clean_file
+from .batch import (clean_files, convert_eml_files_to_conllu, convert_json_files_to_conllu,
+                    convert_text_files_to_conllu, expand_filenames)
+from .cache import CACHE_DIR
+from .output_cleaner import clean_file, MAX_DP_CELLS
+
+
+def add_cache_arguments(parser, streamed=None):
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        help="Directory caching the parsed gold/skeleton files between runs (no caching by default)."
+             + (f" Not used when the skeleton is streamed: {streamed}." if streamed else ""),
+    )
+    parser.add_argument(
+        "--cache",
+        dest="cache_dir",
+        action="store_const",
+        const=CACHE_DIR,
+        help=f"Cache the parsed gold/skeleton files in {CACHE_DIR}.",
+    )
+    parser.add_argument(
+        "--no_cache",
+        dest="cache_dir",
+        action="store_const",
+        const=None,
+        help="Do not cache the parsed gold/skeleton file (the default).",
+    )
+
+
+def add_report_argument(parser):
+    parser.add_argument(
+        "--report",
+        default=None,
+        help="Write the metrics (stage times, edit operations, repaired tags, mismatched words per document) "
+             "into this JSON file.",
+    )
+
+
+def add_output_dir_argument(parser):
+    parser.add_argument(
+        "-O",
+        "--output_dir",
+        default=None,
+        help="Output directory for a batch of input files, the outputs are named after the inputs.",
+    )
+
+
+def batch_mode(args, filename_arg):
+    """
+    Expands the input files (or glob patterns) and tells whether the action runs in the batch
+    mode (more input files or an output directory), passing the list of files as "<arg>s".
+    """
+    filenames = expand_filenames(getattr(args, filename_arg))
+    if len(filenames) == 1 and args.output_dir is None:
+        setattr(args, filename_arg, filenames[0])
+        del args.output_dir
+        return False
+    if args.output_filename:
+        raise SystemExit("-o/--output_filename cannot be used with more input files, use -O/--output_dir")
+    del args.output_filename
+    delattr(args, filename_arg)
+    setattr(args, filename_arg + "s", filenames)
+    return True
 
 
 def parse_args():
     from argparse import ArgumentParser
     main_parser = ArgumentParser(prog="text2text_coref",
                                  description="Coreference resolution plaintext convertor",)
+    main_parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Log the details of every document, sentence and word (debug level).",
+    )
     subparsers = main_parser.add_subparsers(required=True, dest='action')
     parser = subparsers.add_parser(
         "clean",
@@ -16,9 +84,10 @@ def parse_args():
     )
 
     # parser.add_argument("command", type=Command, choices=list(Command))
-    parser.add_argument("filename")
+    parser.add_argument("filename", nargs="+", help="Input file(s) or glob pattern(s).")
     parser.add_argument("gold_filename")
     parser.add_argument("-o", "--output_filename", default=None)
+    add_output_dir_argument(parser)
     parser.add_argument(
         "-z",
         "--zero_mentions",
@@ -32,6 +101,32 @@ def parse_args():
         default="txt",
         help="Format of the input and output documents. 'txt' for plain text with inline annotations, 'eml' for EML format.",
     )
+    parser.add_argument(
+        "-a",
+        "--aligner",
+        choices=["banded", "numpy", "anchored", "linear", "sentence", "full"],
+        default="banded",
+        help="Word alignment engine. 'banded' is exact and fast for outputs close to the gold text, 'numpy' is the "
+             "exact full dp vectorized with NumPy, 'anchored' aligns only between words unique in both texts "
+             "(fast for long, badly diverging outputs, not always optimal), 'linear' is exact in linear memory, "
+             "'sentence' aligns sentence by sentence against the gold sentences, 'full' is the reference dp.",
+    )
+    parser.add_argument(
+        "--max_cells",
+        type=int,
+        default=MAX_DP_CELLS,
+        help="Documents whose alignment table would have more cells are aligned in linear memory.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of worker processes cleaning the documents in parallel (0 for all cores).",
+    )
+    add_cache_arguments(parser)
+    add_report_argument(parser)
 
     conllu2text_parser = subparsers.add_parser(
         "conllu2text",
@@ -68,6 +163,14 @@ def parse_args():
         action="store_true",
         help="Do not include empty node forms in the output text.",
     )
+    conllu2text_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of worker processes converting the documents in parallel (0 for all cores).",
+    )
 
     text2conllu_parser = subparsers.add_parser(
         "text2conllu",
@@ -75,15 +178,24 @@ def parse_args():
         help="converts text with coreference annotations into standard CoNLLu format"
     )
 
-    text2conllu_parser.add_argument("filename")
+    text2conllu_parser.add_argument("filename", nargs="+", help="Input file(s) or glob pattern(s).")
     text2conllu_parser.add_argument("skeleton_filename")
     text2conllu_parser.add_argument("-o", "--output_filename", default=None)
+    add_output_dir_argument(text2conllu_parser)
     text2conllu_parser.add_argument(
         "-z",
         "--zero_mentions",
         action="store_true",
         help="Map zero mentions in the output to the gold empty nodes in CoNLLu.",
     )
+    text2conllu_parser.add_argument(
+        "--no_streaming",
+        dest="streaming",
+        action="store_false",
+        help="Read the whole skeleton into udapi (reusing the cache) instead of converting it document by document.",
+    )
+    add_cache_arguments(text2conllu_parser, "without --no_streaming, for a single input file or with -z")
+    add_report_argument(text2conllu_parser)
 
     conllu2json_parser = subparsers.add_parser(
         "conllu2json",
@@ -119,21 +231,46 @@ def parse_args():
         action="store_true",
         help="Do not include empty node forms in the output text.",
     )
+    conllu2json_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of worker processes converting the documents in parallel (0 for all cores).",
+    )
+    conllu2json_parser.add_argument(
+        "-l",
+        "--jsonl",
+        action="store_true",
+        default=None,
+        help="Write JSON Lines (one document per line) incrementally (default for a .jsonl output file).",
+    )
 
     json2conllu_parser = subparsers.add_parser(
         "json2conllu",
         prog="json2conllu_convertor",
         help="converts clustered json format into conllu with coference annotations"
     )
-    json2conllu_parser.add_argument("json_filename")
+    json2conllu_parser.add_argument("json_filename", nargs="+", help="Input file(s) or glob pattern(s).")
     json2conllu_parser.add_argument("conllu_skeleton_filename")
     json2conllu_parser.add_argument("-o", "--output_filename", default=None)
+    add_output_dir_argument(json2conllu_parser)
     json2conllu_parser.add_argument(
         "-g",
         "--use_gold_empty_nodes",
         action="store_true",
         help="Use gold empty nodes from the skeleton CoNLLu file.",
     )
+    json2conllu_parser.add_argument(
+        "-l",
+        "--jsonl",
+        action="store_true",
+        default=None,
+        help="Read JSON Lines (one document per line) matched with the skeleton by doc_id (default for .jsonl files).",
+    )
+    add_cache_arguments(json2conllu_parser, "for a single JSON Lines input file")
+    add_report_argument(json2conllu_parser)
 
     conllu2eml_parser = subparsers.add_parser(
         "conllu2eml",
@@ -166,31 +303,106 @@ def parse_args():
         action="store_true",
         help="Do not include empty node forms in the output eml.",
     )
+    conllu2eml_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of worker processes converting the documents in parallel (0 for all cores).",
+    )
     eml2conllu_parser = subparsers.add_parser(
         "eml2conllu",
         prog="eml2conllu_convertor",
         help="converts eml format with coference annotations into conllu format"
     )
-    eml2conllu_parser.add_argument("filename")
+    eml2conllu_parser.add_argument("filename", nargs="+", help="Input file(s) or glob pattern(s).")
     eml2conllu_parser.add_argument("skeleton_filename")
     eml2conllu_parser.add_argument("-o", "--output_filename", default=None)
+    add_output_dir_argument(eml2conllu_parser)
+    eml2conllu_parser.add_argument(
+        "--no_streaming",
+        dest="streaming",
+        action="store_false",
+        help="Read the whole skeleton into udapi (reusing the cache) instead of converting it document by document.",
+    )
+    add_cache_arguments(eml2conllu_parser, "without --no_streaming, for a single input file")
+    add_report_argument(eml2conllu_parser)
+
+    index_parser = subparsers.add_parser(
+        "index",
+        prog="document_index",
+        help="builds the byte-offset index of the documents of CoNLL-U files or of the lines of prediction files",
+    )
+    index_parser.add_argument("filename", nargs="+", help="Input file(s) or glob pattern(s).")
+    index_parser.add_argument(
+        "--format",
+        choices=["auto", "conllu", "lines"],
+        default="auto",
+        help="Index the newdoc documents ('conllu') or the lines ('lines'), 'auto' by the .conllu extension.",
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        prog="text2text_coref_service",
+        help="serves clean, text2conllu and conllu2text of single documents over a local HTTP API, "
+             "keeping the gold/skeleton files loaded"
+    )
+    serve_parser.add_argument(
+        "skeletons",
+        nargs="+",
+        help="Gold/skeleton CoNLL-U files as NAME=FILE or FILE (named by the file name without the extension).",
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("-p", "--port", type=int, default=8000)
+    serve_parser.add_argument(
+        "--socket",
+        default=None,
+        help="Serve on this Unix socket instead of the TCP port.",
+    )
+    serve_parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of worker processes cleaning the documents (0 for all cores), the requests are handled in "
+             "threads.",
+    )
+    serve_parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Load the representations of the skeletons on their first use instead of before serving.",
+    )
+    add_cache_arguments(serve_parser)
 
     return main_parser.parse_args()
 
 
 def main():
     args = parse_args()
+    # the problems of the documents are summarized by the stats, the details are logged only when asked for
+    level = logging.DEBUG if args.verbose else logging.INFO
+    del args.verbose
     logging.basicConfig(
-        level=logging.DEBUG,
+        level=level,
         format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
         datefmt="%m/%d/%Y %H:%M:%S",
     )
+    # the modules configure the root logger on import already
+    logging.getLogger().setLevel(level)
     if args.action == "clean":
         del args.action
-        clean_file(**vars(args))
+        if batch_mode(args, "filename"):
+            clean_files(**vars(args))
+        else:
+            clean_file(**vars(args))
     elif args.action == "text2conllu":
         del args.action
-        convert_text_file_to_conllu(**vars(args))
+        if batch_mode(args, "filename"):
+            convert_text_files_to_conllu(**vars(args))
+        else:
+            convert_text_file_to_conllu(**vars(args))
     elif args.action == "conllu2text":
         del args.action
         convert_conllu_file_to_text(**vars(args))
@@ -201,7 +413,10 @@ def main():
     elif args.action == "json2conllu":
         from .json_format import convert_json_to_conllu
         del args.action
-        convert_json_to_conllu(**vars(args))
+        if batch_mode(args, "json_filename"):
+            convert_json_files_to_conllu(**vars(args))
+        else:
+            convert_json_to_conllu(**vars(args))
     elif args.action == "conllu2eml":
         from .eml_format import convert_conllu_file_to_eml
         del args.action
@@ -209,8 +424,19 @@ def main():
     elif args.action == "eml2conllu":
         from .eml_format import convert_eml_file_to_conllu
         del args.action
-        convert_eml_file_to_conllu(**vars(args))
-
+        if batch_mode(args, "filename"):
+            convert_eml_files_to_conllu(**vars(args))
+        else:
+            convert_eml_file_to_conllu(**vars(args))
+    elif args.action == "index":
+        from .doc_index import build_index
+        conllu = {"auto": None, "conllu": True, "lines": False}[args.format]
+        for filename in expand_filenames(args.filename):
+            build_index(filename, conllu)
+    elif args.action == "serve":
+        from .serve import serve
+        del args.action
+        serve(**vars(args))
 
 
 if __name__ == "__main__":
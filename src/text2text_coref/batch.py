@@ -0,0 +1,127 @@
+"""
+Batch mode: many prediction files (e.g. of different checkpoints or sampling settings)
+processed against one gold/skeleton file in one process. The gold or skeleton file is
+read and prepared only once and shared (or copied) for each prediction file.
+"""
+import glob
+import logging
+import os
+
+from .convert import Skeleton, convert_text_file_to_conllu, log_unused_cache
+from .output_cleaner import MAX_DP_CELLS, clean_file, read_conllu
+from .stats import Stats
+
+logger = logging.getLogger()
+
+
+def expand_filenames(patterns):
+    """
+    Expands glob patterns (e.g. quoted on the command line) into sorted file names,
+    keeping the order of the patterns. Names without wildcards are kept as they are.
+    """
+    filenames = []
+    for pattern in patterns:
+        if not any(c in pattern for c in "*?["):
+            filenames.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise FileNotFoundError(f"No file matches {pattern}")
+        filenames.extend(matches)
+    return filenames
+
+
+def output_filenames(filenames, output_dir, suffix):
+    """
+    Names of the output files: the input file names with the extension replaced by the
+    suffix ("{ext}" standing for the original extension), in output_dir or next to the
+    inputs.
+    """
+    outputs = []
+    for filename in filenames:
+        root, ext = os.path.splitext(filename)
+        output = root + suffix.format(ext=ext)
+        if output_dir is not None:
+            output = os.path.join(output_dir, os.path.basename(output))
+        outputs.append(output)
+    clashes = {output for output in outputs if outputs.count(output) > 1} | set(outputs) & set(filenames)
+    if clashes:
+        raise ValueError(f"Output files would overwrite each other or the inputs: {', '.join(sorted(clashes))}")
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    return outputs
+
+
+def clean_files(
+    filenames, gold_filename, output_dir=None, zero_mentions=True, format="txt", aligner="banded",
+    max_cells=MAX_DP_CELLS, workers=1, cache_dir=None, report=None
+):
+    """
+    Cleans each input file against the gold file, which is read once. Returns the
+    stats of all the files (see Stats).
+    """
+    outputs = output_filenames(filenames, output_dir, "-cleaned{ext}")
+    logger.info(f"Reading gold file: {gold_filename}")
+    gold = read_conllu(gold_filename, zero_mentions, cache_dir)
+    stats = Stats(keep_documents=bool(report))
+    for filename, output_filename in zip(filenames, outputs):
+        clean_file(filename, gold_filename, output_filename, zero_mentions, format, aligner, max_cells, workers,
+                   cache_dir, gold=gold, stats=stats)
+    if report:
+        stats.write_json(report)
+    return stats
+
+
+def convert_text_files_to_conllu(filenames, skeleton_filename, output_dir=None, zero_mentions=False, cache_dir=None,
+                                 streaming=True, report=None):
+    """Converts each text file into CoNLL-U, preparing the skeleton once."""
+    outputs = output_filenames(filenames, output_dir, ".conllu")
+    logger.info(f"Preparing skeleton file: {skeleton_filename}")
+    if zero_mentions and streaming:
+        from .conllu_stream import StreamSkeleton
+        log_unused_cache(cache_dir)
+        cache_dir = None
+        skeleton = StreamSkeleton(skeleton_filename)
+    else:
+        skeleton = Skeleton(skeleton_filename, zero_mentions, cache_dir)
+    stats = Stats(keep_documents=bool(report))
+    for filename, output_filename in zip(filenames, outputs):
+        logger.info(f"Converting {filename} into {output_filename}")
+        convert_text_file_to_conllu(filename, skeleton, output_filename, zero_mentions, cache_dir, streaming, stats)
+    if report:
+        stats.write_json(report)
+    return stats
+
+
+def convert_json_files_to_conllu(json_filenames, conllu_skeleton_filename, output_dir=None,
+                                 use_gold_empty_nodes=True, cache_dir=None, jsonl=None, report=None):
+    """Converts each JSON (or JSON Lines) file into CoNLL-U, preparing the skeleton once."""
+    from .json_format import convert_json_to_conllu
+    outputs = output_filenames(json_filenames, output_dir, ".conllu")
+    logger.info(f"Preparing skeleton file: {conllu_skeleton_filename}")
+    skeleton = Skeleton(conllu_skeleton_filename, use_gold_empty_nodes, cache_dir)
+    stats = Stats(keep_documents=bool(report))
+    for filename, output_filename in zip(json_filenames, outputs):
+        logger.info(f"Converting {filename} into {output_filename}")
+        convert_json_to_conllu(filename, skeleton, output_filename, use_gold_empty_nodes, cache_dir, stats,
+                               jsonl=jsonl)
+    if report:
+        stats.write_json(report)
+    return stats
+
+
+def convert_eml_files_to_conllu(filenames, skeleton_filename, output_dir=None, zero_mentions=False, cache_dir=None,
+                                streaming=True, report=None):
+    """Converts each EML file into CoNLL-U, preparing the skeleton once."""
+    from .eml_format import convert_eml_file_to_conllu
+    outputs = output_filenames(filenames, output_dir, ".conllu")
+    logger.info(f"Preparing skeleton file: {skeleton_filename}")
+    skeleton = Skeleton(skeleton_filename, zero_mentions, cache_dir)
+    stats = Stats(keep_documents=bool(report))
+    for filename, output_filename in zip(filenames, outputs):
+        logger.info(f"Converting {filename} into {output_filename}")
+        convert_eml_file_to_conllu(filename, skeleton, output_filename, zero_mentions, cache_dir, stats,
+                                   streaming=streaming)
+    if report:
+        stats.write_json(report)
+    return stats
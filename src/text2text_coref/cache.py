@@ -0,0 +1,68 @@
+import hashlib
+import logging
+import os
+import pickle
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+
+# the default directory of the cache of parsed input files
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "text2text_coref"
+)
+# the version of the structures stored in the cache, increased whenever they change
+CACHE_FORMAT = 1
+
+
+def _cache_path(filename, key, cache_dir):
+    key = f"{os.path.abspath(filename)}\0{key}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pickle")
+
+
+@lru_cache(maxsize=None)
+def _versions():
+    # the cached skeletons are pickled udapi documents
+    try:
+        udapi_version = version("udapi")
+    except PackageNotFoundError:
+        udapi_version = None
+    return CACHE_FORMAT, udapi_version
+
+
+def _file_stamp(filename):
+    stat = os.stat(filename)
+    return (stat.st_size, stat.st_mtime_ns) + _versions()
+
+
+def load_cached(filename, key, cache_dir):
+    """
+    Loads the value cached for the file under the key, or returns None when
+    there is no cache or the file changed since it was written (different size
+    or mtime) or the cache was written by a different CACHE_FORMAT or udapi
+    version.
+    """
+    path = _cache_path(filename, key, cache_dir)
+    try:
+        with open(path, "rb") as f:
+            stamp, value = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as ex:
+        logging.debug(f"{ex} while loading the cache {path}")
+        return None
+    if stamp != _file_stamp(filename):
+        return None
+    return value
+
+
+def store_cached(filename, key, cache_dir, value):
+    """
+    Caches a value parsed from the file under the key.
+    """
+    stamp = _file_stamp(filename)
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(filename, key, cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump((stamp, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return value
@@ -0,0 +1,696 @@
+"""
+Streaming conversion of text with coreference annotations into CoNLL-U for skeletons with
+gold empty nodes. Instead of building udapi documents, the skeleton is read line by line
+and only the coreference attributes in the MISC column are rewritten. The output is the
+same as of the udapi path (convert_text_to_conllu with streaming=False), including the
+normalizations done by the udapi reader and writer. Documents the line-level writer
+cannot reproduce exactly (e.g. empty nodes udapi would move, non-canonical enhanced
+dependencies or JSON comments) are converted through udapi, and so are all the documents
+with a udapi version other than UDAPI_VERSION, whose output was not checked.
+"""
+import io
+import logging
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+from itertools import chain
+
+from udapi.block.read.conllu import Conllu as ConlluReader
+from udapi.core.coref import CHARS_FORBIDDEN_IN_ID
+
+from .convert import (check_text_words, import_text_document, normalize_data, prepare_skeleton, read_text_mentions,
+                      write_data)
+
+logger = logging.getLogger()
+
+# the udapi version whose reader and writer the line-level writer reproduces
+UDAPI_VERSION = "0.5.2"
+
+# comments recognized by the udapi CoNLL-U reader
+_SENT_ID = re.compile(r"^# sent_id\s*=?\s*(\S+)")
+_TEXT = re.compile(r"^# text\s*=\s*(.*)")
+_NEWPARDOC = re.compile(r"^# (newpar|newdoc)(?:\s+id\s*=\s*(.+))?$")
+_JSON = re.compile(r"^# (doc_)?json_([^ =]+)\s*=\s*(.+)")
+_GLOBAL_ENTITY = re.compile(r"^# global.Entity\s*=\s*(\S+)")
+
+_DEFAULT_GLOBAL_ENTITY = "eid-etype-head-other"
+_COREF_MISC = ("Entity", "SplitAnte", "Bridge")
+# size of the chunks written to the output file (in characters)
+_WRITE_BUFFER = 1 << 20
+# the size of the skeleton chunks converted by a worker at once (in bytes)
+_EXPORT_CHUNK = 1 << 20
+
+
+class _Unsupported(Exception):
+    """The document cannot be patched line by line and is converted through udapi."""
+
+
+@lru_cache(maxsize=None)
+def _udapi_supported():
+    """Whether the installed udapi is UDAPI_VERSION, warning (once) if not."""
+    try:
+        installed = version("udapi")
+    except PackageNotFoundError:
+        installed = None
+    if installed != UDAPI_VERSION:
+        logger.warning(f"udapi {installed} is installed instead of {UDAPI_VERSION}, the documents are converted "
+                       f"through udapi instead of streaming")
+    return installed == UDAPI_VERSION
+
+
+class _Node:
+    """A word (or the technical root) of a skeleton sentence."""
+    __slots__ = ("ord", "parent", "is_empty", "form", "head", "raw_deps", "prefix", "misc", "in_mwt", "sentence",
+                 "_eparents")
+
+    def __init__(self, ord, is_empty=False, fields=None, line=None, sentence=None):
+        self.ord = ord
+        self.parent = None
+        self.is_empty = is_empty
+        self.in_mwt = False
+        self.sentence = sentence
+        self._eparents = None
+        if fields is not None:
+            self.form = fields[1]
+            self.head = fields[6]
+            self.raw_deps = fields[8]
+            self.misc = fields[9]
+            self.prefix = line[:len(line) - len(fields[9])]
+
+    def deps(self):
+        """Parents of the node in the enhanced dependencies."""
+        if self._eparents is None:
+            self._eparents = []
+            if self.raw_deps != "_":
+                sentence = self.sentence
+                for dep in self.raw_deps.split("|"):
+                    head = dep.split(":", 1)[0]
+                    self._eparents.append(sentence.empty_nodes[head] if "." in head else sentence.nodes[int(head)])
+        return self._eparents
+
+
+class _Sentence:
+    """A skeleton sentence: its comments (as stored by the udapi reader) and its lines."""
+    __slots__ = ("comments", "sent_id", "text", "newdoc", "newpar", "global_entity", "items", "nodes", "empty_nodes")
+
+    def __init__(self):
+        self.comments = []
+        self.sent_id = None
+        self.text = None
+        self.newdoc = None
+        self.newpar = None
+        self.global_entity = None
+        # the output lines: MWT lines (str) and words (_Node)
+        self.items = []
+        self.nodes = [_Node(0)]
+        self.empty_nodes = {}
+
+
+def _parse_misc(misc):
+    mapping = {}
+    if misc != "_":
+        for item in misc.split("|"):
+            name, eq, value = item.partition("=")
+            mapping[name] = value if eq else True
+    return mapping
+
+
+def _format_misc(mapping):
+    if not mapping:
+        return "_"
+    return "|".join(name if value is True else f"{name}={value}"
+                    for name, value in sorted(mapping.items(), key=lambda item: item[0].lower()))
+
+
+def _canonical_deps(raw_deps):
+    """The enhanced dependencies as serialized by udapi after they were parsed."""
+    deps = set()
+    for dep in raw_deps.split("|"):
+        head, colon, deprel = dep.partition(":")
+        try:
+            deps.add((float(head) if "." in head else int(head), deprel))
+        except ValueError:
+            colon = ""
+        if not colon:
+            raise _Unsupported(f"wrong DEPS {raw_deps}")
+    return "|".join(f"{head}:{deprel}" for head, deprel in sorted(deps))
+
+
+def _parse_comment(sentence, line):
+    match = _SENT_ID.match(line)
+    if match:
+        sentence.sent_id = match.group(1)
+        sentence.comments.append("$SENT_ID")
+        return
+    match = _TEXT.match(line)
+    if match:
+        sentence.text = match.group(1)
+        sentence.comments.append("$TEXT")
+        return
+    match = _NEWPARDOC.match(line)
+    if match:
+        value = True if match.group(2) is None else match.group(2)
+        if match.group(1) == "newpar":
+            sentence.newpar = value
+            sentence.comments.append("$NEWPAR")
+        else:
+            sentence.newdoc = value
+            sentence.comments.append("$NEWDOC")
+        return
+    if _JSON.match(line):
+        raise _Unsupported("JSON comment")
+    match = _GLOBAL_ENTITY.match(line)
+    if match:
+        sentence.global_entity = match.group(1)
+        sentence.comments.append("$GLOBAL.ENTITY")
+        return
+    if len(line[1:].splitlines()) > 1:
+        raise _Unsupported("multi-line comment")
+    sentence.comments.append(line[1:])
+
+
+def _parse_sentence(lines):
+    """
+    Parses the lines of a skeleton sentence, checking that udapi would write its words back
+    unchanged except for the MISC column.
+    """
+    sentence = _Sentence()
+    nodes = sentence.nodes
+    mwts = []
+    last_ord = 0.0
+    for line in lines:
+        if line[0] == "#":
+            _parse_comment(sentence, line)
+            continue
+        fields = line.split("\t")
+        if len(fields) != 10:
+            raise _Unsupported(f"wrong number of columns in {line!r}")
+        if "-" in fields[0]:
+            if any(fields[i] != "_" for i in (2, 3, 4, 6, 7, 8)):
+                raise _Unsupported(f"annotated MWT {line!r}")
+            mwts.append((len(sentence.items), fields))
+            sentence.items.append(None)
+        elif "." in fields[0]:
+            # gold empty nodes must be already placed after their parents, so that
+            # prepare_skeleton keeps them as they are
+            deps = fields[8].split(":", 1)
+            if (fields[6] != "_" or fields[7] != "_" or len(deps) != 2 or "|" in fields[8]
+                    or not fields[0].replace(".", "", 1).isdigit() or str(float(fields[0])) != fields[0] or float(fields[0]) <= last_ord
+                    or not deps[0].isdigit() or str(int(deps[0])) != deps[0]
+                    or int(float(fields[0])) != int(deps[0]) or int(deps[0]) != len(nodes) - 1):
+                raise _Unsupported(f"empty node {line!r}")
+            last_ord = float(fields[0])
+            node = _Node(last_ord, True, fields, line, sentence)
+            sentence.empty_nodes[fields[0]] = node
+            sentence.items.append(node)
+        else:
+            if (fields[0] != str(len(nodes)) or not fields[6].isdigit() or str(int(fields[6])) != fields[6]
+                    or (fields[8] != "_" and _canonical_deps(fields[8]) != fields[8])):
+                raise _Unsupported(f"word {line!r}")
+            last_ord = float(len(nodes))
+            node = _Node(len(nodes), False, fields, line, sentence)
+            nodes.append(node)
+            sentence.items.append(node)
+    if len(nodes) == 1 or (len(nodes) == 2 and nodes[1].misc == "Empty=Yes"):
+        raise _Unsupported("empty sentence")
+    if sentence.sent_id is None or "/" in sentence.sent_id or sentence.text is None:
+        raise _Unsupported("sentence without sent_id or text")
+
+    for node in nodes[1:]:
+        head = int(node.head)
+        if head >= len(nodes) or head == node.ord:
+            raise _Unsupported(f"wrong HEAD of word {node.ord}")
+        node.parent = nodes[head]
+    for node in chain(nodes[1:], sentence.empty_nodes.values()):
+        if node.raw_deps != "_":
+            for dep in node.raw_deps.split("|"):
+                head = dep.split(":", 1)[0]
+                if head not in sentence.empty_nodes and not (head.isdigit() and int(head) < len(nodes)):
+                    raise _Unsupported(f"wrong DEPS of node {node.ord}")
+
+    # multi-word tokens: udapi moves SpaceAfter=No from their last word to them
+    for i, fields in mwts:
+        start, end = fields[0].split("-")
+        if not (start.isdigit() and end.isdigit() and str(int(start)) == start and str(int(end)) == end):
+            raise _Unsupported(f"MWT {fields[0]}")
+        start, end = int(start), int(end)
+        words = nodes[start:end + 1]
+        if (not 1 <= start <= end < len(nodes) or any(word.in_mwt for word in words)
+                or i + 1 >= len(sentence.items) or sentence.items[i + 1] is not nodes[start]):
+            raise _Unsupported(f"MWT {fields[0]}")
+        misc = fields[9]
+        if _parse_misc(words[-1].misc).get("SpaceAfter") == "No":
+            mapping = _parse_misc(misc)
+            mapping["SpaceAfter"] = "No"
+            misc = _format_misc(mapping)
+        for word in words:
+            word.in_mwt = True
+        sentence.items[i] = f"{fields[0]}\t{fields[1]}\t_\t_\t_\t{fields[5]}\t_\t_\t_\t{misc}"
+    return sentence
+
+
+def _comment_lines(sentence, global_entity):
+    """The comments of the sentence as written by the udapi CoNLL-U writer."""
+    lines = list(sentence.comments)
+    i_newdoc, i_newpar, i_sent_id, i_global_entity = -1, -1, -1, -1
+    for i, line in enumerate(lines):
+        if line == "$SENT_ID":
+            i_sent_id = i
+            lines[i] = " sent_id = " + sentence.sent_id
+        elif line == "$TEXT":
+            lines[i] = " text = " + sentence.text.replace("\n", "").replace("\r", "").rstrip()
+        elif line == "$NEWDOC":
+            i_newdoc = i
+            lines[i] = (" newdoc" + (" id = " + sentence.newdoc if sentence.newdoc is not True else "")
+                        if sentence.newdoc else None)
+        elif line == "$NEWPAR":
+            i_newpar = i
+            lines[i] = (" newpar" + (" id = " + sentence.newpar if sentence.newpar is not True else "")
+                        if sentence.newpar else None)
+        elif line == "$GLOBAL.ENTITY":
+            i_global_entity = i
+            lines[i] = " global.Entity = " + global_entity if global_entity else None
+
+    out = []
+    printed = -1
+
+    def print_until(i):
+        nonlocal printed
+        while printed < i:
+            printed += 1
+            if lines[printed]:
+                out.append("#" + lines[printed])
+
+    if lines and lines[0].startswith(" global.columns"):
+        print_until(0)
+    if sentence.newdoc:
+        if i_newdoc == -1:
+            out.append("# newdoc" + (" id = " + sentence.newdoc if sentence.newdoc is not True else ""))
+        else:
+            print_until(i_newdoc)
+        if global_entity:
+            if i_global_entity == -1:
+                out.append("# global.Entity = " + global_entity)
+            else:
+                print_until(i_global_entity)
+    if sentence.newpar:
+        if i_newpar == -1:
+            out.append("# newpar" + (" id = " + sentence.newpar if sentence.newpar is not True else ""))
+        else:
+            print_until(i_newpar)
+    print_until(i_sent_id)
+    print_until(len(lines) - 1)
+    return out
+
+
+def _minimal_common_treelet(nodes):
+    """The root of the smallest treelet containing the nodes (udapi's find_minimal_common_treelet)."""
+    nodes = list(nodes)
+    in_treelet = {node.ord: 1 for node in nodes}
+    new_nodes = {}
+    highest = None
+    while len(nodes) > 1:
+        node = nodes.pop(0)
+        parent = node.parent
+        if parent is None:
+            highest = node
+        elif in_treelet.get(parent.ord, False):
+            in_treelet[parent.ord] = 1
+        else:
+            new_nodes[parent.ord] = parent
+            in_treelet[parent.ord] = node
+            nodes.append(parent)
+    highest = highest or nodes[0]
+    child = in_treelet[highest.ord]
+    while child != 1:
+        del new_nodes[highest.ord]
+        highest = child
+        child = in_treelet[highest.ord]
+    return highest
+
+
+def _eparents(node):
+    if node.raw_deps != "_":
+        return node.deps()
+    if node.parent:
+        return [node.parent]
+    return []
+
+
+def _find_head(words, docname):
+    """The head of a new mention as chosen by corefud.MoveHead."""
+    mwords = set(words)
+    basic_heads = [w for w in words if not w.parent or w.parent not in mwords]
+    if len(basic_heads) == 1:
+        return basic_heads[0]
+    enh_heads = [w for w in basic_heads if not any(p in mwords for p in _eparents(w))]
+    if not enh_heads:
+        enh_heads = [w for w in basic_heads if not all(p in mwords for p in _eparents(w))]
+        if not enh_heads:
+            return words[0]
+    if len(enh_heads) == 1:
+        return enh_heads[0]
+
+    empty_nodes, non_empty = [], []
+    for w in enh_heads:
+        (empty_nodes if w.is_empty else non_empty).append(w)
+    if empty_nodes:
+        for empty_node in empty_nodes:
+            parents = [p for p in empty_node.deps() if not p.is_empty]
+            if parents:
+                if parents[0] not in non_empty:
+                    non_empty.append(parents[0])
+            else:
+                logger.warning(f"could not find non-empty parent of empty node {empty_node.ord} for mention in {docname}")
+        non_empty.sort(key=lambda node: node.ord)
+    highest = _minimal_common_treelet(non_empty)
+    if highest in enh_heads:
+        return highest
+    if highest in mwords:
+        logger.warning(f"Strange mention with highest node {highest.ord} in {docname}")
+    if words[0] in enh_heads:
+        return words[0]
+    return enh_heads[0]
+
+
+def _entity_values(mentions, words, global_entity, docname):
+    """
+    The Entity values of the words (by their index in the document) as stored by
+    udapi.core.coref.store_coref_to_misc.
+    """
+    fields = global_entity.split("-")
+    entity = {}
+    for eid, start, end in sorted(mentions, key=lambda mention: (mention[1], mention[1] - mention[2], mention[0])):
+        values = []
+        for field in fields:
+            if field == "eid":
+                values.append(eid)
+            elif field == "GRP":
+                values.append(re.sub(r"^d\d+\.", "", eid))
+            elif field == "head":
+                mention_words = words[start:end + 1]
+                values.append(str(mention_words.index(_find_head(mention_words, docname)) + 1))
+            else:
+                values.append("")
+        while values and values[-1] == "":
+            del values[-1]
+        mention_str = "(" + "-".join(values)
+
+        if start == end:
+            orig_entity = entity.get(start, "")
+            if not orig_entity or orig_entity[-1] != ")":
+                entity[start] = orig_entity + mention_str + ")"
+            elif "(" not in orig_entity:
+                entity[start] = mention_str + ")" + orig_entity
+            elif any(c and c[0] == "(" and c[-1] != ")" for c in re.split(r"(\([^()]+\)?|[^()]+\))", orig_entity)):
+                entity[start] = orig_entity + mention_str + ")"
+            else:
+                entity[start] = mention_str + ")" + orig_entity
+        else:
+            entity[start] = entity.get(start, "") + mention_str
+            entity[end] = eid + ")" + entity.get(end, "")
+    return entity
+
+
+def _read_documents(f):
+    """Yields the skeleton documents as lists of sentences (lists of lines)."""
+    document, sentence = [], []
+    for line in f:
+        line = line.rstrip("\n")
+        if line:
+            sentence.append(line)
+            continue
+        if sentence:
+            if document and _starts_document(sentence):
+                yield document
+                document = []
+            document.append(sentence)
+            sentence = []
+    if sentence:
+        if document and _starts_document(sentence):
+            yield document
+            document = []
+        document.append(sentence)
+    if document:
+        yield document
+
+
+def _starts_document(lines):
+    for line in lines:
+        if line[0] != "#":
+            return False
+        match = _NEWPARDOC.match(line)
+        if match and match.group(1) == "newdoc":
+            return True
+    return False
+
+
+def _parse_document(lines):
+    """Parses the sentences of a skeleton document, or raises _Unsupported."""
+    sentences = [_parse_sentence(sentence) for sentence in lines]
+    if not sentences[0].newdoc:
+        raise _Unsupported("document without newdoc")
+    if any(a.sent_id == b.sent_id for a, b in zip(sentences, sentences[1:])):
+        raise _Unsupported("repeated sent_id")
+    return sentences
+
+
+def _skeleton_documents(f):
+    """
+    Yields the skeleton documents as (lines, sentences, global.Entity header), the sentences
+    being the _Unsupported exception for documents converted through udapi.
+    """
+    for lines in _read_documents(f):
+        try:
+            sentences = _parse_document(lines)
+        except _Unsupported as ex:
+            sentences = ex
+        yield lines, sentences, _global_entity(lines)
+
+
+def _global_entity(lines):
+    """Returns the global.Entity header of a skeleton document, or None."""
+    return next((match.group(1) for sentence in lines for match in map(_GLOBAL_ENTITY.match, sentence) if match),
+                None)
+
+
+def _stream_documents(conllu_skeleton_file):
+    with open(conllu_skeleton_file, encoding="utf-8-sig") as f:
+        yield from _skeleton_documents(f)
+
+
+class StreamSkeleton:
+    """
+    The skeleton documents parsed once and kept in memory for converting a batch of text
+    files. It can be passed to stream_text_to_conllu in place of the skeleton file name.
+    """
+
+    def __init__(self, conllu_skeleton_file):
+        self.file = conllu_skeleton_file
+        self.documents = list(_stream_documents(conllu_skeleton_file))
+
+
+def _patch_document(sentences, text, global_entity, problems):
+    """
+    Returns the output lines of a parsed skeleton document with the mentions of the text
+    document, or raises _Unsupported. The counts of the document are added to problems.
+    """
+    first = sentences[0]
+    docname = first.newdoc if first.newdoc is not True else None
+
+    words = [node for sentence in sentences for node in sentence.items if type(node) is _Node]
+    text_words = text.split(" ")
+    forms = [word.form for word in words]
+    check_text_words(text_words, forms, docname, problems)
+    eids, mentions = read_text_mentions(text_words, docname, problems)
+    if any(c in eid for eid in eids for c in CHARS_FORBIDDEN_IN_ID):
+        raise _Unsupported("forbidden characters in entity ids")
+    if any(words[start].sentence is not words[end].sentence for _, start, end in mentions):
+        # udapi orders the words of a mention only by their ord within the sentence
+        raise _Unsupported("mention crossing sentence boundary")
+    # udapi sets the default header when loading the (gold) coreference of the skeleton
+    global_entity = global_entity or _DEFAULT_GLOBAL_ENTITY
+    if "GRP" in global_entity or "eid" not in global_entity:
+        raise _Unsupported(f"global.Entity = {global_entity}")
+    entity = _entity_values(mentions, words, global_entity, docname) if mentions else {}
+
+    out = []
+    i = 0
+    for sentence in sentences:
+        out.extend(_comment_lines(sentence, global_entity))
+        for item in sentence.items:
+            if type(item) is not _Node:
+                out.append(item)
+                continue
+            value = entity.get(i)
+            i += 1
+            if item.misc == "_" and value is None:
+                out.append(item.prefix + "_")
+                continue
+            mapping = _parse_misc(item.misc)
+            for name in _COREF_MISC:
+                mapping.pop(name, None)
+            if item.in_mwt:
+                mapping.pop("SpaceAfter", None)
+            if value:
+                mapping["Entity"] = value
+            out.append(item.prefix + _format_misc(mapping))
+        out.append("")
+    problems.update(words=len(words), mentions=len(mentions), entities=len(eids))
+    return out
+
+
+def _read_udapi_documents(lines, global_entity):
+    """
+    Reads skeleton documents (lists of sentences) into udapi, normalized as by read_data.
+    Returns the list of the udapi documents, without the documents without sentences.
+    """
+    reader = ConlluReader(filehandle=io.StringIO("\n\n".join("\n".join(sentence) for sentence in lines) + "\n\n"),
+                          split_docs=True)
+    # the document may lack the global.Entity header stored in the first document of the file
+    reader._global_entity = global_entity
+    # reading from a file handle ends with an empty document
+    docs = [doc for doc in reader.read_documents() if doc.bundles]
+    return normalize_data(docs)
+
+
+def _convert_with_udapi(lines, text, global_entity, f, problems):
+    docs = prepare_skeleton(_read_udapi_documents(lines, global_entity), use_gold_empty_nodes=True)
+    assert len(docs) == 1
+    import_text_document(text, docs[0], use_gold_empty_nodes=True, problems=problems)
+    write_data(docs, f)
+
+
+def convert_document(document, text, global_entity, problems):
+    """
+    Returns the CoNLL-U of one skeleton document (as yielded by _skeleton_documents) with the
+    mentions of the text document, converted through udapi if the lines cannot be patched.
+    The counts of the document are added to problems.
+    """
+    lines, sentences, _ = document
+    try:
+        if isinstance(sentences, _Unsupported):
+            raise sentences
+        if not _udapi_supported():
+            raise _Unsupported(f"udapi version other than {UDAPI_VERSION}")
+        return "\n".join(_patch_document(sentences, text, global_entity, problems)) + "\n"
+    except _Unsupported as ex:
+        logger.debug(f"Converting document through udapi: {ex}")
+        # the document is checked again by udapi
+        problems.clear()
+        problems["udapi_fallback"] = 1
+        f = io.StringIO()
+        _convert_with_udapi(lines, text, global_entity, f, problems)
+        return f.getvalue()
+
+
+def stream_text_to_conllu(text_docs, conllu_skeleton_file, out_file, stats=None):
+    """
+    Converts the text documents into CoNLL-U with the gold empty nodes of the skeleton,
+    streaming the skeleton document by document (see the module docstring). The skeleton
+    is a file name or a StreamSkeleton. The counts of each document are added to stats.
+    """
+    if isinstance(conllu_skeleton_file, StreamSkeleton):
+        documents = conllu_skeleton_file.documents
+    else:
+        documents = _stream_documents(conllu_skeleton_file)
+    text_docs = iter(text_docs)
+    global_entity = None
+    buffer, buffered = [], 0
+    with open(out_file, "w", encoding="utf-8") as f:
+        for document in documents:
+            text = next(text_docs, None)
+            assert text is not None, "fewer text documents than skeleton documents"
+            global_entity = global_entity or document[2]
+            problems = Counter()
+            chunk = convert_document(document, text, global_entity, problems)
+            if stats is not None:
+                stats.add_document(problems)
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= _WRITE_BUFFER:
+                f.write("".join(buffer))
+                buffer, buffered = [], 0
+        f.write("".join(buffer))
+    assert next(text_docs, None) is None, "more text documents than skeleton documents"
+
+
+def stream_data(conllu_file):
+    """
+    Yields the udapi documents of the CoNLL-U file one by one, normalized as by read_data,
+    so that only the document being converted is kept in memory.
+    """
+    global_entity = None
+    with open(conllu_file, encoding="utf-8-sig") as f:
+        for lines in _read_documents(f):
+            global_entity = global_entity or _global_entity(lines)
+            yield from _read_udapi_documents(lines, global_entity)
+
+
+def stream_skeleton(conllu_skeleton_file, use_gold_empty_nodes=True):
+    """Yields the udapi documents of the skeleton file one by one, prepared as by read_skeleton."""
+    for doc in stream_data(conllu_skeleton_file):
+        yield from prepare_skeleton([doc], use_gold_empty_nodes)
+
+
+def stream_udapi_to_conllu(text_docs, conllu_skeleton_file, out_file, import_document, use_gold_empty_nodes=True,
+                           stats=None):
+    """
+    Converts the text documents into CoNLL-U through udapi one document at a time: each
+    skeleton document is read, imported by import_document(text, udapi_doc,
+    use_gold_empty_nodes, problems), written and released before the next one is read.
+    The counts of each document are added to stats.
+    """
+    text_docs = iter(text_docs)
+    with open(out_file, "w", encoding="utf-8") as f:
+        for udapi_doc in stream_skeleton(conllu_skeleton_file, use_gold_empty_nodes):
+            text = next(text_docs, None)
+            assert text is not None, "fewer text documents than skeleton documents"
+            problems = Counter()
+            import_document(text, udapi_doc, use_gold_empty_nodes, problems)
+            if stats is not None:
+                stats.add_document(problems)
+            write_data([udapi_doc], f)
+    assert next(text_docs, None) is None, "more text documents than skeleton documents"
+
+
+def _export_chunk(conllu_file, start, end, global_entity, document_to, args):
+    with open(conllu_file, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8-sig")
+    lines = [sentence for document in _read_documents(io.StringIO(text, newline=None)) for sentence in document]
+    return [document_to(doc, *args) for doc in _read_udapi_documents(lines, global_entity)]
+
+
+def _export_chunks(index):
+    """
+    Yields the byte spans of the documents of the indexed CoNLL-U file grouped into chunks
+    of about _EXPORT_CHUNK bytes, with the global.Entity header read before the chunk.
+    """
+    first = 0
+    for i in range(len(index)):
+        start, _ = index.span(first)
+        _, end = index.span(i)
+        if end - start >= _EXPORT_CHUNK or i == len(index) - 1:
+            yield start, end, index.global_entity(first)
+            first = i + 1
+
+
+def export_documents(conllu_file, document_to, args, workers=0):
+    """
+    Converts the documents of the CoNLL-U file by document_to(doc, *args) (e.g. document_to_text)
+    in worker processes (0 for all cores) and yields the results in the order of the file,
+    the same as for read_data. The file is split at the newdoc boundaries (by its
+    DocumentIndex) into chunks read by the workers straight from their offsets.
+    """
+    from .doc_index import DocumentIndex
+
+    index = DocumentIndex(conllu_file, conllu=True, store=False)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(_export_chunk, conllu_file, start, end, global_entity, document_to, args)
+                   for start, end, global_entity in _export_chunks(index)]
+        for future in futures:
+            yield from future.result()
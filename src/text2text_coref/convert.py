@@ -1,5 +1,7 @@
 import logging
-from collections import defaultdict
+import pickle
+import sys
+from collections import Counter, defaultdict
 
 import udapi
 from udapi.block.corefud.movehead import MoveHead
@@ -7,17 +9,28 @@ from udapi.block.corefud.singleparent import SingleParent
 from udapi.block.read.conllu import Conllu as ConlluReader
 from udapi.block.write.conllu import Conllu as ConlluWriter
 from udapi.core.coref import BridgingLinks
+from udapi.core.node import EmptyNode
+
+from .cache import load_cached, store_cached
+from .files import output_filename as _output_filename
+from .stats import Stats
 
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
                     datefmt='%m/%d/%Y %H:%M:%S',
                     level=logging.INFO)
 logger = logging.getLogger()
 
+# the number of mismatched words logged per document, the rest is only counted
+MAX_MISMATCH_WARNINGS = 5
+
 
 def read_data(file):
+    return normalize_data(ConlluReader(files=file, split_docs=True).read_documents())
+
+
+def normalize_data(docs):
     move_head = MoveHead()
     single_parent = SingleParent()
-    docs = ConlluReader(files=file, split_docs=True).read_documents()
     level = logging.getLogger().level
     logging.getLogger().setLevel(logging.ERROR)
     for doc in docs:
@@ -27,23 +40,100 @@ def read_data(file):
     return docs
 
 
+def prepare_skeleton(docs, use_gold_empty_nodes=True):
+    """
+    Prepares the empty nodes of the skeleton documents for importing predictions:
+    gold empty nodes are re-created right after their parents (the order in
+    which they are exported), otherwise all empty nodes are removed.
+    """
+    for doc in docs:
+        for bundle in doc:
+            for tree in bundle:
+                rebuild_empty_nodes(tree, use_gold_empty_nodes)
+    return docs
+
+
+def read_skeleton(file, use_gold_empty_nodes=True, cache_dir=None):
+    """
+    Reads the CoNLL-U skeleton for importing predictions (read_data followed by
+    prepare_skeleton). With a cache_dir, the prepared documents are pickled there
+    and reused until the file changes, skipping the parsing and normalization.
+    """
+    if isinstance(file, Skeleton):
+        assert file.use_gold_empty_nodes == use_gold_empty_nodes
+        return file.copy()
+    if cache_dir is None:
+        return prepare_skeleton(read_data(file), use_gold_empty_nodes)
+
+    key = f"skeleton-{use_gold_empty_nodes}"
+    docs = load_cached(file, key, cache_dir)
+    if docs is None:
+        logger.info(f"Caching skeleton file {file} in {cache_dir}")
+        docs = store_cached(file, key, cache_dir, prepare_skeleton(read_data(file), use_gold_empty_nodes))
+    return docs
+
+
+def log_unused_cache(cache_dir):
+    """Logs that a cache_dir is not used, as the skeleton is streamed instead of read by read_skeleton."""
+    if cache_dir is not None:
+        logger.warning(f"The skeleton is streamed document by document, the cache in {cache_dir} is not used "
+                       f"(convert without streaming to use it)")
+
+
+class Skeleton:
+    """
+    A skeleton prepared once (read_skeleton) and copied for each conversion, so that a batch
+    of predictions does not re-read and re-normalize the skeleton file. It can be passed to
+    the importers in place of the skeleton file name.
+    """
+
+    def __init__(self, file, use_gold_empty_nodes=True, cache_dir=None):
+        self.file = file
+        self.use_gold_empty_nodes = use_gold_empty_nodes
+        self._docs = pickle.dumps(read_skeleton(file, use_gold_empty_nodes, cache_dir), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def copy(self):
+        return pickle.loads(self._docs)
+
+
 def write_data(docs, f):
     level = logging.getLogger().level
     logging.getLogger().setLevel(logging.ERROR)
+    # the writer prints to sys.stdout redirected to the file
+    stdout = sys.stdout
     writer = ConlluWriter(filehandle=f)
     for doc in docs:
         writer.before_process_document(doc)
         writer.process_document(doc)
     # writer.after_process_document(None)
+    sys.stdout = stdout
     logging.getLogger().setLevel(level)
 
 
-def convert_text_file_to_conllu(filename, skeleton_filename, output_filename, zero_mentions=False):
-    if not output_filename:
-        output_filename = filename.replace(".txt", ".conllu")
+def convert_text_file_to_conllu(filename, skeleton_filename, output_filename, zero_mentions=False, cache_dir=None,
+                                streaming=True, stats=None, report=None):
+    output_filename = _output_filename(filename, output_filename, ".conllu")
+    if stats is None:
+        stats = Stats(keep_documents=bool(report))
+    stats.file = filename
     with open(filename, encoding="utf-8") as f:
-        text_docs = f.read().splitlines()
-        convert_text_to_conllu(text_docs, skeleton_filename, output_filename, zero_mentions)
+        convert_text_to_conllu(read_lines(f), skeleton_filename, output_filename, zero_mentions, cache_dir, streaming,
+                               stats)
+    return finish_stats(stats, report)
+
+
+def read_lines(f):
+    """Yields the documents of a text file one per line, split the same way as by str.splitlines."""
+    for line in f:
+        yield from line.splitlines()
+
+
+def finish_stats(stats, report=None):
+    """Logs the summary of the stats, writes them into the JSON report if given and returns them."""
+    stats.log_summary()
+    if report:
+        stats.write_json(report)
+    return stats
 
 
 def remove_empty_node(node):
@@ -62,6 +152,75 @@ def remove_empty_node(node):
         if n._deps:
             n._deps = [dep for dep in n._deps if dep["parent"] != node]
 
+def rebuild_empty_nodes(root, use_gold_empty_nodes=True):
+    """
+    Rebuilds the empty nodes of a tree with the same result as shift_empty_node_recreate
+    (or remove_empty_node without use_gold_empty_nodes) called for each of them in the
+    word order, but rewrites the deps of the words in one pass instead of one per empty
+    node.
+    """
+    empties = sorted(root.empty_nodes)
+    if not empties:
+        return
+    if not use_gold_empty_nodes:
+        removed = set(empties)
+        _remove_word_deps(root, removed)
+        root.empty_nodes.clear()
+        return
+    removed = set()
+    for node in empties:
+        parent = node.deps[0]["parent"]
+        if int(node.ord) == parent.ord:
+            continue
+        if parent.is_root():
+            new_ord = 0.1
+            for empty in root.empty_nodes:
+                if int(empty.ord) == parent.ord:
+                    new_ord += 0.1
+            new_empty = parent.create_empty_child()
+            new_empty.ord = new_ord
+            root.empty_nodes.sort()
+        else:
+            new_empty = parent.create_empty_child(node.deps[0]["deprel"], after=True)
+        new_empty.form = node.form
+        new_empty.lemma = node.lemma
+        for empty in root.empty_nodes:
+            for par in empty.deps:
+                if par["parent"] == node:
+                    par["parent"] = new_empty
+        new_empty.deps = node.deps
+        if not removed:
+            _parse_deps(root)
+        # remove_empty_node for the empty nodes only
+        for empty in root.empty_nodes:
+            if empty.deps:
+                empty.deps = [x for x in empty.deps if x["parent"] != node]
+        for empty in root.empty_nodes:
+            if node.ord < empty.ord < node.ord + 1:
+                empty.ord = round(empty.ord - 0.1, 1)
+        root.empty_nodes.remove(node)
+        removed.add(node)
+    if removed:
+        _remove_word_deps(root, removed)
+
+
+def _parse_deps(root):
+    """
+    Parses the raw enhanced deps of the words, which udapi only does on the first access
+    to node.deps. The raw deps refer to the empty nodes by their ords, so they must be
+    parsed before the empty nodes are moved and renumbered: parsed later, they would
+    point to the wrong (or missing) empty nodes. Do not remove this as an unused access.
+    """
+    for word in root.descendants:
+        word.deps
+
+
+def _remove_word_deps(root, removed):
+    for word in root.descendants:
+        if word.deps:
+            word.deps = [x for x in word.deps if x["parent"] not in removed]
+
+
 def reduce_discontinuous_mention(mention):
     """Reduce a mention to a continuous span if it is discontinuous."""
     root = mention.words[0].root
@@ -71,76 +230,240 @@ def reduce_discontinuous_mention(mention):
             mention.words = subspan_words
             break
 
-def convert_text_to_conllu(text_docs, conllu_skeleton_file, out_file, use_gold_empty_nodes=True):
-    udapi_docs = read_data(conllu_skeleton_file)
+class MentionIndex:
+    """
+    The mention boundaries of a udapi document indexed in one pass over its entities
+    for the exporters, which then render each word from its own boundaries only.
+
+    `boundaries` maps the position of a node in doc.nodes_and_empty to the mentions
+    starting or ending at it as (eid, opens, closes, start, end) tuples, start and end
+    being the ords of the first and the last word of the mention. `clusters` holds the
+    (first position, last position, words) of the mentions of each entity in the order
+    of doc.coref_entities. Discontinuous mentions are reduced to their subspan with
+    the head (reduce_discontinuous_mention).
+
+    With sequential_ids, the entities are renumbered from e1 in the order in which the
+    exported words (without the empty nodes unless with_empty_nodes) mention them.
+    """
+
+    def __init__(self, doc, sequential_ids=False, with_empty_nodes=True):
+        positions = {node: i for i, node in enumerate(doc.nodes_and_empty)}
+        entities = doc.coref_entities
+        mentions = [mention for entity in entities for mention in entity.mentions]
+        self.eids = {entity: entity.eid for entity in entities}
+        if sequential_ids:
+            self.eids = {}
+            # the first exported word of each mention before the discontinuous ones are reduced
+            first_words = []
+            for mention in sorted(mentions):
+                words = [word for word in mention.words if with_empty_nodes or not word.is_empty()]
+                if words:
+                    first_words.append((positions[words[0]], mention.entity))
+            first_words.sort(key=lambda x: x[0])
+            for _, entity in first_words:
+                if entity not in self.eids:
+                    self.eids[entity] = f"e{len(self.eids) + 1}"
+
+        self.boundaries = defaultdict(list)
+        self.clusters = []
+        for entity in entities:
+            cluster = []
+            for mention in entity.mentions:
+                if "," in mention.span:
+                    reduce_discontinuous_mention(mention)
+                words = mention.words
+                first, last = positions[words[0]], positions[words[-1]]
+                eid = self.eids.get(entity)
+                start, end = float(words[0].ord), float(words[-1].ord)
+                if first == last:
+                    self.boundaries[first].append((eid, True, True, start, end))
+                else:
+                    self.boundaries[first].append((eid, True, False, start, end))
+                    self.boundaries[last].append((eid, False, True, start, end))
+                cluster.append((first, last, words))
+            self.clusters.append(cluster)
+
+
+def log_word_mismatches(text_forms, forms, docname):
+    """
+    Logs the first MAX_MISMATCH_WARNINGS words of a document that do not match the
+    skeleton words and returns the number of all the mismatched words.
+    """
+    mismatches = 0
+    for i, (text_form, form) in enumerate(zip(text_forms, forms)):
+        if text_form != form:
+            if mismatches < MAX_MISMATCH_WARNINGS:
+                logger.warning(f"WARNING: words do not match. DOC: {docname}, word1: {text_form}, word2: {form}, i: {i}")
+            mismatches += 1
+    if mismatches > MAX_MISMATCH_WARNINGS:
+        logger.warning(f"WARNING: {mismatches - MAX_MISMATCH_WARNINGS} more words do not match. DOC: {docname}")
+    return mismatches
+
+
+def check_text_words(words, forms, docname, problems=None):
+    mismatches = log_word_mismatches([word.split("|")[0] for word in words], forms, docname)
+    if problems is not None:
+        problems["word_mismatches"] += mismatches
+    # if len(forms) != len(words):
+    #     continue
+    assert len(forms) == len(words)
+
+
+def read_text_mentions(words, docname, problems=None):
+    """
+    Reads the mentions marked in the words of a text document ("form|[e1", "form|e1]", ...).
+    Returns the entity ids in the order of their first occurrence and the (eid, start, end)
+    word spans of the mentions in the order in which they are closed. The words are
+    expected to be checked by check_text_words.
+    """
+    mention_starts = defaultdict(list)
+    entities = {}
+    mentions = []
+    for i, word in enumerate(words):
+        if "|" in word:
+            for mention in word.split("|")[1].replace("-", ",").split(","):
+                eid = mention.replace("[", "").replace("]", "")
+                if len(eid) == 0:
+                    continue
+                entities[eid] = True
+                if mention.startswith("["):
+                    mention_starts[eid].append(i)
+                if mention[-1] == "]":
+                    if not mention_starts[eid]:
+                        logger.warning(f"WARNING: Closing mention which was not opened. DOC: {docname}, EID: {eid}")
+                        if problems is not None:
+                            problems["unopened_mentions"] += 1
+                        continue
+                    mentions.append((eid, mention_starts[eid].pop(), i))
+    return list(entities), mentions
+
+
+def _is_empty_word(word):
+    return word.startswith("##")
+
+
+def create_empty_nodes(udapi_words, words, deprel, is_empty=_is_empty_word):
+    """
+    Creates the empty nodes of the predicted words (starting with ## by default) after
+    the preceding skeleton words, the same as create_empty_child for each of them but
+    without searching the empty nodes of the tree. Returns the number of created nodes.
+    """
+    created = 0
+    j = 1
+    for word in udapi_words:
+        count = 0
+        while j < len(words) and is_empty(words[j]):
+            logger.debug("Creating empty node for word: %s at position %d", words[j], j)
+            count += 1
+            j += 1
+        j += 1
+        if count:
+            _create_empty_children(word, count, deprel)
+            created += count
+    return created
+
+
+def _create_empty_children(word, count, deprel):
+    root = word.root
+    if root.empty_nodes and root.empty_nodes[-1] > word:
+        # the word already has empty nodes
+        for _ in range(count):
+            word.create_empty_child(deprel, after=True)
+        return
+    new_ord = word.ord + 0.1
+    # from x.10 on, create_empty_child switches to OrdTuple
+    for i in range(min(count, 9)):
+        if i:
+            new_ord = round(new_ord + 0.1, 1)
+        empty = EmptyNode(root=root)
+        empty.deps = [{"parent": word, "deprel": deprel}]
+        empty._ord = new_ord
+        root.empty_nodes.append(empty)
+    for _ in range(count - 9):
+        word.create_empty_child(deprel, after=True)
+
+
+def import_text_document(text, udapi_doc, use_gold_empty_nodes=True, problems=None):
+    """
+    Replaces the coreference annotation of the udapi skeleton document with the mentions
+    marked in the text document. The counts of the words, mentions, entities and problems
+    are added to the problems counter.
+    """
+    udapi_doc._eid_to_entity = {}
+    words = text.split(" ")
+    udapi_words = [word for word in udapi_doc.nodes]
+    for word in udapi_doc.nodes_and_empty:
+        #word.misc = {}
+        # TODO: pull request
+        # clear only coref-related misc attributes
+        word.misc["Entity"] = None
+        word.misc["Bridge"] = None
+        word.misc["SplitAnte"] = None
+    if not use_gold_empty_nodes:
+        create_empty_nodes(udapi_words, words, "dep") # TODO: deprel fixed to "dep", pull request
+    udapi_words = [word for word in udapi_doc.nodes_and_empty]
+    forms = [word.form for word in udapi_words]
+    docname = udapi_doc.meta.get('docname')
+    check_text_words(words, forms, docname, problems)
+    eids, mentions = read_text_mentions(words, docname, problems)
+    entities = {eid: udapi_doc.create_coref_entity(eid=eid) for eid in eids}
+    for eid, start, end in mentions:
+        entities[eid].create_mention(words=udapi_words[start: end + 1])
+    udapi.core.coref.store_coref_to_misc(udapi_doc)
+    MoveHead().run(udapi_doc)
+    if problems is not None:
+        problems.update(words=len(words), mentions=len(mentions), entities=len(eids))
+
+
+def convert_text_to_conllu(text_docs, conllu_skeleton_file, out_file, use_gold_empty_nodes=True, cache_dir=None,
+                           streaming=True, stats=None):
+    if stats is None:
+        stats = Stats()
+    if use_gold_empty_nodes and streaming:
+        from .conllu_stream import stream_text_to_conllu
+        log_unused_cache(cache_dir)
+        with stats.stage("stream"):
+            stream_text_to_conllu(text_docs, conllu_skeleton_file, out_file, stats)
+        return
+    if streaming and not isinstance(conllu_skeleton_file, Skeleton):
+        from .conllu_stream import stream_udapi_to_conllu
+        log_unused_cache(cache_dir)
+        with stats.stage("stream"):
+            stream_udapi_to_conllu(text_docs, conllu_skeleton_file, out_file, import_text_document,
+                                   use_gold_empty_nodes, stats)
+        return
+    text_docs = list(text_docs)
+    with stats.stage("read_skeleton"):
+        udapi_docs = read_skeleton(conllu_skeleton_file, use_gold_empty_nodes, cache_dir)
     # udapi_docs2 = read_data(conllu_skeleton_file)
-    move_head = MoveHead()
-    for doc in udapi_docs:
-        doc._eid_to_entity = {}
     assert len(udapi_docs) == len(text_docs)
-    for text, udapi_doc in zip(text_docs, udapi_docs):
-        words = text.split(" ")
-        udapi_words = [word for word in udapi_doc.nodes]
-        for word in udapi_doc.nodes_and_empty:
-            #word.misc = {}
-            # TODO: pull request
-            # clear only coref-related misc attributes
-            word.misc["Entity"] = None
-            word.misc["Bridge"] = None
-            word.misc["SplitAnte"] = None
-            # Remove empty nodes
-            if not use_gold_empty_nodes and word.is_empty():
-                remove_empty_node(word)
-            elif word.is_empty():
-                shift_empty_node_recreate(word)
-        if not use_gold_empty_nodes:
-            j = 1
-            for i in range(len(udapi_words)):
-                word = udapi_words[i]
-                while j < len(words) and words[j].startswith("##"):
-                    word.create_empty_child("dep", after=True) # TODO: deprel fixed to "dep", pull request
-                    j += 1
-                j += 1
-        udapi_words = [word for word in udapi_doc.nodes_and_empty]
-        for i in range(len(udapi_words)):
-            if udapi_words[i].form != words[i].split("|")[0]:
-                logger.warning(f"WARNING: words do not match. DOC: {udapi_doc.meta['docname']}, word1: {words[i].split('|')[0]}, word2: {udapi_words[i].form}, i: {i}")
-        # if len(udapi_words) != len(words):
-        #     continue
-        assert len(udapi_words) == len(words)
-        mention_starts = defaultdict(list)
-        entities = {}
-        for i, (word, udapi_word) in enumerate(zip(words, udapi_words)):
-            if word.split("|")[0] != udapi_word.form:
-                logger.warning(f"WARNING: words do not match. DOC: {udapi_doc.meta['docname']}, word1: {word.split('|')[0]}, word2: {udapi_word.form}")
-            if "|" in word:
-                mentions = word.split("|")[1].replace("-", ",").split(",")
-                for mention in mentions:
-                    eid = mention.replace("[", "").replace("]", "")
-                    if len(eid) == 0:
-                        continue
-                    if eid not in entities:
-                        entities[eid] = udapi_doc.create_coref_entity(eid=eid)
-                    if mention.startswith("["):
-                        mention_starts[eid].append(i)
-                    if mention[-1] == "]":
-                        if not mention_starts[eid]:
-                            logger.warning(f"WARNING: Closing mention which was not opened. DOC: {udapi_doc.meta['docname']}, EID: {eid}")
-                            continue
-                        entities[eid].create_mention(words=udapi_words[mention_starts[eid][-1]: i + 1])
-                        mention_starts[eid].pop()
-        udapi.core.coref.store_coref_to_misc(udapi_doc)
-        move_head.run(udapi_doc)
+    with stats.stage("import"):
+        for text, udapi_doc in zip(text_docs, udapi_docs):
+            problems = Counter()
+            import_text_document(text, udapi_doc, use_gold_empty_nodes, problems)
+            stats.add_document(problems)
     # debug_udapi(udapi_docs, udapi_docs2)
-    with open(out_file, "w", encoding="utf-8") as f:
+    with stats.stage("write"), open(out_file, "w", encoding="utf-8") as f:
         write_data(udapi_docs, f)
 
 
-def convert_conllu_file_to_text(filename, output_filename, zero_mentions, blind=False, sequential_ids=True, no_empty_node_form=False):
-    if not output_filename:
-        output_filename = filename.replace(".conllu", ".txt")
-    docs = read_data(filename)
-    convert_to_text(docs, output_filename, zero_mentions, not blind, sequential_ids, not no_empty_node_form)
+def convert_conllu_file_to_text(filename, output_filename, zero_mentions, blind=False, sequential_ids=True, no_empty_node_form=False,
+                                workers=1):
+    output_filename = _output_filename(filename, output_filename, ".txt")
+    if workers == 1:
+        docs = read_data(filename)
+        convert_to_text(docs, output_filename, zero_mentions, not blind, sequential_ids, not no_empty_node_form)
+        return
+    from .conllu_stream import export_documents
+    lines = export_documents(filename, document_to_text, (zero_mentions, not blind, sequential_ids, not no_empty_node_form),
+                             workers)
+    write_lines(lines, output_filename)
+
+
+def write_lines(lines, out_file):
+    with open(out_file, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
 
 
 def shift_empty_node(node):
@@ -156,6 +479,49 @@ def shift_empty_node(node):
     node.ord = new_ord
     node.deps[0]["parent"].root.empty_nodes.sort()
 
+def shift_empty_nodes(root):
+    """
+    Moves the empty nodes of a tree after their (first enhanced) parents with the same
+    result as shift_empty_node called for each of them in the word order, but computes
+    all the new ords in one pass and sorts the empty nodes once.
+    """
+    # the order of the empty nodes in doc.nodes_and_empty
+    empties = sorted(root.empty_nodes)
+    ords = {node: node.ord for node in empties}
+    counts = Counter(int(ord) for ord in ords.values())
+    shifted = False
+    for node in empties:
+        parent = node.deps[0]["parent"]
+        parent_ord = ords.get(parent, parent.ord)
+        if int(ords[node]) == parent_ord:
+            continue
+        new_ord = parent_ord + 0.1
+        # the same float additions as in shift_empty_node
+        for _ in range(counts.get(parent_ord, 0)):
+            new_ord += 0.1
+        counts[int(ords[node])] -= 1
+        counts[int(new_ord)] += 1
+        ords[node] = new_ord
+        shifted = True
+    if not shifted:
+        return
+    if len(set(ords.values())) < len(ords):
+        # the order of the empty nodes with the same ord depends on all the intermediate sorts
+        for node in empties:
+            shift_empty_node(node)
+        return
+    for node, ord in ords.items():
+        node.ord = ord
+    root.empty_nodes.sort()
+
+
+def shift_document_empty_nodes(doc):
+    """Moves the empty nodes of all the trees of the document (see shift_empty_nodes)."""
+    for bundle in doc:
+        for tree in bundle:
+            shift_empty_nodes(tree)
+
+
 def shift_empty_node_recreate(node):
     if not node.is_empty():
         return
@@ -188,47 +554,36 @@ def shift_empty_node_recreate(node):
 
 
 def convert_to_text(docs, out_file, solve_empty_nodes=True, mark_entities=True, sequential_ids=False, empty_node_form=True):
-    with open(out_file, "w", encoding="utf-8") as f:
-        for doc in docs:
-            eids = {}
-            out_words = []
-            if solve_empty_nodes:
-                for node in doc.nodes_and_empty:
-                    if node.is_empty():
-                        # node.shift_before_node(node.deps[0]["parent"])
-                        shift_empty_node(node)
-                udapi_words = [word for word in doc.nodes_and_empty]
-            else:
-                udapi_words = [word for word in doc.nodes]
-            for word in udapi_words:
-                out_word = word.form.replace(" ", "_")
-                if word.is_empty():
-                    out_word = "##" + (out_word if out_word != "_" and empty_node_form else "") # empty nodes start with ##
-                mentions = []
-                if mark_entities:
-                    for mention in set(word.coref_mentions):
-                        if sequential_ids:
-                            if mention.entity.eid not in eids:
-                                eids[mention.entity.eid] = f"e{len(eids) + 1}"
-                            eid = eids[mention.entity.eid]
-                        else:
-                            eid = mention.entity.eid
-                        if "," in mention.span:
-                            reduce_discontinuous_mention(mention)
-                        span = mention.span
-                        mention_start = float(span.split("-")[0])
-                        mention_end = float(span.split("-")[1]) if "-" in span else mention_start
-                        if mention_start == float(word.ord) and mention_end == float(word.ord):
-                            mentions.append(f"[{eid}]")
-                        elif mention_start == float(word.ord):
-                            mentions.append(f"[{eid}")
-                        elif mention_end == float(word.ord):
-                            mentions.append(f"{eid}]")
-                if len(mentions) > 0:
-                    out_words.append(f"{out_word}|{','.join(sorted(mentions))}")
+    write_lines((document_to_text(doc, solve_empty_nodes, mark_entities, sequential_ids, empty_node_form) for doc in docs),
+                out_file)
+
+
+def document_to_text(doc, solve_empty_nodes=True, mark_entities=True, sequential_ids=False, empty_node_form=True):
+    """Returns one udapi document in the text format (one line without the newline)."""
+    out_words = []
+    if solve_empty_nodes:
+        shift_document_empty_nodes(doc)
+    index = MentionIndex(doc, sequential_ids, solve_empty_nodes) if mark_entities else None
+    for i, word in enumerate(doc.nodes_and_empty):
+        if word.is_empty() and not solve_empty_nodes:
+            continue
+        out_word = word.form.replace(" ", "_")
+        if word.is_empty():
+            out_word = "##" + (out_word if out_word != "_" and empty_node_form else "") # empty nodes start with ##
+        mentions = []
+        if index is not None:
+            for eid, opens, closes, _, _ in index.boundaries.get(i, ()):
+                if opens and closes:
+                    mentions.append(f"[{eid}]")
+                elif opens:
+                    mentions.append(f"[{eid}")
                 else:
-                    out_words.append(out_word)
-            f.write(" ".join(out_words) + "\n")
+                    mentions.append(f"{eid}]")
+        if len(mentions) > 0:
+            out_words.append(f"{out_word}|{','.join(sorted(mentions))}")
+        else:
+            out_words.append(out_word)
+    return " ".join(out_words)
 
 
 def debug_udapi(udapi_docs1, udapi_docs2):
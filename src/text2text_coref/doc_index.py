@@ -0,0 +1,226 @@
+"""
+Byte-offset index of the documents of a CoNLL-U file (split at the "# newdoc id" comments)
+or of the lines of a prediction file, so that a single document can be read without
+parsing the rest of the file:
+
+    index = DocumentIndex("train.conllu")
+    doc = read_udapi_document("train.conllu", "doc-id")          # as read_data
+    gold = read_gold_document("train.conllu", 123, zero_mentions=True)  # as read_conllu
+    text = read_input_document("predictions.txt", 123)            # as read_input_file
+
+The index is stored in a sidecar file next to the indexed one (<file>.idx) and read through
+mmap; it is rebuilt when the size or the modification time of the file changes.
+"""
+import io
+import logging
+import mmap
+import os
+import re
+import struct
+from array import array
+
+logger = logging.getLogger()
+
+SIDECAR_SUFFIX = ".idx"
+
+_MAGIC = b"T2TIDX1\n"
+# magic, kind, size and mtime of the indexed file, number of documents, offset of the
+# global.Entity header (-1 if none), length of the names
+_HEADER = struct.Struct("<8sBQqQqQ")
+_CONLLU, _LINES = 0, 1
+_NEWDOC_ID = re.compile(rb"^# newdoc id\s*=\s*(.+)")
+_GLOBAL_ENTITY = re.compile(rb"^# global.Entity\s*=\s*(\S+)")
+_BOM = b"\xef\xbb\xbf"
+
+
+def _scan_conllu(f):
+    """Returns the document offsets, names and the global.Entity header (offset, value) of a CoNLL-U file."""
+    offsets, names = [], []
+    header_offset, header = -1, b""
+    offset = block = 0
+    content = False
+    for raw_line in f:
+        line = raw_line[len(_BOM):] if offset == 0 and raw_line.startswith(_BOM) else raw_line
+        if not line.strip():
+            block = offset + len(raw_line)
+        else:
+            match = _NEWDOC_ID.match(line)
+            if match:
+                if content and not offsets:
+                    # the lines before the first newdoc form a document without a name
+                    offsets.append(0)
+                    names.append(b"")
+                offsets.append(block)
+                names.append(match.group(1).strip())
+            elif header_offset < 0:
+                match = _GLOBAL_ENTITY.match(line)
+                if match:
+                    header_offset, header = offset, match.group(1)
+            content = True
+        offset += len(raw_line)
+    if content and not offsets:
+        offsets.append(0)
+        names.append(b"")
+    return offsets, names, header_offset, header
+
+
+def _scan_lines(f):
+    offsets = []
+    offset = 0
+    for line in f:
+        offsets.append(offset)
+        offset += len(line)
+    return offsets
+
+
+def _build(filename, kind):
+    stat = os.stat(filename)
+    with open(filename, "rb") as f:
+        if kind == _CONLLU:
+            offsets, names, header_offset, header = _scan_conllu(f)
+        else:
+            offsets, names, header_offset, header = _scan_lines(f), [], -1, b""
+    names = b"\n".join(names)
+    return b"".join((
+        _HEADER.pack(_MAGIC, kind, stat.st_size, stat.st_mtime_ns, len(offsets), header_offset, len(names)),
+        array("Q", offsets + [stat.st_size]).tobytes(),
+        names,
+        header,
+    ))
+
+
+class DocumentIndex:
+    """
+    The byte offsets of the documents of a CoNLL-U file (conllu=True) or of the lines of a
+    prediction file, with the lookup of the documents by their index or newdoc id.
+
+    The index is loaded from the sidecar file if it is up to date, otherwise it is built
+    and (with store=True) written there. A directory that cannot be written to only
+    logs the failure, the index is then kept in memory.
+    """
+
+    def __init__(self, filename, conllu=None, store=True):
+        if conllu is None:
+            conllu = filename.endswith(".conllu")
+        self.filename = filename
+        self.path = filename + SIDECAR_SUFFIX
+        self._kind = _CONLLU if conllu else _LINES
+        self._names = None
+        self._buffer = self._load()
+        if self._buffer is None:
+            data = _build(filename, self._kind)
+            if store:
+                self._store(data)
+            self._buffer = self._load() if store else None
+            if self._buffer is None:
+                self._buffer = data
+        _, _, _, _, self._count, self._header_offset, names_length = _HEADER.unpack_from(self._buffer)
+        offsets_end = _HEADER.size + 8 * (self._count + 1)
+        self._offsets = memoryview(self._buffer)[_HEADER.size:offsets_end].cast("Q")
+        self._names_blob = (offsets_end, offsets_end + names_length)
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(self.filename)
+        if len(buffer) < _HEADER.size or _HEADER.unpack_from(buffer)[:4] != (
+                _MAGIC, self._kind, stat.st_size, stat.st_mtime_ns):
+            buffer.close()
+            return None
+        return buffer
+
+    def _store(self, data):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError as ex:
+            logger.debug(f"{ex} while storing the index {self.path}")
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def names(self):
+        """The newdoc ids of the documents (None for a document without it)."""
+        if self._names is None:
+            start, end = self._names_blob
+            if self._kind == _LINES or not self._count:
+                self._names = [None] * self._count
+            else:
+                self._names = [name or None for name in bytes(self._buffer[start:end]).decode("utf-8").split("\n")]
+        return self._names
+
+    def find(self, doc):
+        """The index of a document given by its index or newdoc id."""
+        if isinstance(doc, str):
+            try:
+                return self.names.index(doc)
+            except ValueError:
+                raise KeyError(f"No document {doc} in {self.filename}") from None
+        if not -self._count <= doc < self._count:
+            raise IndexError(f"No document {doc} in {self.filename} with {self._count} documents")
+        return doc % self._count
+
+    def span(self, doc):
+        """The (start, end) byte offsets of a document."""
+        i = self.find(doc)
+        return self._offsets[i], self._offsets[i + 1]
+
+    def read(self, doc):
+        """The text of a document (a line of a prediction file with its newline)."""
+        start, end = self.span(doc)
+        with open(self.filename, "rb") as f:
+            f.seek(start)
+            return f.read(end - start).decode("utf-8-sig")
+
+    def lines(self, doc):
+        """The lines of a document, split as when reading the file in the text mode."""
+        return io.StringIO(self.read(doc), newline=None)
+
+    def global_entity(self, doc):
+        """The global.Entity header read before a document of a CoNLL-U file, or None."""
+        start, _ = self.span(doc)
+        if self._header_offset < 0 or self._header_offset >= start:
+            return None
+        return bytes(self._buffer[self._names_blob[1]:]).decode("utf-8")
+
+
+def read_udapi_document(filename, doc, index=None):
+    """Reads one document of a CoNLL-U file into udapi, normalized as by read_data."""
+    from .conllu_stream import _read_documents, _read_udapi_documents
+
+    if index is None:
+        index = DocumentIndex(filename, conllu=True)
+    lines = [sentence for document in _read_documents(index.lines(doc)) for sentence in document]
+    docs = _read_udapi_documents(lines, index.global_entity(doc))
+    assert len(docs) == 1, f"Document {doc} of {filename} is not a single udapi document"
+    return docs[0]
+
+
+def read_gold_document(filename, doc, zero_mentions, index=None):
+    """Reads the sentences of words of one document of a CoNLL-U file, as read_conllu."""
+    from .output_cleaner import _parse_conllu_lines
+
+    if index is None:
+        index = DocumentIndex(filename, conllu=True)
+    return next(_parse_conllu_lines(index.lines(doc), zero_mentions))
+
+
+def read_input_document(filename, i, index=None):
+    """Reads one document (line) of a prediction file, as read_input_file."""
+    if index is None:
+        index = DocumentIndex(filename, conllu=False)
+    return index.read(i).strip()
+
+
+def build_index(filename, conllu=None):
+    """Builds (or refreshes) the sidecar index of the file and returns it."""
+    index = DocumentIndex(filename, conllu)
+    logger.info(f"Indexed {len(index)} {'documents' if index._kind == _CONLLU else 'lines'} of {filename} "
+                f"in {index.path}")
+    return index
@@ -1,9 +1,13 @@
 
 import udapi
 from udapi.block.corefud.movehead import MoveHead
-from collections import defaultdict
+from collections import Counter, defaultdict
 import logging
-from .convert import read_data, shift_empty_node_recreate, shift_empty_node, write_data, remove_empty_node, reduce_discontinuous_mention
+from .convert import (MentionIndex, Skeleton, create_empty_nodes, finish_stats, log_unused_cache, log_word_mismatches,
+                      read_data, read_lines, read_skeleton, shift_document_empty_nodes, write_data, write_lines)
+from .eml_lexer import split_eml_word
+from .files import output_filename as _output_filename
+from .stats import Stats
 import re
 
 
@@ -12,6 +16,10 @@ logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s
                     level=logging.INFO)
 logger = logging.getLogger()
 
+def _is_empty_eml_word(word):
+    return re.sub(r"</?e\d+>", "", word).startswith("##")
+
+
 def parse_eml_word(text):
     """Parse XML-like formatted word into opening tags, word text, and closing tags.
     
@@ -22,182 +30,138 @@ def parse_eml_word(text):
         tuple: (opening_tags, word_text, closing_tags)
         Example: (['e25821', 'e25756'], 'L2', ['e25756'])
     """
-    import re
-    
-    opening_tags = []
-    closing_tags = []
-    word_text = text
-    
-    # Extract all opening tags from the beginning
-    while word_text.startswith('<') and not word_text.startswith('</'):
-        match = re.match(r'^<([^/>]+)>', word_text)
-        if match:
-            opening_tags.append(match.group(1))
-            word_text = word_text[match.end():]
-        else:
-            break
-    
-    # Extract all closing tags from the end
-    while '</e' in word_text:
-        match = re.search(r'<\/([^>]+)>$', word_text)
-        if match:
-            closing_tags.insert(0, match.group(1))  # Insert at beginning to maintain order
-            word_text = word_text[:match.start()]
-        else:
-            break
-    
-    return opening_tags, word_text, closing_tags
+    return split_eml_word(text)
 
-def convert_eml_file_to_conllu(filename, skeleton_filename, output_filename, zero_mentions=False):
-    if not output_filename:
-        output_filename = filename.replace(".eml", ".conllu")
+def convert_eml_file_to_conllu(filename, skeleton_filename, output_filename, zero_mentions=False, cache_dir=None,
+                               stats=None, report=None, streaming=True):
+    output_filename = _output_filename(filename, output_filename, ".conllu")
+    if stats is None:
+        stats = Stats(keep_documents=bool(report))
+    stats.file = filename
     with open(filename, encoding="utf-8") as f:
-        text_docs = f.read().splitlines()
-        convert_eml_to_conllu(text_docs, skeleton_filename, output_filename, zero_mentions)
+        convert_eml_to_conllu(read_lines(f), skeleton_filename, output_filename, zero_mentions, cache_dir, stats,
+                              streaming)
+    return finish_stats(stats, report)
 
-def convert_eml_to_conllu(text_docs, conllu_skeleton_file, output_file, use_gold_empty_nodes=True):
-    udapi_docs = read_data(conllu_skeleton_file)
+def convert_eml_to_conllu(text_docs, conllu_skeleton_file, output_file, use_gold_empty_nodes=True, cache_dir=None,
+                          stats=None, streaming=True):
+    if stats is None:
+        stats = Stats()
+    if streaming and not isinstance(conllu_skeleton_file, Skeleton):
+        from .conllu_stream import stream_udapi_to_conllu
+        log_unused_cache(cache_dir)
+        with stats.stage("stream"):
+            stream_udapi_to_conllu(text_docs, conllu_skeleton_file, output_file, import_eml_document,
+                                   use_gold_empty_nodes, stats)
+        return
+    text_docs = list(text_docs)
+    with stats.stage("read_skeleton"):
+        udapi_docs = read_skeleton(conllu_skeleton_file, use_gold_empty_nodes, cache_dir)
     # udapi_docs2 = read_data(conllu_skeleton_file)
-    move_head = MoveHead()
-    for doc in udapi_docs:
-        doc._eid_to_entity = {}
     assert len(udapi_docs) == len(text_docs)
-    for text, udapi_doc in zip(text_docs, udapi_docs):
-        words = text.split(" ")
-        udapi_words = [word for word in udapi_doc.nodes]
-        for word in udapi_doc.nodes_and_empty:   
-            word.misc["Entity"] = None
-            word.misc["Bridge"] = None
-            word.misc["SplitAnte"] = None
-            # Remove empty nodes
-            if not use_gold_empty_nodes and word.is_empty():
-                remove_empty_node(word)
-            elif word.is_empty():
-                shift_empty_node_recreate(word)
-        if not use_gold_empty_nodes:
-            j = 1
-            for i in range(len(udapi_words)):
-                word = udapi_words[i]
-                while j < len(words) and re.sub(r"</?e\d+>", "", words[j]).startswith("##"):
-                    w = words[j]
-                    print(f"Creating empty node for word: {words[j]} at position {j}")
-                    word.create_empty_child("dep", after=True)
-                    j += 1
-                j += 1
-        udapi_words = [word for word in udapi_doc.nodes_and_empty]
-        assert len(udapi_words) == len(words)
-        mention_starts = defaultdict(list)
-        entities = {}
-        
-        # Parse XML-like format
-        for i, (word, udapi_word) in enumerate(zip(words, udapi_words)):
-            # Extract the actual word and tags from XML-like format
-            opening_tags, word_text, closing_tags = parse_eml_word(word)
-            
-            if word_text != udapi_word.form:
-                logger.warning(f"WARNING: words do not match. DOC: {udapi_doc.meta['docname']}, word1: {word_text}, word2: {udapi_word.form}")
-            
-            # Process opening tags
-            for eid in opening_tags:
-                if eid not in entities:
-                    entities[eid] = udapi_doc.create_coref_entity(eid=eid)
-                mention_starts[eid].append(i)
-            
-            # Process closing tags
-            for eid in closing_tags:
-                if not mention_starts[eid]:
-                    logger.warning(f"WARNING: Closing mention which was not opened. DOC: {udapi_doc.meta['docname']}, EID: {eid}")
-                    continue
-                entities[eid].create_mention(words=udapi_words[mention_starts[eid][-1]: i + 1])
-                mention_starts[eid].pop()
-
-        udapi.core.coref.store_coref_to_misc(udapi_doc)
-        move_head.run(udapi_doc)
+    with stats.stage("import"):
+        for text, udapi_doc in zip(text_docs, udapi_docs):
+            problems = Counter()
+            import_eml_document(text, udapi_doc, use_gold_empty_nodes, problems)
+            stats.add_document(problems)
     # debug_udapi(udapi_docs, udapi_docs2)
-    with open(output_file, "w", encoding="utf-8") as f:
+    with stats.stage("write"), open(output_file, "w", encoding="utf-8") as f:
         write_data(udapi_docs, f)
 
-def convert_conllu_file_to_eml(filename, output_filename, zero_mentions, blind=False, sequential_ids=True, no_empty_node_form=False):
-    if not output_filename:
-        output_filename = filename.replace(".conllu", ".eml")
-    docs = read_data(filename)
-    convert_to_eml(docs, output_filename, zero_mentions, not blind, sequential_ids, not no_empty_node_form)
+def import_eml_document(text, udapi_doc, use_gold_empty_nodes=True, problems=None):
+    """
+    Replaces the coreference annotation of the udapi skeleton document with the mentions
+    marked in the EML document. The counts of the words, mentions, entities and problems
+    are added to the problems counter.
+    """
+    if problems is None:
+        problems = Counter()
+    udapi_doc._eid_to_entity = {}
+    words = text.split(" ")
+    udapi_words = [word for word in udapi_doc.nodes]
+    for word in udapi_doc.nodes_and_empty:   
+        word.misc["Entity"] = None
+        word.misc["Bridge"] = None
+        word.misc["SplitAnte"] = None
+    if not use_gold_empty_nodes:
+        problems["created_empty_nodes"] += create_empty_nodes(udapi_words, words, "dep", _is_empty_eml_word)
+    udapi_words = [word for word in udapi_doc.nodes_and_empty]
+    assert len(udapi_words) == len(words)
+    mention_starts = defaultdict(list)
+    entities = {}
+    
+    # Parse XML-like format
+    parsed_words = [parse_eml_word(word) for word in words]
+    problems["word_mismatches"] += log_word_mismatches(
+        [word_text for _, word_text, _ in parsed_words], [word.form for word in udapi_words],
+        udapi_doc.meta['docname']
+    )
+    for i, (opening_tags, word_text, closing_tags) in enumerate(parsed_words):
+        # Process opening tags
+        for eid in opening_tags:
+            if eid not in entities:
+                entities[eid] = udapi_doc.create_coref_entity(eid=eid)
+            mention_starts[eid].append(i)
+        
+        # Process closing tags
+        for eid in closing_tags:
+            if not mention_starts[eid]:
+                logger.warning(f"WARNING: Closing mention which was not opened. DOC: {udapi_doc.meta['docname']}, EID: {eid}")
+                problems["unopened_mentions"] += 1
+                continue
+            entities[eid].create_mention(words=udapi_words[mention_starts[eid][-1]: i + 1])
+            mention_starts[eid].pop()
+            problems["mentions"] += 1
+
+    udapi.core.coref.store_coref_to_misc(udapi_doc)
+    MoveHead().run(udapi_doc)
+    problems.update(words=len(words), entities=len(entities))
+
+def convert_conllu_file_to_eml(filename, output_filename, zero_mentions, blind=False, sequential_ids=True, no_empty_node_form=False,
+                               workers=1):
+    output_filename = _output_filename(filename, output_filename, ".eml")
+    if workers == 1:
+        docs = read_data(filename)
+        convert_to_eml(docs, output_filename, zero_mentions, not blind, sequential_ids, not no_empty_node_form)
+        return
+    from .conllu_stream import export_documents
+    lines = export_documents(filename, document_to_eml, (zero_mentions, not blind, sequential_ids, not no_empty_node_form),
+                             workers)
+    write_lines(lines, output_filename)
 
 def convert_to_eml(docs, out_file, solve_empty_nodes=True, mark_entities=True, sequential_ids=False, empty_node_form=True):
-    with open(out_file, "w", encoding="utf-8") as f:
-        for doc in docs:
-            eids = {}
-            out_words = []
-            if solve_empty_nodes:
-                for node in doc.nodes_and_empty:
-                    if node.is_empty():
-                        # node.shift_before_node(node.deps[0]["parent"])
-                        shift_empty_node(node)
-                udapi_words = [word for word in doc.nodes_and_empty]
-            else:
-                udapi_words = [word for word in doc.nodes]
-            for word in udapi_words:
-                out_word = word.form.replace(" ", "_")
-                if word.is_empty():
-                    out_word = "##" + (out_word if out_word != "_" and empty_node_form else "") # empty nodes start with ##
-                mentions = []
-                # Collect mention start and end positions for proper nesting of XML-like tags
-                mention_starts = []
-                mention_ends = []
-                if mark_entities:
-                    for mention in sorted(set(word.coref_mentions)):
-                        if sequential_ids:
-                            if mention.entity.eid not in eids:
-                                eids[mention.entity.eid] = f"e{len(eids) + 1}"
-                            eid = eids[mention.entity.eid]
-                        else:
-                            eid = mention.entity.eid
-                        if "," in mention.span:
-                            reduce_discontinuous_mention(mention)
-                        span = mention.span
-                        mention_start = float(span.split("-")[0])
-                        mention_end = float(span.split("-")[1]) if "-" in span else mention_start
-                        if mention_start == float(word.ord) or mention_end == float(word.ord):
-                            mention_starts.append(mention_start)
-                            mention_ends.append(mention_end)
-                        if mention_start == float(word.ord) and mention_end == float(word.ord):
-                            mentions.append(f"[{eid}]")
-                        elif mention_start == float(word.ord):
-                            mentions.append(f"[{eid}")
-                        elif mention_end == float(word.ord):
-                            mentions.append(f"{eid}]")
-                # Convert bracket format to XML-like tags
-                opening_tags = []
-                closing_tags = []
-                # Span lengths to help with proper nesting
-                opened_ends = []
-                closed_starts = []
-                for mention, start, end in zip(mentions, mention_starts, mention_ends):
-                    if mention.startswith('[') and mention.endswith(']'):
-                        # Single-word mention: [e1]
-                        eid = mention[1:-1]
-                        opening_tags.append(f"<{eid}>")
-                        closing_tags.append(f"</{eid}>")
-                        opened_ends.append(end)
-                        closed_starts.append(start)
-                    elif mention.startswith('['):
-                        # Opening: [e1
-                        eid = mention[1:]
-                        opening_tags.append(f"<{eid}>")
-                        opened_ends.append(end)
-                    else:
-                        # Closing: e1]
-                        eid = mention[:-1]
-                        closing_tags.append(f"</{eid}>")
-                        closed_starts.append(start)
-
-                # Ensure proper nesting by sorting tags:
-                # The closing tag with the highest corresponding start comes first
-                closing_tags = [tag for _, tag in sorted(zip(closed_starts, closing_tags), key=lambda x: (-x[0], x[1]))]
-                # The opening tag with the highest corresponding end comes first
-                opening_tags = [tag for _, tag in sorted(zip(opened_ends, opening_tags), reverse=True)]
-                
-                # Combine tags and word
-                out_words.append(''.join(opening_tags) + out_word + ''.join(closing_tags))
-            f.write(" ".join(out_words) + "\n")
+    write_lines((document_to_eml(doc, solve_empty_nodes, mark_entities, sequential_ids, empty_node_form) for doc in docs),
+                out_file)
+
+
+def document_to_eml(doc, solve_empty_nodes=True, mark_entities=True, sequential_ids=False, empty_node_form=True):
+    """Returns one udapi document in the EML format (one line without the newline)."""
+    out_words = []
+    if solve_empty_nodes:
+        shift_document_empty_nodes(doc)
+    index = MentionIndex(doc, sequential_ids, solve_empty_nodes) if mark_entities else None
+    for i, word in enumerate(doc.nodes_and_empty):
+        if word.is_empty() and not solve_empty_nodes:
+            continue
+        out_word = word.form.replace(" ", "_")
+        if word.is_empty():
+            out_word = "##" + (out_word if out_word != "_" and empty_node_form else "") # empty nodes start with ##
+        # XML-like tags with the span ends (starts) of the mentions for proper nesting
+        opening_tags = []
+        closing_tags = []
+        if index is not None:
+            for eid, opens, closes, start, end in index.boundaries.get(i, ()):
+                if opens:
+                    opening_tags.append((end, f"<{eid}>"))
+                if closes:
+                    closing_tags.append((start, f"</{eid}>"))
+
+        # Ensure proper nesting by sorting tags:
+        # The closing tag with the highest corresponding start comes first
+        closing_tags = [tag for _, tag in sorted(closing_tags, key=lambda x: (-x[0], x[1]))]
+        # The opening tag with the highest corresponding end comes first
+        opening_tags = [tag for _, tag in sorted(opening_tags, reverse=True)]
 
+        # Combine tags and word
+        out_words.append(''.join(opening_tags) + out_word + ''.join(closing_tags))
+    return " ".join(out_words)
@@ -0,0 +1,228 @@
+"""
+Single-pass lexer of the EML (XML-like) format of the LLM outputs, e.g.
+`<e1>Los jugadores de <e2>el Espanyol</e2></e1> aseguraron`.
+
+lex_eml() repairs the missing brackets of the entity tags and the whitespace around them
+and splits the document into words with their forms and tags in one left-to-right scan.
+The result is the same as of the former regex cascade of the cleaner:
+
+- a missing ">" is added after `<e1` and `</e1`, a missing "<" before `e1>` and `/e1>`,
+- closing and opening tags are separated from the surrounding words, opening tags are
+  attached to the next word and closing tags to the previous one,
+- whitespace is collapsed into single spaces,
+
+including its quirks (e.g. of the non-overlapping matches, `<e1> <e2> <e3>w` becomes
+`<e1><e2> <e3>w`). A tag is `<e` or `</e` followed by word characters and ">"; only the
+tags with numeric ids (`<e12>`) are entity tags, the others are kept in the word forms.
+
+split_eml_word() splits one word of a cleaned EML document into its opening tags, text
+and closing tags.
+"""
+import re
+
+# a word with well-formed tags: opening tags, text without brackets and closing tags
+_WORD = re.compile(r"((?:<e\d+>)*)([^<>]*)((?:</e\d+>)*)")
+# a complete entity tag, a run of word characters, a bracket or a slash, or other characters
+_LEXEME = re.compile(r"<(/?)e(\d+)>|(\w+)|([<>/])|([^\w<>/]+)")
+_TEXT, _OPENING, _CLOSING = range(3)
+
+
+def _scan(document):
+    """
+    Returns the tags and the texts between them, with the missing brackets of the tags
+    added, each as (kind, text, entity_id, space): the entity id of a tag with a numeric
+    id (otherwise None) and whether whitespace precedes it.
+    """
+    items = []
+    for chunk in document.split():
+        if "<" not in chunk and ">" not in chunk:
+            items.append((_TEXT, chunk, None, True))
+            continue
+        match = _WORD.fullmatch(chunk)
+        if match is None:
+            _scan_chunk(chunk, items)
+            continue
+        opening, text, closing = match.groups()
+        space = True
+        if opening:
+            for entity_id in opening[2:-1].split("><e"):
+                items.append((_OPENING, f"<e{entity_id}>", entity_id, space))
+                space = False
+        if text:
+            items.append((_TEXT, text, None, space))
+            space = False
+        if closing:
+            for entity_id in closing[3:-1].split("></e"):
+                items.append((_CLOSING, f"</e{entity_id}>", entity_id, space))
+                space = False
+    return items
+
+
+def _scan_chunk(chunk, items):
+    """Adds the items of a chunk of the document between whitespace with broken tags."""
+    text = []
+    space = True
+    lexemes = _LEXEME.findall(chunk)
+    n = len(lexemes)
+    k = 0
+    while k < n:
+        slash, entity_id, run, char, other = lexemes[k]
+        if other:
+            text.append(other)
+        elif char:
+            text.append(char)
+        elif entity_id:
+            if text:
+                items.append((_TEXT, "".join(text), None, space))
+                text = []
+                space = False
+            items.append((_CLOSING if slash else _OPENING, f"<{slash}e{entity_id}>", entity_id, space))
+            space = False
+        else:
+            before = lexemes[k - 1][3] if k else ""
+            opened = before == "<"
+            slashed = before == "/"
+            slash_opened = slashed and k > 1 and lexemes[k - 2][3] == "<"
+            closed = k + 1 < n and lexemes[k + 1][3] == ">"
+            tag = len(run) > 1 and run[0] == "e"
+            kind = None
+            # a missing ">" is added after `<e1` and `</e1`
+            if closed or tag and (opened or slash_opened):
+                # a "<" is added before the first `e1>` of the run not preceded by "<" or "/"
+                start = run.find("e", 1 if opened or slashed else 0, len(run) - 1)
+                if start >= 0:
+                    if start:
+                        text.append(run[:start])
+                    run = run[start:]
+                    kind = _OPENING
+                elif tag and opened:
+                    text.pop()
+                    kind = _OPENING
+                elif tag and slashed:
+                    # a missing "<" is added before `/e1>`
+                    del text[-2 if slash_opened else -1:]
+                    kind = _CLOSING
+            if kind is None:
+                text.append(run)
+            else:
+                if text:
+                    items.append((_TEXT, "".join(text), None, space))
+                    text = []
+                    space = False
+                entity_id = run[1:]
+                items.append((kind, ("<" if kind == _OPENING else "</") + run + ">",
+                              entity_id if entity_id.isdecimal() else None, space))
+                space = False
+                if closed:
+                    k += 1
+        k += 1
+    if text:
+        items.append((_TEXT, "".join(text), None, space))
+
+
+def lex_eml(document):
+    """
+    Returns the words of the EML document with the tags and whitespace repaired, each as
+    (text, form, tags): the word, the word without the entity tags and the entity tags
+    in their order in the word, each (opens, entity_id, closes).
+    """
+    if "<" not in document and ">" not in document:
+        return [(word, word, ()) for word in document.split()]
+    words = []
+    pieces, form, tags = [], [], []
+    consumed_opening = consumed_closing = False
+    opening_chain = closing_chain = 0
+    previous = None
+    for kind, text, entity_id, space in _scan(document):
+        if previous == _TEXT and kind == _TEXT:
+            # only whitespace separates two texts
+            consumed_opening = consumed_closing = False
+            opening_chain = closing_chain = 0
+            words.append(_word(pieces, form, tags))
+            pieces, form, tags = [text], [text], []
+            continue
+        if previous is not None:
+            next_consumed_opening = next_consumed_closing = False
+            if previous == _CLOSING and kind == _OPENING:
+                space = True
+            elif not space and previous == _TEXT and kind == _OPENING:
+                space = pieces[-1][-1] != ">"
+            elif not space and previous == _CLOSING and kind == _TEXT:
+                space = text[0] != "<"
+            # the whitespace after an opening tag is removed, unless the tag itself
+            # followed one that way
+            if space and previous == _OPENING and not consumed_opening:
+                space = False
+                next_consumed_opening = kind == _OPENING
+            # the whitespace before a closing tag is removed, unless it follows
+            # a closing tag joined that way
+            if space and kind == _CLOSING and not consumed_closing:
+                space = False
+                next_consumed_closing = True
+            # the tags are joined in pairs
+            if previous == _OPENING and kind == _OPENING:
+                if not opening_chain % 2:
+                    space = False
+                opening_chain += 1
+            else:
+                opening_chain = 0
+            if previous == _CLOSING and kind == _CLOSING:
+                if not closing_chain % 2:
+                    space = False
+                closing_chain += 1
+            else:
+                closing_chain = 0
+            consumed_opening, consumed_closing = next_consumed_opening, next_consumed_closing
+            if space:
+                words.append(_word(pieces, form, tags))
+                pieces, form, tags = [], [], []
+        pieces.append(text)
+        if entity_id is None:
+            form.append(text)
+        else:
+            tags.append((kind == _OPENING, entity_id, kind == _CLOSING))
+        previous = kind
+    if pieces:
+        words.append(_word(pieces, form, tags))
+    return words
+
+
+def _word(pieces, form, tags):
+    return "".join(pieces), "".join(form), tuple(tags)
+
+
+def normalize_eml(document):
+    """Returns the EML document with the tags and whitespace repaired (see lex_eml)."""
+    return " ".join(text for text, _, _ in lex_eml(document))
+
+
+def split_eml_word(word):
+    """
+    Splits a word of a cleaned EML document into its opening tags, text and closing tags,
+    e.g. `<e25821><e25756>L2</e25756>` into (["e25821", "e25756"], "L2", ["e25756"]).
+
+    The leading `<...>` tags are opening tags and the trailing `</...>` tags closing
+    tags (while the rest contains `</e`), whatever their names.
+    """
+    opening_tags = []
+    start = 0
+    while word.startswith("<", start) and not word.startswith("</", start):
+        end = word.find(">", start + 1)
+        if end <= start + 1 or word.find("/", start + 1, end) >= 0:
+            break
+        opening_tags.append(word[start + 1:end])
+        start = end + 1
+
+    closing_tags = []
+    end = len(word)
+    while word.find("</e", start, end) >= 0:
+        # the last tag ends the word (or precedes its final newline)
+        stop = end - 1 if word.endswith("\n", start, end) else end
+        if not word.endswith(">", start, stop):
+            break
+        tag_start = word.find("</", max(word.rfind(">", start, stop - 1) + 1, start), stop - 2)
+        if tag_start < 0:
+            break
+        closing_tags.insert(0, word[tag_start + 2:stop - 1])
+        end = tag_start
+    return opening_tags, word[start:end], closing_tags
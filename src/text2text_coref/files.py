@@ -0,0 +1,16 @@
+import os
+
+
+def output_filename(filename, output_filename, suffix):
+    """
+    Returns the output file name: as given, or the input file name with the extension
+    replaced by the suffix. Raises ValueError when the output would be the input file,
+    which is streamed while the output is written.
+    """
+    if not output_filename:
+        output_filename = os.path.splitext(filename)[0] + suffix
+    if os.path.abspath(output_filename) == os.path.abspath(filename) or (
+        os.path.exists(output_filename) and os.path.exists(filename) and os.path.samefile(output_filename, filename)
+    ):
+        raise ValueError(f"The output file {output_filename} would overwrite the input file")
+    return output_filename
@@ -0,0 +1,185 @@
+"""
+Incremental cleaning of an LLM output streamed in chunks (e.g. tokens of a generation).
+
+The cleaned words are emitted as soon as neither the rest of the output nor the end of
+the stream can change them, and the whole output ends up the same as of the batch
+cleaning (_clean_document). A word is final when:
+
+- it is complete, i.e. followed by whitespace (for EML, also not followed by a broken
+  tag that _correct_basic_eml_syntax would attach to it),
+- its alignment is final, i.e. the window of its sentence is complete (only the
+  "sentence" aligner is supported: the other aligners align the whole document, where a
+  word repeated later in the output or the gold can still take over the alignment of any
+  word, so nothing could be emitted before the end of the stream), and
+- the tags opened in its sentence up to the word are closed, so that _correct_tags does
+  not change it when the sentence ends.
+
+At the end of the stream, only the remaining sentence windows are aligned.
+"""
+import re
+from collections import defaultdict
+from itertools import chain
+
+from .output_cleaner import (_SENTENCE_LOOKAHEAD, _Word, _align_sentence_window, _correct_tags, _correct_tags_eml,
+                             _gold_word, _parse_eml_document, _parse_word, _sentence_window_end)
+
+# broken or complete tags that _correct_basic_eml_syntax joins with a word across whitespace
+_EML_OPENING_END = re.compile(r"(?:<e\w+>?|e\w+>)$")
+_EML_CLOSING_START = re.compile(r"^(?:</e\w|/e\w+>)")
+_TOKEN = re.compile(r"\S+")
+
+
+def _first_unclosed(sentence):
+    """
+    Returns the index of the first word of a (partial) sentence with an opening tag
+    that is not closed yet, or the length of the sentence. The tag correction of the
+    words before it does not depend on the rest of the sentence.
+    """
+    stacks = defaultdict(list)
+    for idx, word in enumerate(sentence):
+        for tag in word.tags or ():
+            if tag is None:
+                continue
+            opens, entity_id, closes = tag
+            if opens and closes:
+                continue
+            if opens:
+                stacks[entity_id].append(idx)
+            elif closes and stacks[entity_id]:
+                stacks[entity_id].pop()
+    return min(chain.from_iterable(stacks.values()), default=len(sentence))
+
+
+class IncrementalCleaner:
+    """
+    Cleans one document of an LLM output fed in chunks against its gold document (as
+    read by read_conllu). feed() returns the cleaned words that became final, finish()
+    the rest of them. The cleaned document is then in `result`, the same as returned by
+    _clean_document for the whole output with the "sentence" aligner, the only one
+    supported.
+
+        cleaner = IncrementalCleaner(gold_doc, gold_zeros=True)
+        for chunk in generation:
+            show(cleaner.feed(chunk))
+        show(cleaner.finish())
+    """
+
+    def __init__(self, gold_tok2, gold_zeros=False, format="txt", aligner="sentence", lookahead=_SENTENCE_LOOKAHEAD):
+        if aligner != "sentence":
+            raise ValueError(f"Unsupported aligner {aligner} for incremental cleaning, only sentence aligns "
+                             f"before the end of the stream")
+        self.gold_tok2 = gold_tok2
+        self.gold_zeros = gold_zeros
+        self.format = format
+        self.aligner = aligner
+        self.lookahead = lookahead
+        self.result = None
+
+        # the raw text after the last complete (and for EML safely separated) word
+        self._pending = ""
+        self._words = []
+        self._forms = []
+        self._empty = []
+        # the words with the final alignment
+        self._aligned = []
+        # the sentence alignment
+        self._window_sentence = 0
+        self._window_offset = 0
+        # the tag correction of the gold sentences
+        self._sentence = 0
+        self._sentence_start = 0
+        self._sentence_emitted = 0
+        self._emitted = []
+
+    def feed(self, chunk):
+        """Adds a chunk of the output and returns the cleaned words that became final."""
+        if self.result is not None:
+            raise ValueError("The stream has already finished")
+        self._pending += chunk
+        self._parse_pending()
+        self._align_sentences()
+        return self._correct()
+
+    def finish(self):
+        """Ends the stream and returns the remaining cleaned words."""
+        if self.result is not None:
+            return []
+        self._parse_pending(final=True)
+        self._align_sentences(final=True)
+        rest = self._correct()
+        self.result = " ".join(self._emitted)
+        return rest
+
+    def _parse_pending(self, final=False):
+        tokens = list(_TOKEN.finditer(self._pending))
+        if not final and tokens and tokens[-1].end() == len(self._pending):
+            # the last word may continue in the next chunk
+            tokens.pop()
+        n = len(tokens)
+        if self.format == "eml" and n and not final:
+            # only cut where the basic EML correction keeps the whitespace, which
+            # depends on the next word too
+            n -= 1
+            while n and (_EML_OPENING_END.search(tokens[n - 1].group())
+                         or _EML_CLOSING_START.match(tokens[n].group())):
+                n -= 1
+        if not n:
+            return
+        cut = tokens[n - 1].end()
+        text = self._pending[:cut]
+        self._pending = self._pending[cut:]
+        if self.format == "eml":
+            words = _parse_eml_document(text)
+        else:
+            words = [_parse_word(word, self.format) for word in text.split()]
+        for word in words:
+            self._words.append(word)
+            self._forms.append(word.form)
+            self._empty.append(False if self.gold_zeros else word.is_empty)
+
+    def _align_sentences(self, final=False):
+        # the last sentence takes all the remaining words, so it ends only with the stream
+        while self._window_sentence < len(self.gold_tok2) - (not final):
+            sentence = self.gold_tok2[self._window_sentence]
+            offset = self._window_offset
+            last = self._window_sentence == len(self.gold_tok2) - 1
+            end, count = _sentence_window_end(self._empty, offset, len(sentence) + self.lookahead)
+            if last:
+                end = len(self._words)
+            elif not final and count < len(sentence) + self.lookahead:
+                return
+            result, _, skipped = _align_sentence_window(
+                self._forms[offset:end], sentence, self._words[offset:end], self._empty[offset:end], last
+            )
+            self._aligned.extend(word if isinstance(word, _Word) else _gold_word(word) for word in result)
+            self._window_offset += skipped
+            self._window_sentence += 1
+
+    def _correct(self):
+        start = len(self._emitted)
+        while self._sentence < len(self.gold_tok2):
+            # the sentences are cut out of the aligned words the same way as in _clean_document
+            length = len(self.gold_tok2[self._sentence])
+            words = self._aligned[self._sentence_start:]
+            if self.gold_zeros:
+                end = min(length, len(words))
+                complete = end == length
+            else:
+                end, count = _sentence_window_end([word.is_empty for word in words], 0, length)
+                complete = count == length
+            sentence = words[:end]
+            final = len(sentence) if complete else _first_unclosed(sentence)
+            if final > self._sentence_emitted:
+                corrected = _correct_tags_eml(sentence) if self.format == "eml" else _correct_tags(sentence)
+                emitted = self._emitted[len(self._emitted) - self._sentence_emitted:]
+                if corrected[:self._sentence_emitted] != emitted:
+                    raise RuntimeError(f"The emitted words {emitted} changed to "
+                                       f"{corrected[:self._sentence_emitted]} later in the sentence")
+                self._emitted.extend(corrected[self._sentence_emitted:final])
+                self._sentence_emitted = final
+            if not complete:
+                break
+            self._sentence += 1
+            self._sentence_start += len(sentence)
+            self._sentence_emitted = 0
+        return self._emitted[start:]
@@ -1,10 +1,13 @@
 from text2text_coref.convert import shift_empty_node_recreate
 
-from .convert import shift_empty_node, reduce_discontinuous_mention
+from .convert import MentionIndex, shift_document_empty_nodes
 import udapi
 from collections import defaultdict
+import json
 import logging
+import os
 from .convert import read_data
+from .files import output_filename as _output_filename
 import pprint
 from compact_json import Formatter
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
@@ -14,122 +17,212 @@ logger = logging.getLogger()
 
 
 def convert_to_json(docs, out_file, solve_empty_nodes=True, mark_entities=True, sequential_ids=False, empty_node_form=True):
-    output_data = []
-    for doc in docs:
-        eids = {}
-        out_words = []
-        if solve_empty_nodes:
-            for node in doc.nodes_and_empty:
-                if node.is_empty():
-                    shift_empty_node(node)
-            udapi_words = [word for word in doc.nodes_and_empty]
-        else:
-            udapi_words = [word for word in doc.nodes]
-        for word in udapi_words:
-            out_word = word.form.replace(" ", "_")
-            if word.is_empty():
-                out_word = "##" + (out_word if out_word != "_" and empty_node_form else "") # empty nodes start with ##
-            out_words.append(out_word)
-        clusters_token_offsets = None
-        clusters_text_mentions = None
-        if mark_entities:
-            node2id = {node: i for i, node in enumerate(doc.nodes_and_empty)}
-            clusters_token_offsets = []
-            clusters_text_mentions = []
-            for entity in doc.coref_entities:
-                entity_mentions = []
-                entity_mention_offsets = []
-                for mention in entity.mentions:
-                    if "," in mention.span:
-                        reduce_discontinuous_mention(mention)
-                    span_start = node2id[mention.words[0]]
-                    span_end = node2id[mention.words[-1]]
-                    entity_mention_offsets.append([span_start, span_end])
-                    entity_mentions.append(" ".join([word.form if not word.is_empty() else "##" + (word.form if word.form != "_" and empty_node_form else "") for word in mention.words]))
-                if sequential_ids:
-                    if entity.eid not in eids:
-                        eids[entity.eid] = f"e{len(eids) + 1}"
-                    eid = eids[entity.eid]
-                else:
-                    eid = entity.eid
-                clusters_token_offsets.append(entity_mention_offsets)
-                clusters_text_mentions.append(entity_mentions)
-        output_data.append({
-            "doc_id": doc.meta["docname"],
-            "tokens": out_words,
-            "clusters_token_offsets": clusters_token_offsets,
-            "clusters_text_mentions": clusters_text_mentions
-        })
+    output_data = [document_to_json(doc, solve_empty_nodes, mark_entities, sequential_ids, empty_node_form) for doc in docs]
+    write_json(output_data, out_file)
+
+def write_json(output_data, out_file):
     formatter = Formatter()
     formatter.ensure_ascii = False
     formatter.dump(output_data, out_file)
 
-def convert_conllu_file_to_json(filename, output_filename, zero_mentions, blind=False, sequential_ids=True, no_empty_node_form=False):
-    if not output_filename:
-        output_filename = filename.replace(".conllu", ".json")
-    docs = read_data(filename)
-    convert_to_json(docs, output_filename, zero_mentions, not blind, sequential_ids, not no_empty_node_form)
-
-def convert_json_to_conllu(json_filename, conllu_skeleton_filename, output_filename, use_gold_empty_nodes=True):
-    import json
-    from .convert import read_data, write_data, remove_empty_node
-    from udapi.core.document import Document
-    from udapi.block.corefud.movehead import MoveHead
+def write_jsonl(output_data, out_file):
+    """Writes the JSON documents one per line (JSON Lines) as they come."""
+    with open(out_file, "w", encoding="utf-8") as f:
+        for doc in output_data:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
 
+def iter_jsonl(json_filename):
+    """Yields the JSON documents of a JSON Lines file one at a time (skipping empty lines)."""
     with open(json_filename, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    udapi_docs = read_data(conllu_skeleton_filename)
-    move_head = MoveHead()
-    for doc in udapi_docs:
-        doc._eid_to_entity = {}
-    assert len(udapi_docs) == len(data)
-    for doc, udapi_doc in zip(data, udapi_docs):
-        words = doc["tokens"]
-        udapi_words = [word for word in udapi_doc.nodes]
-        for word in udapi_doc.nodes_and_empty:
-            word.misc = {}
-            # Remove empty nodes
-            if not use_gold_empty_nodes and word.is_empty():
-                remove_empty_node(word)
-            elif word.is_empty():
-                shift_empty_node_recreate(word)
-                # shift_empty_node(word)
-
-        if not use_gold_empty_nodes:
-            j = 1
-            for i in range(len(udapi_words)):
-                word = udapi_words[i]
-                while j < len(words) and words[j].startswith("##"):
-                    word.create_empty_child("_", after=True)
-                    j += 1
-                j += 1
-        udapi_words = [word for word in udapi_doc.nodes_and_empty]
-        for i in range(len(udapi_words)):
-            if udapi_words[i].form != words[i].split("|")[0]:
-                logger.warning(f"WARNING: words do not match. DOC: {udapi_doc.meta['docname']}, word1: {words[i].split('|')[0]}, word2: {udapi_words[i].form}, i: {i}")
-
-        assert len(udapi_words) == len(words)
-        entities = {}
-        for entity in doc["clusters_token_offsets"]:
-            eid = f"e{len(entities) + 1}"
-            entities[eid] = udapi_doc.create_coref_entity(eid=eid)
-            for mention_offsets in entity:
-                span_start = mention_offsets[0]
-                span_end = mention_offsets[1]
-                if span_end >= len(udapi_words):
-                    logger.warning(f"WARNING: mention span end {span_end} is out of bounds for document {udapi_doc.meta['docname']} with {len(udapi_words)} words. Adjusting span end to {len(udapi_words) - 1}.")
-                    span_end = len(udapi_words) - 1
-                if span_start >= len(udapi_words):
-                    logger.warning(f"WARNING: mention span start {span_start} is out of bounds for document {udapi_doc.meta['docname']} with {len(udapi_words)} words. Skipping this mention.")
-                    continue
-                while udapi_words[span_end].root != udapi_words[span_start].root and span_end > span_start:
-                    span_end -= 1
-                entities[eid].create_mention(words=udapi_words[span_start: span_end + 1])
-        udapi.core.coref.store_coref_to_misc(udapi_doc)
-        move_head.run(udapi_doc)
-    if not output_filename:
-        output_filename = output_filename.replace(".json", ".conllu")
-    with open(output_filename, "w", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def is_jsonl(filename, jsonl=None):
+    """Whether the file is in JSON Lines: as given, otherwise by the .jsonl extension."""
+    return filename.endswith(".jsonl") if jsonl is None else jsonl
+
+def match_documents(json_docs, udapi_docs):
+    """
+    Yields the pairs of the JSON documents and the udapi documents with the same doc_id
+    (docname), in the order of the udapi documents. The JSON documents are read ahead
+    only as far as the next match, so documents in the same order are matched in
+    bounded memory.
+    """
+    json_docs = iter(json_docs)
+    pending = {}
+    for udapi_doc in udapi_docs:
+        docname = udapi_doc.meta.get("docname")
+        while docname not in pending:
+            doc = next(json_docs, None)
+            if doc is None:
+                raise ValueError(f"No JSON document with doc_id {docname}")
+            if doc.get("doc_id") in pending:
+                raise ValueError(f"JSON document with doc_id {doc.get('doc_id')} given twice")
+            pending[doc.get("doc_id")] = doc
+        yield pending.pop(docname), udapi_doc
+    unmatched = list(pending) + [doc.get("doc_id") for doc in json_docs]
+    if unmatched:
+        raise ValueError(f"JSON documents not in the skeleton: {', '.join(map(str, unmatched[:10]))}")
+
+def document_to_json(doc, solve_empty_nodes=True, mark_entities=True, sequential_ids=False, empty_node_form=True):
+    """Returns one udapi document as the JSON object of the clustered format."""
+    out_words = []
+    if solve_empty_nodes:
+        shift_document_empty_nodes(doc)
+        udapi_words = [word for word in doc.nodes_and_empty]
+    else:
+        udapi_words = [word for word in doc.nodes]
+    for word in udapi_words:
+        out_word = word.form.replace(" ", "_")
+        if word.is_empty():
+            out_word = "##" + (out_word if out_word != "_" and empty_node_form else "") # empty nodes start with ##
+        out_words.append(out_word)
+    clusters_token_offsets = None
+    clusters_text_mentions = None
+    if mark_entities:
+        # the entity ids are not part of the format
+        index = MentionIndex(doc)
+        clusters_token_offsets = []
+        clusters_text_mentions = []
+        for cluster in index.clusters:
+            clusters_token_offsets.append([[first, last] for first, last, _ in cluster])
+            clusters_text_mentions.append([" ".join([word.form if not word.is_empty() else "##" + (word.form if word.form != "_" and empty_node_form else "") for word in words]) for _, _, words in cluster])
+    return {
+        "doc_id": doc.meta["docname"],
+        "tokens": out_words,
+        "clusters_token_offsets": clusters_token_offsets,
+        "clusters_text_mentions": clusters_text_mentions
+    }
+
+def convert_conllu_file_to_json(filename, output_filename, zero_mentions, blind=False, sequential_ids=True, no_empty_node_form=False,
+                                workers=1, jsonl=None):
+    output_filename = _output_filename(filename, output_filename, ".jsonl" if jsonl else ".json")
+    jsonl = is_jsonl(output_filename, jsonl)
+    args = (zero_mentions, not blind, sequential_ids, not no_empty_node_form)
+    if workers != 1:
+        from .conllu_stream import export_documents
+        # the documents are converted in parallel, the formatting of the whole JSON file stays serial
+        output_data = export_documents(filename, document_to_json, args, workers)
+    elif jsonl:
+        from .conllu_stream import stream_data
+        output_data = (document_to_json(doc, *args) for doc in stream_data(filename))
+    else:
+        convert_to_json(read_data(filename), output_filename, *args)
+        return
+    if jsonl:
+        write_jsonl(output_data, output_filename)
+    else:
+        write_json(list(output_data), output_filename)
+
+def convert_json_to_conllu(json_filename, conllu_skeleton_filename, output_filename, use_gold_empty_nodes=True,
+                           cache_dir=None, stats=None, report=None, jsonl=None, streaming=True):
+    """
+    Imports the clusters of the JSON documents into the CoNLL-U skeleton. A JSON Lines file
+    (jsonl, by default by the .jsonl extension) is parsed one line at a time and its documents
+    are matched with the skeleton documents by their doc_id; with streaming, each skeleton
+    document is then read, imported and written before the next one. The documents are
+    then matched while the output is written, so when they do not match (or the import
+    fails), the partial output file is deleted before the error is raised.
+    """
+    import time
+    from collections import Counter
+    from .convert import Skeleton, finish_stats, log_unused_cache, read_skeleton, write_data
+    from .stats import Stats
+
+    if stats is None:
+        stats = Stats(keep_documents=bool(report))
+    stats.file = json_filename
+    jsonl = is_jsonl(json_filename, jsonl)
+    output_filename = _output_filename(json_filename, output_filename, ".conllu")
+
+    if jsonl and streaming and not isinstance(conllu_skeleton_filename, Skeleton):
+        from .conllu_stream import stream_skeleton
+        log_unused_cache(cache_dir)
+        try:
+            with stats.stage("stream"), open(output_filename, "w", encoding="utf-8") as f:
+                udapi_docs = stream_skeleton(conllu_skeleton_filename, use_gold_empty_nodes)
+                for doc, udapi_doc in match_documents(iter_jsonl(json_filename), udapi_docs):
+                    problems = Counter()
+                    import_json_document(doc, udapi_doc, use_gold_empty_nodes, problems)
+                    stats.add_document(problems)
+                    write_data([udapi_doc], f)
+        except BaseException:
+            # do not leave the documents written before the failure as if converted
+            if os.path.exists(output_filename):
+                os.remove(output_filename)
+            raise
+        return finish_stats(stats, report)
+
+    if jsonl:
+        data = iter_jsonl(json_filename)
+    else:
+        with open(json_filename, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+    with stats.stage("read_skeleton"):
+        udapi_docs = read_skeleton(conllu_skeleton_filename, use_gold_empty_nodes, cache_dir)
+    if jsonl:
+        pairs = match_documents(data, udapi_docs)
+    else:
+        assert len(udapi_docs) == len(data)
+        pairs = zip(data, udapi_docs)
+    import_start = time.perf_counter()
+    for doc, udapi_doc in pairs:
+        problems = Counter()
+        import_json_document(doc, udapi_doc, use_gold_empty_nodes, problems)
+        stats.add_document(problems)
+    stats.stages["import"] += time.perf_counter() - import_start
+    with stats.stage("write"), open(output_filename, "w", encoding="utf-8") as f:
         write_data(udapi_docs, f)
+    return finish_stats(stats, report)
+
+def import_json_document(doc, udapi_doc, use_gold_empty_nodes=True, problems=None):
+    """
+    Replaces the coreference annotation of the udapi skeleton document with the clusters
+    of the JSON document. The counts of the words, mentions, entities and problems are
+    added to the problems counter.
+    """
+    from collections import Counter
+    from .convert import create_empty_nodes, log_word_mismatches
+    from udapi.block.corefud.movehead import MoveHead
+
+    if problems is None:
+        problems = Counter()
+    udapi_doc._eid_to_entity = {}
+    words = doc["tokens"]
+    udapi_words = [word for word in udapi_doc.nodes]
+    for word in udapi_doc.nodes_and_empty:
+        word.misc = {}
+
+    if not use_gold_empty_nodes:
+        create_empty_nodes(udapi_words, words, "_")
+    udapi_words = [word for word in udapi_doc.nodes_and_empty]
+    problems["word_mismatches"] += log_word_mismatches(
+        [word.split("|")[0] for word in words], [word.form for word in udapi_words], udapi_doc.meta['docname']
+    )
 
+    assert len(udapi_words) == len(words)
+    entities = {}
+    for entity in doc["clusters_token_offsets"]:
+        eid = f"e{len(entities) + 1}"
+        entities[eid] = udapi_doc.create_coref_entity(eid=eid)
+        for mention_offsets in entity:
+            span_start = mention_offsets[0]
+            span_end = mention_offsets[1]
+            if span_end >= len(udapi_words):
+                logger.warning(f"WARNING: mention span end {span_end} is out of bounds for document {udapi_doc.meta['docname']} with {len(udapi_words)} words. Adjusting span end to {len(udapi_words) - 1}.")
+                problems["clipped_mentions"] += 1
+                span_end = len(udapi_words) - 1
+            if span_start >= len(udapi_words):
+                logger.warning(f"WARNING: mention span start {span_start} is out of bounds for document {udapi_doc.meta['docname']} with {len(udapi_words)} words. Skipping this mention.")
+                problems["skipped_mentions"] += 1
+                continue
+            while udapi_words[span_end].root != udapi_words[span_start].root and span_end > span_start:
+                span_end -= 1
+            entities[eid].create_mention(words=udapi_words[span_start: span_end + 1])
+            problems["mentions"] += 1
+    udapi.core.coref.store_coref_to_misc(udapi_doc)
+    MoveHead().run(udapi_doc)
+    problems.update(words=len(words), entities=len(entities))
+    return problems
@@ -1,72 +1,156 @@
-from collections import defaultdict
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from itertools import chain
-from typing import List
+from typing import Iterable, Iterator, List
+import os
 import re
 import logging
+import time
+
+from .cache import load_cached, store_cached
+from .eml_lexer import lex_eml, normalize_eml
+from .files import output_filename as _output_filename
+from .stats import Stats
 
 logger = logging.getLogger(__name__)
 
 
-def _correct_tags(tok_sentence):
+_EML_TAG = re.compile(r"<(/?)e(\d+)>")
+_TXT_TAG = re.compile(r"(\[?)e(\d+)(]?)")
+
+
+class _Word:
+    """
+    A word of the LLM output parsed once for all the cleaning stages.
+
+    `form` is the word without tags and `tags` the parsed entity tags in their
+    order in the word, each a tuple (opens, entity_id, closes), or None for a
+    tag that cannot be parsed. `tags` is None when the tags have to be stripped
+    (multiple pipes in a txt word). `text` is the original word.
+    """
+    __slots__ = ("text", "form", "tags", "is_empty")
+
+    def __init__(self, text, form, tags, is_empty):
+        self.text = text
+        self.form = form
+        self.tags = tags
+        self.is_empty = is_empty
+
+
+def _parse_word(word, format="txt"):
+    """
+    Parses one word of the LLM output in the txt (`form|[e1,e2]`) or eml
+    (`<e1>form</e1>`) format.
+    """
+    if format == "eml":
+        if "<" not in word:
+            return _Word(word, word, (), word.startswith("##"))
+
+        pieces = []
+        tags = []
+        pos = 0
+        for match in _EML_TAG.finditer(word):
+            pieces.append(word[pos:match.start()])
+            pos = match.end()
+            closing, entity_id = match.groups()
+            tags.append((not closing, entity_id, bool(closing)))
+        pieces.append(word[pos:])
+        form = "".join(pieces)
+        return _Word(word, form, tuple(tags), form.startswith("##"))
+
+    splits = word.split("|")
+    form = splits[0]
+    is_empty = (_EML_TAG.sub("", form) if "<" in form else form).startswith("##")
+
+    if len(splits) == 1:
+        tags = ()
+    elif len(splits) == 2:
+        tags = []
+        for tag in splits[1].split(","):
+            match = _TXT_TAG.match(tag)
+            if match:
+                left_bracket, entity_id, right_bracket = match.groups()
+                tags.append((bool(left_bracket), entity_id, bool(right_bracket)))
+            else:
+                tags.append(None)
+        tags = tuple(tags)
+    else:
+        tags = None
+
+    return _Word(word, form, tags, is_empty)
+
+
+def _gold_word(word):
+    """
+    Wraps a gold word copied to the output into an untagged word.
+    """
+    return _Word(word, word, (), word.startswith("##"))
+
+
+def _correct_tags(tok_sentence, problems=None):
     """
     This function takes a tokenized sentence and ensures that all tags are closed.
     When a tag is not closed or opened properly, the entity is converted into a
     single-token tag.
 
-    Tags that cannot be parsed are thrown out.
+    Tags that cannot be parsed are thrown out. The numbers of repaired and
+    invalid tags are added to the problems counter.
     """
     num_wrong_para = 0
+    num_invalid = 0
 
     if not tok_sentence:
         return []
 
+    # the messages are formatted only when they are logged
+    debug = logging.root.isEnabledFor(logging.DEBUG)
     entity_stacks = defaultdict(lambda: [])
     clean_toks = []
 
     for word_idx, word in enumerate(tok_sentence):
-        splits = word.split("|")
-
-        if len(splits) == 1:
-            clean_toks.append(word)
-
-        elif len(splits) == 2:
-            tags = splits[1].split(",")
-
-            ptags = map(lambda x: re.match(r"(\[?)e(\d+)(]?)", x), tags)
-            ptags = map(lambda x: x.groups() if x else ("", "", ""), ptags)
-
-            clean_tags = []
-
-            for left_bracket, entity_id, right_bracket in ptags:
-                tag = f"{left_bracket}e{entity_id}{right_bracket}"
+        if not word.tags:
+            if word.tags is None:
+                num_invalid += 1
+                if debug:
+                    logging.debug(f"warning: multiple pipes in word {word.text}- stripping tags")
+            clean_toks.append((word.form, []))
+            continue
+
+        clean_tags = []
+
+        for tag in word.tags:
+            if tag is None:
+                num_invalid += 1
+                if debug:
+                    logging.debug(f"warning: completely invalid tag in: {word.text}")
+                continue
 
-                if left_bracket and right_bracket:
-                    clean_tags.append(tag)
+            left_bracket, entity_id, right_bracket = tag
 
-                elif left_bracket:
-                    entity_stacks[entity_id].append((word_idx, len(clean_tags)))
-                    clean_tags.append(tag)
+            if left_bracket and right_bracket:
+                clean_tags.append(f"[e{entity_id}]")
 
-                elif right_bracket:
-                    entity_stack = entity_stacks[entity_id]
-                    if len(entity_stack) > 0:
-                        entity_stacks[entity_id].pop()
-                        clean_tags.append(tag)
-                    else:
-                        num_wrong_para += 1
-                        clean_tags.append("[" + tag)
+            elif left_bracket:
+                entity_stacks[entity_id].append((word_idx, len(clean_tags)))
+                clean_tags.append(f"[e{entity_id}")
 
+            elif right_bracket:
+                entity_stack = entity_stacks[entity_id]
+                if len(entity_stack) > 0:
+                    entity_stacks[entity_id].pop()
+                    clean_tags.append(f"e{entity_id}]")
                 else:
-                    logging.debug(f"warning: completely invalid tag in: {word}")
+                    num_wrong_para += 1
+                    clean_tags.append(f"[e{entity_id}]")
 
-            if clean_tags:
-                clean_toks.append(f"{splits[0]}|{','.join(clean_tags)}")
             else:
-                clean_toks.append(splits[0])
+                num_invalid += 1
+                if debug:
+                    logging.debug(f"warning: completely invalid tag in: {word.text}")
 
-        else:
-            logging.debug(f"warning: multiple pipes in word {word}- stripping tags")
-            clean_toks.append(splits[0])
+        clean_toks.append((word.form, clean_tags))
 
     # convert all unclosed entities to 1-word entities
     for entity, stack in entity_stacks.items():
@@ -74,10 +158,7 @@ def _correct_tags(tok_sentence):
             try:
                 num_wrong_para += 1
 
-                token = clean_toks[word_idx]
-                word, tags = token.split("|")
-
-                tags = tags.split(",")
+                word, tags = clean_toks[word_idx]
 
                 assert tags[tag_idx] == f"(e{entity}", (
                     "Mismatched entity when correcting tags"
@@ -85,26 +166,28 @@ def _correct_tags(tok_sentence):
 
                 tags[tag_idx] = tags[tag_idx] + "]"
 
-                clean_toks[word_idx] = f"{word}|{','.join(tags)}"
-
             except Exception as ex:
                 logging.debug(f"{ex} while converting unclosed entitites")
 
-    if num_wrong_para:
-        sentence = " ".join(tok_sentence)
+    if num_wrong_para and debug:
+        sentence = " ".join(word.text for word in tok_sentence)
         logging.debug(
             f'{num_wrong_para} mismatched parantheses in sentence: "{sentence}"'
         )
+    if problems is not None:
+        problems["tags_repaired"] += num_wrong_para
+        problems["invalid_tags"] += num_invalid
 
-    return clean_toks
+    return [f"{word}|{','.join(tags)}" if tags else word for word, tags in clean_toks]
 
-def _correct_tags_eml(tok_sentence):
+def _correct_tags_eml(tok_sentence, problems=None):
     """
     This function takes a tokenized sentence and ensures that all tags are closed.
     When a tag is not closed or opened properly, the entity is converted into a
     single-token tag.
 
-    Tags that cannot be parsed are thrown out.
+    Tags that cannot be parsed are thrown out. The number of repaired tags is
+    added to the problems counter.
     """
 
     num_wrong_para = 0
@@ -116,39 +199,25 @@ def _correct_tags_eml(tok_sentence):
     clean_toks = []
 
     for word_idx, word in enumerate(tok_sentence):
-        ptags = re.findall(r"(</?e\d+>)", word)
-        stripped_word = re.sub(r"(</?e\d+>)", "", word)
-
-        if not ptags:
-            clean_toks.append(([], stripped_word, []))
-
-        else:
-            clean_opening_tags = []
-            clean_closing_tags = []
-
-            for tag in ptags:
-                m = re.match(r"</?e(\d+)>", tag)
-                if m:
-                    entity_id = m.group(1)
-
-                    if tag.startswith("</"):
-                        entity_stack = entity_stacks[entity_id]
-                        if len(entity_stack) > 0:
-                            entity_stacks[entity_id].pop()
-                            clean_closing_tags.append(tag)
-                        else:
-                            num_wrong_para += 1
-                            clean_opening_tags.append(tag.replace("</", "<"))
-                            clean_closing_tags.insert(0, tag)
-
-                    elif tag.startswith("<"):
-                        entity_stacks[entity_id].append((word_idx, len(clean_opening_tags)))
-                        clean_opening_tags.append(tag)
-
+        clean_opening_tags = []
+        clean_closing_tags = []
+
+        for opens, entity_id, closes in word.tags:
+            if closes:
+                entity_stack = entity_stacks[entity_id]
+                if len(entity_stack) > 0:
+                    entity_stacks[entity_id].pop()
+                    clean_closing_tags.append(f"</e{entity_id}>")
                 else:
-                    logging.debug(f"warning: completely invalid tag in: {word}")
+                    num_wrong_para += 1
+                    clean_opening_tags.append(f"<e{entity_id}>")
+                    clean_closing_tags.insert(0, f"</e{entity_id}>")
+
+            else:
+                entity_stacks[entity_id].append((word_idx, len(clean_opening_tags)))
+                clean_opening_tags.append(f"<e{entity_id}>")
 
-            clean_toks.append((clean_opening_tags, stripped_word, clean_closing_tags))
+        clean_toks.append((clean_opening_tags, word.form, clean_closing_tags))
 
     # convert all unclosed entities to 1-word entities
     for entity, stack in entity_stacks.items():
@@ -175,69 +244,66 @@ def _correct_tags_eml(tok_sentence):
     for i, (opening_tags, word, closing_tags) in enumerate(clean_toks):
         clean_toks[i] = "".join(opening_tags) + word + "".join(closing_tags)
 
-    if num_wrong_para:
-        sentence = " ".join(tok_sentence)
+    if num_wrong_para and logging.root.isEnabledFor(logging.DEBUG):
+        sentence = " ".join(word.text for word in tok_sentence)
         logging.debug(
             f'{num_wrong_para} mismatched parantheses in sentence: "{sentence}"'
         )
+    if problems is not None:
+        problems["tags_repaired"] += num_wrong_para
 
     return clean_toks
 
-def _word_level_edit_distance(words1, words2, tagged_words1, gold_zeros=False):
+_SAME, _EMPTY, _REPLACE, _DELETE, _INSERT = range(5)
+_INF = float("inf")
+# the default cell budget above which the dp table is not stored in memory
+MAX_DP_CELLS = 25_000_000
+_LINEAR_BRANCHING = 16
+_SENTENCE_LOOKAHEAD = 10
+
+
+def _empty_node_mask(words1, gold_zeros=False):
     """
-    Uses an edit-distance-like algorithm to match up the words between
-    two versions of a document. Tagged words are used to carry over
-    as many entity annotations as possible - any words that remain the
-    same or can be tracked back to a "replace" operation keep their tags.
+    Marks the words of the first sequence that are empty nodes ignored by the
+    alignment (i.e. deleted for free). Empty nodes are only ignored when the
+    gold data does not contain them.
     """
-    m, n = len(words1), len(words2)
-    dp = [[0] * (n + 1) for _ in range(m + 1)]
+    if gold_zeros:
+        return [False] * len(words1)
+    return [re.sub(r"</?e\d+>", "", word).startswith("##") for word in words1]
 
-    # initialize the first row and column
-    for i in range(m + 1):
-        dp[i][0] = i
-    for j in range(n + 1):
-        dp[0][j] = j
-
-    # fill the dp table
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            if not gold_zeros and re.sub(r"</?e\d+>", "", words1[i - 1]).startswith("##"):
-                # empty nodes are ignored (deleted for free)
-                dp[i][j] = dp[i - 1][j]
-            elif words1[i - 1] == words2[j - 1]:
-                dp[i][j] = dp[i - 1][j - 1]
-            else:
-                dp[i][j] = min(dp[i - 1][j], dp[i][j - 1], dp[i - 1][j - 1]) + 1
 
-    # backtrack to extract sentence with appropriate tags.
+def _backtrack(words2, tagged_words1, m, n, step):
+    """
+    Walks an alignment back from the cell (m, n) and extracts the sentence with
+    appropriate tags. `step(i, j)` returns the operation leading to the cell
+    (i, j), so the same backtrack is shared by all alignment engines.
+    """
     result = []
     word_problems = defaultdict(int)
 
     i, j = m, n
 
     while i > 0 and j > 0:
-        if not gold_zeros and re.sub(r"</?e\d+>", "", words1[i - 1]).startswith("##"):
+        op = step(i, j)
+        if op == _EMPTY:
             # empty nodes always copied over
             result.append(tagged_words1[i - 1])
             i -= 1
-        elif words1[i - 1] == words2[j - 1]:
+        elif op == _SAME:
             # same case - actually use tags
             result.append(tagged_words1[i - 1])
             i -= 1
             j -= 1
-        elif dp[i][j] == dp[i - 1][j - 1] + 1:
-            # replace case
+        elif op == _REPLACE:
             result.append(words2[j - 1])
             word_problems["replace"] += 1
             i -= 1
             j -= 1
-        elif dp[i][j] == dp[i - 1][j] + 1:
-            # delete case
+        elif op == _DELETE:
             word_problems["delete"] += 1
             i -= 1
         else:
-            # insert case
             result.append(words2[j - 1])
             word_problems["insert"] += 1
             j -= 1
@@ -247,64 +313,667 @@ def _word_level_edit_distance(words1, words2, tagged_words1, gold_zeros=False):
         word_problems["insert"] += 1
         j -= 1
 
+    result.reverse()
+    return result, word_problems
+
+
+def _table_step(words1, words2, empty, dp):
+    """
+    Returns the backtrack step function for a filled dp table, which is any
+    object indexable as `dp[i][j]`.
+    """
+    def step(i, j):
+        if empty[i - 1]:
+            return _EMPTY
+        elif words1[i - 1] == words2[j - 1]:
+            return _SAME
+        elif dp[i][j] == dp[i - 1][j - 1] + 1:
+            return _REPLACE
+        elif dp[i][j] == dp[i - 1][j] + 1:
+            return _DELETE
+        return _INSERT
+
+    return step
+
+
+def _full_alignment(words1, words2, tagged_words1, empty):
+    """
+    Reference alignment filling the full (m+1)x(n+1) dp table.
+    """
+    m, n = len(words1), len(words2)
+    dp = [[0] * (n + 1) for _ in range(m + 1)]
+
+    # initialize the first row and column
+    for i in range(m + 1):
+        dp[i][0] = i
+    for j in range(n + 1):
+        dp[0][j] = j
+
+    # fill the dp table
+    for i in range(1, m + 1):
+        for j in range(1, n + 1):
+            if empty[i - 1]:
+                # empty nodes are ignored (deleted for free)
+                dp[i][j] = dp[i - 1][j]
+            elif words1[i - 1] == words2[j - 1]:
+                dp[i][j] = dp[i - 1][j - 1]
+            else:
+                dp[i][j] = min(dp[i - 1][j], dp[i][j - 1], dp[i - 1][j - 1]) + 1
+
+    result, word_problems = _backtrack(words2, tagged_words1, m, n, _table_step(words1, words2, empty, dp))
+    word_problems["cells"] += m * n
+    return result, word_problems
+
+
+class _Band:
+    """
+    Rows of a dp table restricted to a diagonal band. Cells outside of the band
+    read as infinity.
+    """
+    def __init__(self):
+        self.los = []
+        self.rows = []
+
+    def __getitem__(self, i):
+        return _BandRow(self.los[i], self.rows[i])
+
+
+class _BandRow:
+    __slots__ = ("lo", "row")
+
+    def __init__(self, lo, row):
+        self.lo = lo
+        self.row = row
+
+    def __getitem__(self, j):
+        idx = j - self.lo
+        if 0 <= idx < len(self.row):
+            return self.row[idx]
+        return _INF
+
+
+
+def _fill_band(words1, words2, empty, real, k):
+    """
+    Fills the dp table only for the cells (i, j) with |real[i] - j| <= k, where
+    real[i] is the number of non-empty words in words1[:i].
+    """
+    m, n = len(words1), len(words2)
+    band = _Band()
+    prev_lo = 0
+    prev = list(range(min(n, k) + 1))
+    band.los.append(prev_lo)
+    band.rows.append(prev)
+
+    for i in range(1, m + 1):
+        lo = max(0, real[i] - k)
+        hi = min(n, real[i] + k)
+        cur = []
+        prev_len = len(prev)
+        word1 = words1[i - 1]
+        is_empty = empty[i - 1]
+        left = _INF
+        for j in range(lo, hi + 1):
+            up_idx = j - prev_lo
+            if j == 0:
+                val = i
+            elif is_empty:
+                val = prev[up_idx] if 0 <= up_idx < prev_len else _INF
+            else:
+                diag = prev[up_idx - 1] if 0 < up_idx <= prev_len else _INF
+                if word1 == words2[j - 1]:
+                    val = diag
+                else:
+                    up = prev[up_idx] if 0 <= up_idx < prev_len else _INF
+                    val = min(up, left, diag) + 1
+            cur.append(val)
+            left = val
+        band.los.append(lo)
+        band.rows.append(cur)
+        prev_lo, prev = lo, cur
+
+    return band
+
+
+def _banded_alignment(words1, words2, tagged_words1, empty, max_cells=None):
+    """
+    Diagonal band alignment (Ukkonen) with the same result as the full dp.
+
+    Every path to the cell (i, j) costs at least |real[i] - j|, so when the
+    distance computed inside a band of width k is at most k, no cell outside
+    of the band can influence it or the backtrack. The band is doubled until
+    this holds, which makes the cost O((m + n) * d) for d edits. When the band
+    would exceed max_cells, the linear memory alignment is used instead.
+    """
+    m, n = len(words1), len(words2)
+    real = [0] * (m + 1)
+    for i in range(m):
+        real[i + 1] = real[i] + (not empty[i])
+
+    k = max(1, abs(real[m] - n))
+    cells = 0
+    while True:
+        if max_cells is not None and (m + 1) * (2 * k + 1) > max_cells:
+            result, word_problems = _linear_memory_alignment(words1, words2, tagged_words1, empty)
+            word_problems["cells"] += cells
+            return result, word_problems
+        band = _fill_band(words1, words2, empty, real, k)
+        cells += sum(map(len, band.rows))
+        if band[m][n] <= k:
+            break
+        k *= 2
+
+    result, word_problems = _backtrack(words2, tagged_words1, m, n, _table_step(words1, words2, empty, band))
+    word_problems["cells"] += cells
+    return result, word_problems
+
+
+def _numpy_alignment(words1, words2, tagged_words1, empty):
+    """
+    Full dp filled row by row with NumPy vector operations.
+
+    Both word sequences are interned into integer ids once. Inside a row, the
+    dependency on the left neighbour is resolved by a prefix minimum which
+    restarts at every matching word (a match always copies the diagonal). Only
+    the backtrack operations are stored, one byte per cell.
+    """
+    import numpy as np
+
+    m, n = len(words1), len(words2)
+    vocabulary = {}
+    ids1 = np.fromiter((vocabulary.setdefault(word, len(vocabulary)) for word in words1), dtype=np.int64, count=m)
+    ids2 = np.fromiter((vocabulary.setdefault(word, len(vocabulary)) for word in words2), dtype=np.int64, count=n)
+
+    ops = np.empty((m + 1, n + 1), dtype=np.uint8)
+    cols = np.arange(n + 1, dtype=np.int64)
+    # larger than any difference of (dp value - column) within a row
+    segment_shift = m + 2 * n + 2
+    prev = cols.copy()
+    cur = np.empty(n + 1, dtype=np.int64)
+
+    for i in range(1, m + 1):
+        if empty[i - 1]:
+            # empty nodes are ignored (deleted for free)
+            cur[:] = prev
+            cur[0] = i
+            ops[i] = _EMPTY
+        else:
+            same = ids2 == ids1[i - 1]
+            diag = prev[:-1]
+            up = prev[1:]
+            cur[0] = i
+            cur[1:] = np.where(same, diag, np.minimum(up, diag) + 1)
+            segments = np.empty(n + 1, dtype=np.int64)
+            segments[0] = 1
+            np.cumsum(same, out=segments[1:])
+            segments[1:] += 1
+            shift = segments * segment_shift
+            cur[:] = np.minimum.accumulate(cur - cols - shift) + cols + shift
+
+            row = cur[1:]
+            ops[i, 1:] = np.where(
+                same, _SAME, np.where(
+                    row == diag + 1, _REPLACE, np.where(row == up + 1, _DELETE, _INSERT)
+                )
+            )
+        prev, cur = cur, prev
+
+    result, word_problems = _backtrack(words2, tagged_words1, m, n, ops.item)
+    word_problems["cells"] += m * n
+    return result, word_problems
+
+
+class _RowWindow:
+    """
+    Consecutive dp rows starting at the row `first`, indexable as `dp[i][j]`.
+    """
+    def __init__(self, first, rows):
+        self.first = first
+        self.rows = rows
+
+    def __getitem__(self, i):
+        return self.rows[i - self.first]
+
+
+def _fill_rows(words1, words2, empty, top, top_row, bottom, width):
+    """
+    Yields the dp rows top+1..bottom (columns 0..width) computed from the row top.
+    """
+    prev = top_row
+    for i in range(top + 1, bottom + 1):
+        if empty[i - 1]:
+            # empty nodes are ignored (deleted for free)
+            cur = prev[:width + 1]
+            cur[0] = i
+        else:
+            word1 = words1[i - 1]
+            cur = [i] * (width + 1)
+            left = i
+            for j in range(1, width + 1):
+                if word1 == words2[j - 1]:
+                    left = prev[j - 1]
+                else:
+                    left = min(prev[j], left, prev[j - 1]) + 1
+                cur[j] = left
+        yield cur
+        prev = cur
+
+
+def _linear_memory_backtrack(words1, words2, empty, top, top_row, bottom, end_j, ops, cells):
+    """
+    Appends the backtrack operations from the cell (bottom, end_j) up to the row
+    top and returns the column in which the path reached it (0 if the path ended
+    in the first column before). The number of computed dp cells is added to
+    cells[0].
+
+    The rows are computed forward from the row top, keeping only
+    _LINEAR_BRANCHING checkpoint rows. The segments between checkpoints are
+    then solved recursively from the bottom one, since the backtrack from a
+    cell only depends on the rows above it.
+    """
+    cells[0] += (bottom - top) * end_j
+    if bottom - top <= _LINEAR_BRANCHING:
+        rows = [top_row]
+        rows.extend(_fill_rows(words1, words2, empty, top, top_row, bottom, end_j))
+        step = _table_step(words1, words2, empty, _RowWindow(top, rows))
+
+        i, j = bottom, end_j
+        while i > top and j > 0:
+            op = step(i, j)
+            ops.append(op)
+            if op == _SAME or op == _REPLACE:
+                i -= 1
+                j -= 1
+            elif op == _INSERT:
+                j -= 1
+            else:
+                i -= 1
+        return j
+
+    segment = -(-(bottom - top) // _LINEAR_BRANCHING)
+    checkpoints = [(top, top_row)]
+    for i, row in enumerate(_fill_rows(words1, words2, empty, top, top_row, bottom, end_j), top + 1):
+        if (i - top) % segment == 0 and i < bottom:
+            checkpoints.append((i, row))
+
+    j = end_j
+    while checkpoints and j > 0:
+        start, row = checkpoints.pop()
+        j = _linear_memory_backtrack(words1, words2, empty, start, row, bottom, j, ops, cells)
+        bottom = start
+    return j
+
+
+def _linear_memory_alignment(words1, words2, tagged_words1, empty):
+    """
+    Divide-and-conquer alignment with the same result as the full dp, which
+    never holds more than a few dozen dp rows in memory (O(n log m) overall)
+    at the cost of recomputing every row about log_16(m) times.
+    """
+    m, n = len(words1), len(words2)
+
+    ops = []
+    cells = [0]
+    _linear_memory_backtrack(words1, words2, empty, 0, list(range(n + 1)), m, n, ops, cells)
+    ops = iter(ops)
+
+    result, word_problems = _backtrack(words2, tagged_words1, m, n, lambda i, j: next(ops))
+    word_problems["cells"] += cells[0]
+    return result, word_problems
+
+
+def _find_anchors(words1, words2, empty):
+    """
+    Finds words occurring exactly once in both sequences and chains them by the
+    longest increasing subsequence of their positions (patience sorting).
+    Returns the list of (i, j) index pairs of the chained anchors.
+    """
+    counts1 = Counter(word for word, is_empty in zip(words1, empty) if not is_empty)
+    counts2 = Counter(words2)
+    positions2 = {word: j for j, word in enumerate(words2) if counts2[word] == 1}
+
+    candidates = [
+        (i, positions2[word]) for i, (word, is_empty) in enumerate(zip(words1, empty))
+        if not is_empty and counts1[word] == 1 and word in positions2
+    ]
+
+    pile_tops = []
+    pile_heads = []
+    predecessors = []
+    for idx, (_, j) in enumerate(candidates):
+        pile = bisect_left(pile_tops, j)
+        predecessors.append(pile_heads[pile - 1] if pile > 0 else -1)
+        if pile == len(pile_tops):
+            pile_tops.append(j)
+            pile_heads.append(idx)
+        else:
+            pile_tops[pile] = j
+            pile_heads[pile] = idx
+
+    anchors = []
+    idx = pile_heads[-1] if pile_heads else -1
+    while idx >= 0:
+        anchors.append(candidates[idx])
+        idx = predecessors[idx]
+    anchors.reverse()
+    return anchors
+
+
+def _align_gap(words1, words2, tagged_words1, empty, start, end, align):
+    """
+    Aligns the gap between the anchor start (indices of a pair of matching
+    words, None at the beginning of the document) and the end position with
+    the given alignment function.
+
+    The anchor is aligned together with the gap, so that the gap is handled
+    the same way as inside of a whole document alignment (e.g. leading empty
+    nodes are kept). The anchor is always kept as the first word of the result.
+    """
+    i0, j0 = start if start is not None else (0, 0)
+    i1, j1 = end
+    result, word_problems = align(words1[i0:i1], words2[j0:j1], tagged_words1[i0:i1], empty[i0:i1])
+    if start is not None:
+        # the first word is always the one aligned to the anchor
+        result[0] = tagged_words1[i0]
+    return result, word_problems
+
+
+def _anchored_alignment(words1, words2, tagged_words1, empty, max_cells=None):
+    """
+    Alignment for long, badly diverging documents. Words unique in both
+    sequences are used as fixed anchors and the dp is run only on the gaps
+    between them, so the cost is roughly the sum of the squared gap sizes.
+    The alignment is not guaranteed to be optimal.
+    """
+    anchors = _find_anchors(words1, words2, empty)
+    anchors.append((len(words1), len(words2)))
+
+    def align(gap_words1, gap_words2, gap_tagged_words1, gap_empty):
+        return _banded_alignment(gap_words1, gap_words2, gap_tagged_words1, gap_empty, max_cells)
+
+    result = []
+    word_problems = defaultdict(int)
+    start = None
+
+    for end in anchors:
+        gap_result, gap_problems = _align_gap(words1, words2, tagged_words1, empty, start, end, align)
+        result.extend(gap_result)
+        for problem, count in gap_problems.items():
+            word_problems[problem] += count
+        start = end
+
+    return result, word_problems
+
+
+_ALIGNERS = {
+    "full": _full_alignment,
+    "banded": _banded_alignment,
+    "numpy": _numpy_alignment,
+    "anchored": _anchored_alignment,
+    "linear": _linear_memory_alignment,
+}
+
+
+def _align(words1, words2, tagged_words1, empty, aligner="banded", max_cells=MAX_DP_CELLS):
+    """
+    Aligns the words with the selected alignment engine and returns the
+    aligned words together with the counts of the edit operations.
+
+    Engines storing a dp table switch to the linear memory alignment when the
+    table would have more than max_cells cells (None for no limit).
+    """
+    if aligner in ("banded", "anchored"):
+        return _ALIGNERS[aligner](words1, words2, tagged_words1, empty, max_cells)
+
+    if max_cells is not None and aligner != "linear" and (len(words1) + 1) * (len(words2) + 1) > max_cells:
+        logger.debug(f"dp table over {max_cells} cells, switching to the linear memory alignment")
+        aligner = "linear"
+
+    return _ALIGNERS[aligner](words1, words2, tagged_words1, empty)
+
+
+def _sentence_alignment(words1, gold_tok2, tagged_words1, empty, lookahead=_SENTENCE_LOOKAHEAD):
+    """
+    Aligns the document sentence by sentence against the gold sentences.
+
+    Each gold sentence is aligned to a window of the words starting at the
+    current offset, long enough for the sentence and lookahead more words (empty
+    nodes not counted), and ends at the window position with the lowest cost.
+    The offset then moves to this position, which lets the alignment resynchronize
+    after insertions and deletions at a cost close to linear in the document
+    length. The last sentence takes all the remaining words.
+
+    The window is aligned after a sentinel word, so that the words skipped at
+    its beginning are handled the same way as inside of a whole document
+    alignment (e.g. leading empty nodes are kept).
+    """
+    m = len(words1)
+    result = []
+    word_problems = defaultdict(int)
+
+    offset = 0
+    for k, sentence in enumerate(gold_tok2):
+        last = k == len(gold_tok2) - 1
+        end = m if last else _sentence_window_end(empty, offset, len(sentence) + lookahead)[0]
+        sentence_result, sentence_problems, skipped = _align_sentence_window(
+            words1[offset:end], sentence, tagged_words1[offset:end], empty[offset:end], last
+        )
+        result.extend(sentence_result)
+        for problem, count in sentence_problems.items():
+            word_problems[problem] += count
+        offset += skipped
+
+    return result, word_problems
+
+
+def _sentence_window_end(empty, offset, length):
+    """
+    Returns the end of the window starting at offset with length non-empty
+    words (or less at the end of the words) and the number of its non-empty words.
+    """
+    end = offset
+    count = 0
+    while end < len(empty) and count < length:
+        count += not empty[end]
+        end += 1
+    return end, count
+
+
+def _align_sentence_window(words1, sentence, tagged_words1, empty, last=False):
+    """
+    Aligns a gold sentence to the window words1 (see _sentence_alignment).
+    Returns the aligned words, the counts of the edit operations and the number
+    of the window words used by the sentence (all of them for the last sentence).
+    """
+    # a space never occurs in the words split on whitespace
+    window = [" "] + words1
+    window_empty = [False] + empty
+    window_tagged = [" "] + tagged_words1
+    gold_window = [" "] + sentence
+    width = len(gold_window)
+
+    first_row = list(range(width + 1))
+    rows = [first_row]
+    rows.extend(_fill_rows(window, gold_window, window_empty, 0, first_row, len(window), width))
+
+    if last:
+        best = len(window)
+    else:
+        best = min(range(1, len(window) + 1), key=lambda i: rows[i][width])
+
+    step = _table_step(window, gold_window, window_empty, rows)
+    sentence_result, sentence_problems = _backtrack(gold_window, window_tagged, best, width, step)
+    sentence_problems["cells"] += len(window) * width
+    # the first word is always the one aligned to the sentinel
+    return sentence_result[1:], sentence_problems, best - 1
+
+
+def _fast_align(words1, words2, tagged_words1, empty, aligner="banded", max_cells=MAX_DP_CELLS):
+    """
+    Pre-alignment stage skipping the alignment of the longest common prefix and
+    suffix of the two sequences, with the same result as the alignment of the
+    whole sequences. Outputs equal to the gold words are copied over and
+    outputs cut off by the generation limit (a prefix of the gold words) are
+    completed by the remaining gold words with almost no alignment.
+
+    The common suffix is walked the same way as by the backtrack of the whole
+    dp table. The middle part is aligned after a sentinel standing for the end
+    of the common prefix, which is cut at the last matching word whose form does
+    not occur in the middle part (the backtrack of the whole table could align
+    the word to such an occurrence instead).
+
+    The path taken is reported in word_problems["path"]: "exact", "truncated",
+    "trimmed" (only the middle part aligned) or "aligned".
+    """
+    m, n = len(words1), len(words2)
+
+    i1, j1 = m, n
+    while i1 > 0 and j1 > 0:
+        if empty[i1 - 1]:
+            i1 -= 1
+        elif words1[i1 - 1] == words2[j1 - 1]:
+            i1 -= 1
+            j1 -= 1
+        else:
+            break
+
+    if i1 == 0 or j1 == 0:
+        # as the backtrack, the rest of the gold words is inserted and the rest of the words dropped
+        word_problems = defaultdict(int)
+        if j1 > 0:
+            word_problems["insert"] = j1
+        word_problems["path"] = "exact" if j1 == 0 and all(empty[:i1]) else "trimmed"
+        return words2[:j1] + list(tagged_words1[i1:]), word_problems
+
+    anchors = []
+    i0, j0 = 0, 0
+    # the first column of the dp table counts the leading empty nodes
+    while i0 < i1 and j0 < j1 and not empty[0]:
+        if empty[i0]:
+            i0 += 1
+        elif words1[i0] == words2[j0]:
+            i0 += 1
+            j0 += 1
+            anchors.append((i0, j0))
+        else:
+            break
+
+    anchor = None
+    if anchors:
+        i0, j0 = anchors[-1]
+        gap = set(words2[j0:j1])
+        gap.update(word for word, is_empty in zip(words1[i0:i1], empty[i0:i1]) if not is_empty)
+        for i0, j0 in reversed(anchors):
+            if words1[i0 - 1] not in gap:
+                anchor = (i0, j0)
+                break
+            gap.add(words1[i0 - 1])
+
+    def align(gap_words1, gap_words2, gap_tagged_words1, gap_empty):
+        return _align(gap_words1, gap_words2, gap_tagged_words1, gap_empty, aligner, max_cells)
+
+    if anchor is None:
+        result, word_problems = align(words1[:i1], words2[:j1], tagged_words1[:i1], empty[:i1])
+    else:
+        # a space never occurs in the words split on whitespace
+        i0, j0 = anchor
+        result, word_problems = align([" "] + words1[i0:i1], [" "] + words2[j0:j1],
+                                      [" "] + tagged_words1[i0:i1], [False] + empty[i0:i1])
+        # the first word is always the sentinel
+        result[0:1] = tagged_words1[:i0]
+    result.extend(tagged_words1[i1:])
+    if anchor is not None and anchor[0] == i1:
+        word_problems["path"] = "truncated"
+    else:
+        word_problems["path"] = "trimmed" if anchor is not None or i1 < m else "aligned"
+    return result, word_problems
+
+
+def _word_level_edit_distance(words1, words2, tagged_words1, gold_zeros=False):
+    """
+    Uses an edit-distance-like algorithm to match up the words between
+    two versions of a document. Tagged words are used to carry over
+    as many entity annotations as possible - any words that remain the
+    same or can be tracked back to a "replace" operation keep their tags.
+
+    This fills the full dp table and serves as the reference for the faster
+    alignment engines.
+    """
+    result, word_problems = _full_alignment(words1, words2, tagged_words1, _empty_node_mask(words1, gold_zeros))
+
     if word_problems:
         logger.debug(f"word_problems: {dict(word_problems)}")
 
-    result.reverse()
     return result
 
 def _correct_basic_eml_syntax(document):
     """
     Corrects missing brackets and whitespaces in EML (XML-like) annotations.
     """
-    # add missig closing brackets
-    document = re.sub(r"</?e\w+\b(?!>)", r"\g<0>>", document)
-    # add missing "<" in opening tags that are missing it
-    document = re.sub(r"(?<![</])(e\w+>)", r"<\1", document)
-    # add missing "<" in closing tags that are missing it
-    document = re.sub(r"(?<!<)(/e\w+>)", r"<\1", document)
-
-
-    # ensure there is a whitespace between closing and opening tags
-    document = re.sub(r"</(e\w+)><(e\w+)>", r"</\1> <\2>", document)
-    #ensure there is a whitespace before the first opening tag in a row of opening tags
-    document = re.sub(r"(?<![\s>])(<e\w+>)+", r" \g<0>", document)
-    # ensure there is a whitespace after the last closing tag in a row of closing tags
-    document = re.sub(r"(</e\w+>)+(?![\s<])", r"\g<0> ", document)
-    # ensure there is no whitespace between the openining tag and the next word
-    document = re.sub(r"(<e\w+>)(\s+)(\S)", r"\1\3", document)
-    # ensure there is no whitespace between the previous word and the closing tag
-    document = re.sub(r"(\S)(\s+)(</e\w+>)", r"\1\3", document)
-    # ensure there is no whitespace between multiple opening tags
-    document = re.sub(r"<(e\w+)>\s*<(e\w+)>", r"<\1><\2>", document)
-    # ensure there is no whitespace between multiple closing tags
-    document = re.sub(r"</(e\w+)>\s*</(e\w+)>", r"</\1></\2>", document)
-    # ensure there are no multiple whitespaces in a row
-    document = re.sub(r"\s+", " ", document)
-    return document.strip()
-
-
-def _clean_document(document, gold_tok2, gold_zeros=False, format="txt"):
+    return normalize_eml(document)
+
+
+def _parse_eml_document(document):
     """
-    Applies both stages of cleaning on one document.
+    Corrects the EML syntax of a document (as _correct_basic_eml_syntax) and parses
+    its words, in one pass of the EML lexer.
     """
-    if format == "eml":
-        document = _correct_basic_eml_syntax(document)
+    return [_Word(text, form, tags, form.startswith("##")) for text, form, tags in lex_eml(document)]
 
-    doc_words = document.split()
 
+def _clean_document(
+    document, gold_tok2, gold_zeros=False, format="txt", aligner="banded", max_cells=MAX_DP_CELLS, stats=None
+):
+    """
+    Applies both stages of cleaning on one document.
+
+    The aligner selects the alignment engine: "banded" (default) with cost
+    growing with the number of edits, "numpy" - the full dp vectorized with
+    NumPy, "anchored" - dp only between unique matching words, "linear" - the
+    exact alignment in linear memory, "sentence" - alignment sentence by
+    sentence against the gold sentences, or "full" - the reference dp. Documents
+    whose dp table would exceed max_cells cells are aligned in linear memory.
+    Except for the reference, only the part of the document between the
+    common prefix and suffix with the gold words is aligned.
+
+    With stats, the time of the stages and the counters of the document (edit
+    operations, dp cells, alignment path, repaired tags) are recorded there.
+    """
+    start = time.perf_counter()
     if format == "eml":
-        stripped_doc = [re.sub(r"</?e\d+>", "", word) for word in doc_words]
+        doc_words = _parse_eml_document(document)
     else:
-        stripped_doc = [word.split("|")[0] for word in doc_words]
+        doc_words = [_parse_word(word, format) for word in document.split()]
+    stripped_doc = [word.form for word in doc_words]
+    if gold_zeros:
+        empty = [False] * len(doc_words)
+    else:
+        empty = [word.is_empty for word in doc_words]
 
     flattened_gold = list(chain(*gold_tok2))
+    parsed = time.perf_counter()
+
+    if aligner == "sentence":
+        correct_words, word_problems = _sentence_alignment(stripped_doc, gold_tok2, doc_words, empty)
+    elif aligner == "full":
+        # the reference alignment always aligns the whole document
+        correct_words, word_problems = _align(
+            stripped_doc, flattened_gold, doc_words, empty, aligner, max_cells
+        )
+    else:
+        correct_words, word_problems = _fast_align(
+            stripped_doc, flattened_gold, doc_words, empty, aligner, max_cells
+        )
 
-    correct_words = _word_level_edit_distance(
-        stripped_doc, flattened_gold, doc_words, gold_zeros
-    )
+    aligned = time.perf_counter()
+    if word_problems:
+        logger.debug(f"word_problems: {dict(word_problems)}")
+
+    # gold words copied over by the alignment carry no tags
+    correct_words = [word if isinstance(word, _Word) else _gold_word(word) for word in correct_words]
 
     final_sentences = []
+    tag_problems = Counter()
 
     offset = 0
     for ref_sentence in gold_tok2:
@@ -313,88 +982,208 @@ def _clean_document(document, gold_tok2, gold_zeros=False, format="txt"):
         zeros = 0
         if not gold_zeros:
             while i < ln:
-                if not re.sub(r"</?e\d+>", "", correct_words[offset + i + zeros]).startswith("##"):
+                if not correct_words[offset + i + zeros].is_empty:
                     # empty nodes are always copied over
                     i += 1
                 else:
                     zeros += 1
         sentence = correct_words[offset : offset + ln + zeros]
         offset += ln + zeros
-        correct_sentence = _correct_tags_eml(sentence) if format == "eml" else _correct_tags(sentence)
+        if format == "eml":
+            correct_sentence = _correct_tags_eml(sentence, tag_problems)
+        else:
+            correct_sentence = _correct_tags(sentence, tag_problems)
         assert len(correct_sentence) == len(ref_sentence) + zeros
         final_sentences.append(" ".join(correct_sentence))
 
+    if stats is not None:
+        stats.stages["parse"] += parsed - start
+        stats.stages["align"] += aligned - parsed
+        stats.stages["tags"] += time.perf_counter() - aligned
+        stats.add_document({"words": len(doc_words), "gold_words": len(flattened_gold), **word_problems,
+                            **tag_problems})
+
     return " ".join(final_sentences)
 
 
-def read_conllu(filename: str, zero_mentions: bool) -> List[List[List[str]]]:
+def _clean_document_with_stats(*args):
     """
-    Parses a CoNLL-U file into a list structure. Only loads the minimal information
-    needed to correct sentence structure.
+    Cleans a document in a worker process and returns the result together with
+    the stats of the document.
+    """
+    stats = Stats(log_interval=None, keep_documents=True)
+    return _clean_document(*args, stats=stats), stats
 
-    The list structure is as follows:
-    - first outer list corresponds to documents
-    - the next list corresponds to sentences
-    - final inner list corresponds to word tokens
 
-    The zero mentions switch determines whether zero mentions should be included
-    (True) or skipped (False).
+def _parse_conllu(filename: str, zero_mentions: bool) -> Iterator[List[List[str]]]:
+    """
+    Yields the documents of a CoNLL-U file one at a time, split on the
+    "# newdoc id" comments.
     """
     with open(filename, "r", encoding="utf-8") as f:
-        gold = f.readlines()
+        yield from _parse_conllu_lines(f, zero_mentions)
 
-        gold_docs_tok2 = []
-        next_doc = []
-        next_sent: List[str] = []
 
-        for line in gold:
-            if not line.strip():
-                continue
+def _parse_conllu_lines(lines: Iterable[str], zero_mentions: bool) -> Iterator[List[List[str]]]:
+    next_doc = []
+    next_sent: List[str] = []
 
-            if line.startswith("#"):
-                begins_new_doc = line.startswith("# newdoc id")
+    for line in lines:
+        if not line.strip():
+            continue
 
-                if line.startswith("# sent_id") or begins_new_doc:
-                    if next_sent:
-                        next_doc.append(next_sent)
-                    next_sent = []
+        if line.startswith("#"):
+            begins_new_doc = line.startswith("# newdoc id")
 
-                if begins_new_doc:
-                    if next_doc:
-                        gold_docs_tok2.append(next_doc)
-                    next_doc = []
+            if line.startswith("# sent_id") or begins_new_doc:
+                if next_sent:
+                    next_doc.append(next_sent)
+                next_sent = []
 
-                continue
+            if begins_new_doc:
+                if next_doc:
+                    yield next_doc
+                next_doc = []
 
-            number, word = line.split()[:2]
-            word = word.replace(" ", "_")
-            if not zero_mentions and "." in number:
-                continue  # skip empty nodes
+            continue
 
-            if "-" in number:
-                continue  # always skip multitokens
+        number, word = line.split()[:2]
+        word = word.replace(" ", "_")
+        if not zero_mentions and "." in number:
+            continue  # skip empty nodes
 
-            next_sent.append(word)
+        if "-" in number:
+            continue  # always skip multitokens
 
-        next_doc.append(next_sent)
-        gold_docs_tok2.append(next_doc)
+        next_sent.append(word)
 
-    return gold_docs_tok2
+    next_doc.append(next_sent)
+    yield next_doc
+
+
+def _pack_gold(docs: List[List[List[str]]]):
+    """
+    Packs the skeleton of a CoNLL-U file into a compact form for the cache: the
+    words of each document as one string, the lengths of all sentences and the
+    number of sentences of each document as integer arrays.
+    """
+    doc_words = ["\n".join(chain(*doc)) for doc in docs]
+    sentence_lengths = array("I", (len(sentence) for doc in docs for sentence in doc))
+    doc_lengths = array("I", (len(doc) for doc in docs))
+    return doc_words, sentence_lengths, doc_lengths
+
+
+def _unpack_gold_cache(skeleton) -> Iterator[List[List[str]]]:
+    doc_words, sentence_lengths, doc_lengths = skeleton
+    sentence_idx = 0
+    for words, doc_length in zip(doc_words, doc_lengths):
+        words = words.split("\n") if words else []
+        doc = []
+        offset = 0
+        for length in sentence_lengths[sentence_idx:sentence_idx + doc_length]:
+            doc.append(words[offset:offset + length])
+            offset += length
+        sentence_idx += doc_length
+        yield doc
+
+
+def iter_conllu(filename: str, zero_mentions: bool, cache_dir: str | None = None) -> Iterator[List[List[str]]]:
+    """
+    Streaming version of read_conllu yielding one document (a list of sentences
+    of word tokens) at a time, split on the "# newdoc id" comments.
+
+    With a cache_dir, the parsed skeleton is stored there and reused by the
+    following calls until the file changes.
+    """
+    if cache_dir is None:
+        yield from _parse_conllu(filename, zero_mentions)
+        return
+
+    key = f"gold-{zero_mentions}"
+    skeleton = load_cached(filename, key, cache_dir)
+    if skeleton is None:
+        logging.info(f"Caching gold file {filename} in {cache_dir}")
+        skeleton = store_cached(filename, key, cache_dir, _pack_gold(list(_parse_conllu(filename, zero_mentions))))
+    yield from _unpack_gold_cache(skeleton)
+
+
+def read_conllu(filename: str, zero_mentions: bool, cache_dir: str | None = None) -> List[List[List[str]]]:
+    """
+    Parses a CoNLL-U file into a list structure. Only loads the minimal information
+    needed to correct sentence structure.
+
+    The list structure is as follows:
+    - first outer list corresponds to documents
+    - the next list corresponds to sentences
+    - final inner list corresponds to word tokens
+
+    The zero mentions switch determines whether zero mentions should be included
+    (True) or skipped (False). With a cache_dir, the parsed structure is cached
+    there (see iter_conllu).
+    """
+    return list(iter_conllu(filename, zero_mentions, cache_dir))
+
+
+def iter_input_file(filename: str) -> Iterator[str]:
+    """
+    Streaming version of read_input_file yielding one document at a time.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            yield line.strip()
 
 
 def read_input_file(filename: str) -> List[str]:
     """
     Reads an input file as a list of documents.
     """
-    with open(filename, "r", encoding="utf-8") as f:
-        return [line.strip() for line in f.readlines()]
+    return list(iter_input_file(filename))
+
+
+def iter_clean_data(
+    docs: Iterable[str], gold: Iterable[List[List[str]]], gold_zeros: bool = False,
+    format: str = "txt", aligner: str = "banded", max_cells: int | None = MAX_DP_CELLS,
+    stats: Stats | None = None
+) -> Iterator[str]:
+    """
+    Cleans the documents one at a time, as they are read from the iterables.
+    """
+    for doc, gold_doc in zip(docs, gold):
+        yield _clean_document(doc, gold_doc, gold_zeros, format, aligner, max_cells, stats)
 
 
 def clean_data(
     docs: List[str], gold: List[List[List[str]]], gold_zeros: bool = False,
-    format: str = "txt"
+    format: str = "txt", aligner: str = "banded", max_cells: int | None = MAX_DP_CELLS,
+    workers: int = 1, stats: Stats | None = None
 ) -> List[str]:
-    return [_clean_document(doc, gold_doc, gold_zeros, format) for doc, gold_doc in zip(docs, gold)]
+    """
+    Cleans the documents against the gold documents. With more than one worker
+    (0 for all cores), the documents are cleaned in a process pool, the most
+    expensive ones (by the size of the alignment table) first, so that a single
+    huge document does not end up last. The output order matches the input.
+
+    With stats, the metrics of the documents are collected there (see Stats).
+    """
+    if workers == 1:
+        return list(iter_clean_data(docs, gold, gold_zeros, format, aligner, max_cells, stats))
+
+    docs = list(zip(docs, gold))
+    costs = [len(doc.split()) * sum(map(len, gold_doc)) for doc, gold_doc in docs]
+    order = sorted(range(len(docs)), key=lambda i: costs[i], reverse=True)
+
+    clean = _clean_document if stats is None else _clean_document_with_stats
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {
+            i: executor.submit(clean, *docs[i], gold_zeros, format, aligner, max_cells)
+            for i in order
+        }
+        results = [futures[i].result() for i in range(len(docs))]
+    if stats is None:
+        return results
+    for _, document_stats in results:
+        stats.merge(document_stats)
+    return [result for result, _ in results]
 
 
 def clean_file(
@@ -402,24 +1191,57 @@ def clean_file(
     gold_filename: str,
     output_filename: str | None = None,
     zero_mentions: bool = True,
-    format: str = "txt"
-):
-    logging.info(f"Reading input file: {filename}")
-    data = read_input_file(filename)
+    format: str = "txt",
+    aligner: str = "banded",
+    max_cells: int | None = MAX_DP_CELLS,
+    workers: int = 1,
+    cache_dir: str | None = None,
+    gold: List[List[List[str]]] | None = None,
+    stats: Stats | None = None,
+    report: str | None = None
+) -> Stats:
+    """
+    Cleans the input file against the gold CoNLL-U file. With a single worker,
+    both files are streamed and each cleaned document is written as soon as it
+    is done, so the memory is bounded by the largest document. The parallel
+    cleaning needs all the documents in memory for scheduling.
 
-    logging.info(f"Reading gold file: {gold_filename}")
-    gold_docs_tok2 = read_conllu(gold_filename, zero_mentions)
+    With a cache_dir, the parsed gold file is cached there for the next runs.
+    The gold documents already read by read_conllu (e.g. for a batch of input
+    files) can be passed as gold instead.
 
-    logging.info("Cleaning data")
-    clean = clean_data(data, gold_docs_tok2, gold_zeros=zero_mentions, format=format)
+    Returns the metrics of the cleaning (added to stats if given), which are
+    also written as a JSON report if a report file name is given.
+    """
+    output_filename = _output_filename(filename, output_filename, "-cleaned" + os.path.splitext(filename)[1])
+    if stats is None:
+        stats = Stats(keep_documents=bool(report))
+    stats.file = filename
+    start = time.perf_counter()
 
-    if not output_filename:
-        output_filename = filename.replace(".txt", "-cleaned.txt")
+    logging.info(f"Reading input file: {filename}")
+    if gold is None:
+        logging.info(f"Reading gold file: {gold_filename}")
+    if workers == 1:
+        data = iter_input_file(filename)
+        gold_docs_tok2 = iter_conllu(gold_filename, zero_mentions, cache_dir) if gold is None else gold
+        clean = iter_clean_data(data, gold_docs_tok2, gold_zeros=zero_mentions, format=format, aligner=aligner,
+                                max_cells=max_cells, stats=stats)
+    else:
+        data = read_input_file(filename)
+        gold_docs_tok2 = read_conllu(gold_filename, zero_mentions, cache_dir) if gold is None else gold
+        clean = clean_data(data, gold_docs_tok2, gold_zeros=zero_mentions, format=format, aligner=aligner,
+                           max_cells=max_cells, workers=workers, stats=stats)
 
-    logging.info(f"Writing output file: {output_filename}")
+    logging.info(f"Cleaning data into output file: {output_filename}")
     with open(output_filename, "w", encoding="utf-8") as f:
-        clean = [line + "\n" for line in clean]
-        f.writelines(clean)
+        for line in clean:
+            f.write(line + "\n")
+    stats.stages["total"] += time.perf_counter() - start
+    stats.log_summary()
+    if report:
+        stats.write_json(report)
+    return stats
 
 def _test_eml_cleaning():
     doc = "This is a <e21 test and test <e56> ## </e56></e21> document  > with  <e2>entities/e2>e5> and</e5   some<e3> e4>invalid </e4> </e3>tags."
@@ -0,0 +1,387 @@
+"""
+Service mode: the gold/skeleton files are loaded once and kept in memory, and single
+documents are cleaned and converted on requests over a local HTTP API (on a TCP port or
+a Unix socket), so that an evaluation harness calling it per document does not pay for
+the interpreter start-up, the udapi import and the parsing of the skeleton every time.
+
+    POST /clean        {"skeleton": "dev", "doc": 3, "text": "...", "zero_mentions": true,
+                        "format": "txt", "aligner": "banded"}
+    POST /text2conllu  {"skeleton": "dev", "doc": "doc-id", "text": "...", "zero_mentions": true}
+    POST /conllu2text  {"skeleton": "dev", "doc": 3, "format": "eml", "zero_mentions": true}
+                       or {"conllu": "...", "format": "txt"}
+    GET  /skeletons
+
+A document is selected by its index or by its newdoc id, the skeleton may be left out when
+only one is served. The responses are JSON objects with the result ("text", "conllu" or
+"json") and the counters of the document ("stats", see Stats).
+"""
+import io
+import json
+import logging
+import os
+import pickle
+import re
+import signal
+import socketserver
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from udapi.block.read.conllu import Conllu as ConlluReader
+
+from .convert import (document_to_text, import_text_document, normalize_data, read_data, read_skeleton,
+                      write_data)
+from .output_cleaner import _ALIGNERS, MAX_DP_CELLS, _clean_document_with_stats, read_conllu
+from .stats import Stats
+
+logger = logging.getLogger()
+
+_NEWDOC_ID = re.compile(r"^# newdoc id\s*=\s*(.+)")
+# the largest request body accepted (in bytes)
+MAX_REQUEST_SIZE = 256 << 20
+CLEAN_FORMATS = ("txt", "eml")
+EXPORT_FORMATS = ("txt", "eml", "json")
+ALIGNERS = (*_ALIGNERS, "sentence")
+
+
+def _document_names(filename):
+    """The newdoc ids of the documents of a CoNLL-U file, in the order of read_conllu."""
+    names = []
+    with open(filename, encoding="utf-8-sig") as f:
+        for line in f:
+            match = _NEWDOC_ID.match(line)
+            if match:
+                names.append(match.group(1).strip())
+    return names or [None]
+
+
+class ServedSkeleton:
+    """
+    A gold/skeleton file of the service. Each representation of the documents needed by
+    the operations (the gold words for cleaning, the streamed skeleton or the udapi
+    documents for importing, the source documents for exporting) is built by load_all()
+    or on first use and kept. The udapi documents are stored pickled one by one and
+    unpickled for each request, as the conversions modify them.
+    """
+
+    def __init__(self, name, filename, cache_dir=None):
+        self.name = name
+        self.filename = filename
+        self.cache_dir = cache_dir
+        self.names = _document_names(filename)
+        self._index = {name: i for i, name in enumerate(self.names) if name is not None}
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def index(self, doc):
+        """The index of a document given by its index or newdoc id."""
+        if isinstance(doc, str):
+            if doc not in self._index:
+                raise ValueError(f"No document {doc} in skeleton {self.name}")
+            return self._index[doc]
+        if isinstance(doc, bool) or not isinstance(doc, int):
+            raise ValueError(f"Invalid doc {json.dumps(doc)}, give an index or a newdoc id")
+        if not -len(self) <= doc < len(self):
+            raise ValueError(f"No document {doc} in skeleton {self.name} with {len(self)} documents")
+        return doc % len(self)
+
+    def _load(self, key, loader):
+        with self._lock:
+            if key not in self._loaded:
+                logger.info(f"Loading {key[0]} of skeleton {self.name} ({self.filename})")
+                self._loaded[key] = loader()
+            return self._loaded[key]
+
+    def load_all(self):
+        """Builds all the representations of the documents."""
+        for zero_mentions in (False, True):
+            self._gold(zero_mentions)
+            self._skeleton(zero_mentions)
+        self._stream()
+        self._source()
+
+    def _gold(self, zero_mentions):
+        return self._load(("gold", zero_mentions), lambda: read_conllu(self.filename, zero_mentions, self.cache_dir))
+
+    def _stream(self):
+        def load():
+            from .conllu_stream import _stream_documents
+            documents = list(_stream_documents(self.filename))
+            global_entities = []
+            global_entity = None
+            for document in documents:
+                global_entity = global_entity or document[2]
+                global_entities.append(global_entity)
+            return documents, global_entities
+
+        return self._load(("stream", None), load)
+
+    def _skeleton(self, use_gold_empty_nodes):
+        return self._load(
+            ("skeleton", use_gold_empty_nodes),
+            lambda: _pickle_documents(read_skeleton(self.filename, use_gold_empty_nodes, self.cache_dir)),
+        )
+
+    def _source(self):
+        return self._load(("source", None), lambda: _pickle_documents(read_data(self.filename)))
+
+    def gold(self, doc, zero_mentions):
+        """The gold words (sentences of words) of a document for cleaning."""
+        return self._gold(zero_mentions)[self.index(doc)]
+
+    def stream_document(self, doc):
+        """
+        The parsed skeleton document of the streaming conversion with the global.Entity
+        header in effect for it.
+        """
+        documents, global_entities = self._stream()
+        i = self.index(doc)
+        return documents[i], global_entities[i]
+
+    def skeleton_document(self, doc, use_gold_empty_nodes):
+        """A fresh copy of the udapi skeleton document prepared for importing."""
+        return pickle.loads(self._skeleton(use_gold_empty_nodes)[self.index(doc)])
+
+    def source_document(self, doc):
+        """A fresh copy of the udapi document with the gold annotation for exporting."""
+        return pickle.loads(self._source()[self.index(doc)])
+
+
+def _option(request, key, default, choices):
+    """The value of an option of the request, one of the choices."""
+    value = request.get(key, default)
+    if value not in choices:
+        raise ValueError(f"Unknown {key} {value}, choose one of {', '.join(choices)}")
+    return value
+
+
+def _flag(request, key, default=False):
+    """The value of a boolean option of the request, which must be true or false."""
+    value = request.get(key, default)
+    if not isinstance(value, bool):
+        raise ValueError(f"Invalid {key} {json.dumps(value)}, give true or false")
+    return value
+
+
+def _pickle_documents(docs):
+    return [pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL) for doc in docs]
+
+
+def _export(doc, format, zero_mentions, blind, sequential_ids, no_empty_node_form):
+    args = (doc, zero_mentions, not blind, sequential_ids, not no_empty_node_form)
+    if format == "eml":
+        from .eml_format import document_to_eml
+        return document_to_eml(*args)
+    if format == "json":
+        from .json_format import document_to_json
+        return document_to_json(*args)
+    return document_to_text(*args)
+
+
+class Service:
+    """
+    The operations of the service on the served skeletons (name -> file name). The
+    requests and responses are dicts. With more than one worker (0 for all cores),
+    the documents are cleaned in a process pool. The udapi conversions redirect
+    sys.stdout and the level of the root logger, so they run one at a time.
+    """
+
+    def __init__(self, skeletons, cache_dir=None, workers=1):
+        self.skeletons = {name: ServedSkeleton(name, filename, cache_dir) for name, filename in skeletons.items()}
+        self.stats = Stats()
+        self._stats_lock = threading.Lock()
+        self._udapi_lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count()) if workers != 1 else None
+        self.operations = {
+            "clean": self.clean,
+            "text2conllu": self.text2conllu,
+            "conllu2text": self.conllu2text,
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def skeleton(self, request):
+        name = request.get("skeleton")
+        if name is None:
+            if len(self.skeletons) != 1:
+                raise ValueError(f"Choose the skeleton: {', '.join(self.skeletons)}")
+            return next(iter(self.skeletons.values()))
+        if name not in self.skeletons:
+            raise ValueError(f"Unknown skeleton {name}")
+        return self.skeletons[name]
+
+    def _add_stats(self, stats):
+        with self._stats_lock:
+            self.stats.merge(stats)
+        document = dict(stats.documents[0]) if stats.documents else {}
+        document.pop("file", None)
+        document.pop("document", None)
+        return document
+
+    def list_skeletons(self, request=None):
+        return {"skeletons": {name: {"file": skeleton.filename, "documents": skeleton.names}
+                              for name, skeleton in self.skeletons.items()}}
+
+    def clean(self, request):
+        skeleton = self.skeleton(request)
+        zero_mentions = _flag(request, "zero_mentions")
+        format = _option(request, "format", "txt", CLEAN_FORMATS)
+        aligner = _option(request, "aligner", "banded", ALIGNERS)
+        args = (request["text"], skeleton.gold(request["doc"], zero_mentions), zero_mentions, format, aligner,
+                request.get("max_cells", MAX_DP_CELLS))
+        if self._executor is None:
+            text, stats = _clean_document_with_stats(*args)
+        else:
+            text, stats = self._executor.submit(_clean_document_with_stats, *args).result()
+        return {"text": text, "stats": self._add_stats(stats)}
+
+    def text2conllu(self, request):
+        skeleton = self.skeleton(request)
+        zero_mentions = _flag(request, "zero_mentions")
+        streaming = _flag(request, "streaming", True)
+        text = request["text"]
+        stats = Stats(log_interval=None, keep_documents=True)
+        problems = Counter()
+        with stats.stage("convert"), self._udapi_lock:
+            if zero_mentions and streaming:
+                from .conllu_stream import convert_document
+                document, global_entity = skeleton.stream_document(request["doc"])
+                conllu = convert_document(document, text, global_entity, problems)
+            else:
+                doc = skeleton.skeleton_document(request["doc"], zero_mentions)
+                import_text_document(text, doc, zero_mentions, problems)
+                f = io.StringIO()
+                write_data([doc], f)
+                conllu = f.getvalue()
+        stats.add_document(problems)
+        return {"conllu": conllu, "stats": self._add_stats(stats)}
+
+    def conllu2text(self, request):
+        format = _option(request, "format", "txt", EXPORT_FORMATS)
+        options = (format, _flag(request, "zero_mentions"), _flag(request, "blind"), _flag(request, "sequential_ids"),
+                   _flag(request, "no_empty_node_form"))
+        with self._udapi_lock:
+            if "conllu" in request:
+                reader = ConlluReader(filehandle=io.StringIO(request["conllu"]), split_docs=True)
+                docs = normalize_data([doc for doc in reader.read_documents() if doc.bundles])
+            else:
+                docs = [self.skeleton(request).source_document(request["doc"])]
+            outputs = [_export(doc, *options) for doc in docs]
+        if format == "json":
+            return {"json": outputs if "conllu" in request else outputs[0]}
+        return {"text": "\n".join(outputs)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, status, response):
+        body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/skeletons":
+            self._respond(HTTPStatus.OK, self.server.service.list_skeletons())
+        else:
+            self._respond(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_REQUEST_SIZE:
+            self.close_connection = True
+            self._respond(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request too large"})
+            return
+        body = self.rfile.read(length)
+        operation = self.server.service.operations.get(self.path.strip("/"))
+        if operation is None:
+            self._respond(HTTPStatus.NOT_FOUND, {"error": f"Unknown operation {self.path}"})
+            return
+        try:
+            request = json.loads(body)
+            response = operation(request)
+        except KeyError as ex:
+            self._respond(HTTPStatus.BAD_REQUEST, {"error": f"Missing field {ex}"})
+            return
+        except (ValueError, TypeError, AssertionError) as ex:
+            # e.g. invalid JSON, unknown documents or texts not matching the skeleton
+            self._respond(HTTPStatus.BAD_REQUEST, {"error": str(ex) or type(ex).__name__})
+            return
+        except Exception as ex:
+            logger.exception(f"{ex} while handling {self.path}")
+            self._respond(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(ex) or type(ex).__name__})
+            return
+        self._respond(HTTPStatus.OK, response)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def parse_skeletons(specs):
+    """
+    Names the skeleton files given as NAME=FILE or FILE (named by the file name without
+    the extension).
+    """
+    skeletons = {}
+    for spec in specs:
+        name, sep, filename = spec.partition("=")
+        if not sep or os.path.exists(spec):
+            filename = spec
+            name = os.path.splitext(os.path.basename(spec))[0]
+        if name in skeletons:
+            raise ValueError(f"Skeleton {name} given twice, name the files as NAME=FILE")
+        skeletons[name] = filename
+    return skeletons
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(skeletons, host="127.0.0.1", port=8000, socket=None, workers=1, cache_dir=None, lazy=False):
+    """
+    Serves the operations on the skeletons (NAME=FILE or FILE) over HTTP on the host
+    and port, or on the Unix socket if given, until interrupted. The skeletons are
+    loaded before the first connection is accepted, unless lazy.
+    """
+    service = Service(parse_skeletons(skeletons), cache_dir, workers)
+    for skeleton in service.skeletons.values():
+        logger.info(f"Skeleton {skeleton.name}: {skeleton.filename} with {len(skeleton)} documents")
+        if not lazy:
+            skeleton.load_all()
+    if socket is not None:
+        if os.path.exists(socket):
+            os.unlink(socket)
+        server = _UnixHTTPServer(socket, _Handler)
+        address = socket
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        address = f"http://{host}:{server.server_address[1]}"
+    server.service = service
+    logger.info(f"Serving on {address}")
+    # stop the worker processes and remove the socket when terminated too
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        service.stats.log_summary()
+        if socket is not None and os.path.exists(socket):
+            os.unlink(socket)
@@ -0,0 +1,102 @@
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# the minimal number of seconds between two progress log lines
+LOG_INTERVAL = 10.0
+
+
+class Stats:
+    """
+    Metrics of cleaning or converting documents: the wall time spent in each
+    stage, counters per document (edit operations, dp cells, repaired tags,
+    mismatched words, ...) and their totals.
+
+    Instead of logging every problem, the totals are logged as one summary
+    line at most every log_interval seconds (None for never) and at the end
+    (log_summary).
+
+    Only the totals are kept by default, so that the memory does not grow with
+    the corpus. With keep_documents, the counters of each document are kept in
+    documents too (e.g. for a JSON report).
+    """
+
+    def __init__(self, log_interval=LOG_INTERVAL, keep_documents=False):
+        self.log_interval = log_interval
+        self.keep_documents = keep_documents
+        self.stages = defaultdict(float)
+        self.totals = Counter()
+        self.documents = []
+        self.file = None
+        self._file_documents = Counter()
+        self._logged = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the wall time of the block to the stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - start
+
+    def add_document(self, counters):
+        """
+        Adds the counters of one document to the totals (and records them with
+        keep_documents) and logs the progress.
+        """
+        self._record(counters)
+        self.totals["documents"] += 1
+        for key, value in counters.items():
+            if isinstance(value, str):
+                # e.g. the alignment paths are counted as "path=trimmed"
+                self.totals[f"{key}={value}"] += 1
+            else:
+                self.totals[key] += value
+        self._log_progress()
+
+    def merge(self, other):
+        """
+        Adds the totals and stage times of other (e.g. from a worker process),
+        and with keep_documents also the documents recorded by other.
+        """
+        for name, seconds in other.stages.items():
+            self.stages[name] += seconds
+        for document in other.documents:
+            document = dict(document)
+            del document["file"], document["document"]
+            self._record(document)
+        self.totals.update(other.totals)
+        self._log_progress()
+
+    def _record(self, counters):
+        if not self.keep_documents:
+            return
+        document = {"file": self.file, "document": self._file_documents[self.file]}
+        self._file_documents[self.file] += 1
+        document.update(counters)
+        self.documents.append(document)
+
+    def _log_progress(self):
+        if self.log_interval is not None and time.perf_counter() - self._logged >= self.log_interval:
+            self.log_summary()
+
+    def summary(self):
+        counts = ", ".join(f"{key}={value}" for key, value in sorted(self.totals.items()))
+        stages = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.stages.items())
+        return f"{counts}; {stages}" if stages else counts
+
+    def log_summary(self):
+        logger.info(self.summary())
+        self._logged = time.perf_counter()
+
+    def to_dict(self):
+        return {"stages": dict(self.stages), "totals": dict(self.totals), "documents": self.documents}
+
+    def write_json(self, filename):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
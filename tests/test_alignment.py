@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from text2text_coref.output_cleaner import (_banded_alignment, _clean_document, _empty_node_mask, _fast_align,
+                                            _full_alignment, _linear_memory_alignment, _numpy_alignment)
+
+ALIGNERS = ["full", "banded", "linear", "numpy"]
+
+
+def random_pair(rng, max_words=12):
+    """Returns a random gold sequence and an output damaged like an LLM output, over a small alphabet."""
+    alphabet = "abcd"[:rng.randint(1, 4)]
+    gold = [rng.choice(alphabet) for _ in range(rng.randint(0, max_words))]
+    output = []
+    for word in gold:
+        r = rng.random()
+        if r < 0.1:
+            continue
+        output.append(rng.choice(alphabet) if r < 0.2 else word)
+        if rng.random() < 0.15:
+            output.append(rng.choice(alphabet))
+        if rng.random() < 0.15:
+            output.append("##")
+    if rng.random() < 0.2:
+        output.insert(0, "##")
+    if rng.random() < 0.3:
+        output = output[:rng.randint(0, len(output))]
+    return output, gold
+
+
+def tagged(words):
+    return [f"{word}|{idx}" for idx, word in enumerate(words)]
+
+
+def edits(word_problems):
+    return {key: word_problems[key] for key in ("replace", "insert", "delete")}
+
+
+@pytest.mark.parametrize("alignment", [
+    _banded_alignment,
+    lambda *args: _banded_alignment(*args, max_cells=8),
+    _numpy_alignment,
+    _linear_memory_alignment,
+], ids=["banded", "banded-fallback", "numpy", "linear"])
+@pytest.mark.parametrize("gold_zeros", [False, True])
+@pytest.mark.parametrize("empty_nodes", [False, True])
+def test_alignment_matches_full_alignment(alignment, gold_zeros, empty_nodes):
+    if alignment is _numpy_alignment:
+        pytest.importorskip("numpy")
+    rng = random.Random(3)
+    for _ in range(1000):
+        output, gold = random_pair(rng, max_words=rng.choice([6, 12, 30]))
+        if not empty_nodes:
+            output = [word for word in output if word != "##"]
+        empty = _empty_node_mask(output, gold_zeros)
+        expected, expected_problems = _full_alignment(output, gold, tagged(output), empty)
+        result, word_problems = alignment(output, gold, tagged(output), empty)
+        assert result == expected, (output, gold)
+        assert edits(word_problems) == edits(expected_problems), (output, gold)
+
+
+@pytest.mark.parametrize("aligner", ALIGNERS)
+@pytest.mark.parametrize("gold_zeros", [False, True])
+def test_fast_align_matches_full_alignment(aligner, gold_zeros):
+    if aligner == "numpy":
+        pytest.importorskip("numpy")
+    rng = random.Random(5)
+    for _ in range(2000):
+        output, gold = random_pair(rng, max_words=rng.choice([6, 12, 30]))
+        empty = _empty_node_mask(output, gold_zeros)
+        expected, _ = _full_alignment(output, gold, tagged(output), empty)
+        result, word_problems = _fast_align(output, gold, tagged(output), empty, aligner)
+        assert result == expected, (output, gold)
+        assert word_problems["path"] in ("exact", "truncated", "trimmed", "aligned")
+
+
+def test_fast_align_repeated_anchor():
+    # the last word of the common prefix occurs again in the gold words
+    document = "The|[e1 cat|e1] sat on the|[e2 mat|e2] ."
+    gold = [["The", "cat", "sat", "on", "the", "the", "mat", "."]]
+    expected = _clean_document(document, gold, True, "txt", "full")
+    assert expected == "The|[e1 cat|e1] sat on the the|[e2 mat|e2] ."
+    assert _clean_document(document, gold, True, "txt", "banded") == expected
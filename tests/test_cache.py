@@ -0,0 +1,17 @@
+from text2text_coref import cache
+
+
+def test_cache_is_invalidated_by_file_and_format(tmp_path, monkeypatch):
+    source = tmp_path / "gold.conllu"
+    source.write_text("# newdoc id = doc1\n", encoding="utf-8")
+    cache_dir = str(tmp_path / "cache")
+    cache.store_cached(str(source), "gold", cache_dir, ["parsed"])
+    assert cache.load_cached(str(source), "gold", cache_dir) == ["parsed"]
+    assert cache.load_cached(str(source), "other", cache_dir) is None
+
+    monkeypatch.setattr(cache, "_versions", lambda: (cache.CACHE_FORMAT + 1, None))
+    assert cache.load_cached(str(source), "gold", cache_dir) is None
+    monkeypatch.undo()
+
+    source.write_text("# newdoc id = doc2\n# changed\n", encoding="utf-8")
+    assert cache.load_cached(str(source), "gold", cache_dir) is None
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from text2text_coref import conllu_stream
+from text2text_coref.convert import convert_conllu_file_to_text, convert_text_to_conllu
+from text2text_coref.output_cleaner import read_input_file
+from text2text_coref.stats import Stats
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# empty nodes, a discontinuous mention, bridging and enhanced dependencies with several heads
+SKELETON = os.path.join(DATA, "coref.conllu")
+
+TEXT = [
+    "Pedro|[e1] llegó y compró el|[e2 coche|e2] Lo|[e2] vendió ##vendió|[e1] ayer a|[e3 María|e3] ella|[e3] y "
+    "su|[e3],[e4 hermana|e4] ##|[e5]",
+    "El|[e1 equipo|e1] ganó ##ganó|[e1]",
+]
+
+
+def converted_text(tmp_path):
+    path = str(tmp_path / "coref.txt")
+    convert_conllu_file_to_text(SKELETON, path, zero_mentions=True)
+    return read_input_file(path)
+
+
+@pytest.mark.parametrize("text", ["converted", "written"])
+def test_streaming_writer_matches_udapi(tmp_path, text):
+    text_docs = converted_text(tmp_path) if text == "converted" else TEXT
+    stats = Stats(log_interval=None)
+    convert_text_to_conllu(text_docs, SKELETON, str(tmp_path / "stream.conllu"), streaming=True, stats=stats)
+    convert_text_to_conllu(text_docs, SKELETON, str(tmp_path / "udapi.conllu"), streaming=False)
+    # the documents were patched line by line, not converted through udapi
+    assert stats.totals["udapi_fallback"] == 0
+    assert stats.totals["documents"] == 2
+    with open(tmp_path / "stream.conllu", "rb") as stream, open(tmp_path / "udapi.conllu", "rb") as udapi:
+        assert stream.read() == udapi.read()
+
+
+def test_other_udapi_version_converts_through_udapi(tmp_path, monkeypatch):
+    monkeypatch.setattr(conllu_stream, "_udapi_supported", lambda: False)
+    stats = Stats(log_interval=None)
+    convert_text_to_conllu(TEXT, SKELETON, str(tmp_path / "stream.conllu"), streaming=True, stats=stats)
+    convert_text_to_conllu(TEXT, SKELETON, str(tmp_path / "udapi.conllu"), streaming=False)
+    assert stats.totals["udapi_fallback"] == 2
+    with open(tmp_path / "stream.conllu", "rb") as stream, open(tmp_path / "udapi.conllu", "rb") as udapi:
+        assert stream.read() == udapi.read()
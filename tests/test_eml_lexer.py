@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from text2text_coref.eml_format import parse_eml_word
+from text2text_coref.eml_lexer import lex_eml, normalize_eml, split_eml_word
+from text2text_coref.output_cleaner import _correct_basic_eml_syntax, _parse_eml_document, _parse_word
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# the expected outputs were produced by the former regex cascade of _correct_basic_eml_syntax
+# and the former regex version of parse_eml_word
+with open(os.path.join(DATA, "eml_cleaning.json"), encoding="utf-8") as f:
+    CLEANING = json.load(f)
+with open(os.path.join(DATA, "eml_words.json"), encoding="utf-8") as f:
+    WORDS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CLEANING, ids=range(len(CLEANING)))
+def test_normalize_eml(case):
+    assert normalize_eml(case["input"]) == case["normalized"]
+    assert _correct_basic_eml_syntax(case["input"]) == case["normalized"]
+
+
+@pytest.mark.parametrize("case", CLEANING, ids=range(len(CLEANING)))
+def test_lex_eml_matches_parsed_words(case):
+    # the lexed words are the same as the words of the normalized document parsed one by one
+    expected = [(word.text, word.form, word.tags) for word in
+                (_parse_word(word, "eml") for word in case["normalized"].split())]
+    assert lex_eml(case["input"]) == expected
+    assert [(word.text, word.form, word.tags) for word in _parse_eml_document(case["input"])] == expected
+
+
+def test_test_eml_cleaning_sample():
+    assert normalize_eml(CLEANING[0]["input"]) == (
+        "This is a <e21>test and test <e56>##</e56></e21> document > with <e2>entities</e2> <e5>and</e5> some "
+        "<e3><e4>invalid</e4></e3> tags."
+    )
+
+
+@pytest.mark.parametrize("word, opening_tags, text, closing_tags", WORDS)
+def test_split_eml_word(word, opening_tags, text, closing_tags):
+    assert split_eml_word(word) == (opening_tags, text, closing_tags)
+    assert tuple(parse_eml_word(word)) == (opening_tags, text, closing_tags)
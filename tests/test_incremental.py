@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from text2text_coref.incremental import IncrementalCleaner
+from text2text_coref.output_cleaner import _clean_document
+
+GOLD = [["Pedro", "llegó", "y", "compró", "el", "coche", "."], ["Lo", "vendió", "ayer", "a", "María", "."],
+        ["El", "equipo", "ganó", "."]]
+TEXT = ("Pedro|[e1] llegó y compró el|[e2 coche .|e2] Lo|[e2] vendió ayer a a|[e3 María|e3] . "
+        "El|[e1 equipo ganó .")
+
+
+def stream(cleaner, text, rng):
+    words = []
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 8)
+        words.extend(cleaner.feed(text[pos:pos + size]))
+        pos += size
+    return words, cleaner.finish()
+
+
+def test_streamed_document_matches_clean_document():
+    rng = random.Random(1)
+    expected = _clean_document(TEXT, GOLD, False, "txt", "sentence")
+    for _ in range(20):
+        cleaner = IncrementalCleaner(GOLD)
+        early, rest = stream(cleaner, TEXT, rng)
+        assert " ".join(early + rest) == cleaner.result == expected
+        assert cleaner.finish() == []
+
+
+def test_whole_document_aligner_rejected():
+    with pytest.raises(ValueError, match="Unsupported aligner banded"):
+        IncrementalCleaner(GOLD, aligner="banded")
+
+
+def test_feed_after_finish():
+    cleaner = IncrementalCleaner(GOLD)
+    cleaner.feed(TEXT)
+    cleaner.finish()
+    with pytest.raises(ValueError, match="already finished"):
+        cleaner.feed(" ")
@@ -0,0 +1,41 @@
+import json
+import os
+
+import pytest
+
+from text2text_coref.json_format import convert_conllu_file_to_json, convert_json_to_conllu, iter_jsonl
+
+SKELETON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "coref.conllu")
+
+
+def write_jsonl(path, docs):
+    with open(path, "w", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+
+@pytest.fixture
+def docs(tmp_path):
+    path = str(tmp_path / "coref.jsonl")
+    convert_conllu_file_to_json(SKELETON, path, zero_mentions=True)
+    docs = list(iter_jsonl(path))
+    # the discontinuous mention crossing the sentences is exported with reversed offsets
+    docs[0]["clusters_token_offsets"][2][0] = [10, 11]
+    return docs
+
+
+def test_jsonl_in_any_order(tmp_path, docs):
+    write_jsonl(tmp_path / "ordered.jsonl", docs)
+    write_jsonl(tmp_path / "reversed.jsonl", docs[::-1])
+    convert_json_to_conllu(str(tmp_path / "ordered.jsonl"), SKELETON, str(tmp_path / "ordered.conllu"))
+    convert_json_to_conllu(str(tmp_path / "reversed.jsonl"), SKELETON, str(tmp_path / "reversed.conllu"))
+    assert (tmp_path / "ordered.conllu").read_bytes() == (tmp_path / "reversed.conllu").read_bytes()
+
+
+def test_unmatched_document_removes_partial_output(tmp_path, docs):
+    # the first document is written before the second one fails to match
+    docs[1]["doc_id"] = "unknown"
+    write_jsonl(tmp_path / "bad.jsonl", docs)
+    with pytest.raises(ValueError, match="No JSON document with doc_id doc2"):
+        convert_json_to_conllu(str(tmp_path / "bad.jsonl"), SKELETON, str(tmp_path / "bad.conllu"))
+    assert not (tmp_path / "bad.conllu").exists()
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from text2text_coref.convert import convert_text_file_to_conllu
+from text2text_coref.eml_format import convert_conllu_file_to_eml, convert_eml_file_to_conllu
+from text2text_coref.output_cleaner import clean_file
+
+SKELETON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "coref.conllu")
+
+
+@pytest.fixture
+def eml(tmp_path):
+    path = str(tmp_path / "preds.eml")
+    convert_conllu_file_to_eml(SKELETON, path, zero_mentions=True)
+    return path
+
+
+def test_clean_default_output_name(eml):
+    clean_file(eml, SKELETON, format="eml")
+    assert os.path.getsize(eml[:-len(".eml")] + "-cleaned.eml") > 0
+
+
+@pytest.mark.parametrize("output", ["same", "link"])
+def test_clean_refuses_to_overwrite_input(tmp_path, eml, output):
+    size = os.path.getsize(eml)
+    if output == "link":
+        os.symlink(eml, tmp_path / "link.eml")
+        output = str(tmp_path / "link.eml")
+    else:
+        output = eml
+    with pytest.raises(ValueError, match="would overwrite the input"):
+        clean_file(eml, SKELETON, output, format="eml")
+    assert os.path.getsize(eml) == size
+
+
+@pytest.mark.parametrize("name", ["preds.out", "preds.eml.out"])
+def test_convert_default_output_name(tmp_path, eml, name):
+    path = str(tmp_path / name)
+    os.rename(eml, path)
+    size = os.path.getsize(path)
+    convert_eml_file_to_conllu(path, SKELETON, None, zero_mentions=True)
+    assert os.path.getsize(path) == size
+    assert os.path.getsize(os.path.splitext(path)[0] + ".conllu") > 0
+
+
+@pytest.mark.parametrize("convert", [convert_text_file_to_conllu, convert_eml_file_to_conllu])
+def test_convert_refuses_to_overwrite_input(eml, convert):
+    size = os.path.getsize(eml)
+    with pytest.raises(ValueError, match="would overwrite the input"):
+        convert(eml, SKELETON, eml, zero_mentions=True)
+    assert os.path.getsize(eml) == size
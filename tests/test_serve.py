@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from text2text_coref.serve import Service, _Handler
+
+SKELETON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "coref.conllu")
+
+
+@pytest.fixture(scope="module")
+def url():
+    service = Service({"coref": SKELETON})
+    for skeleton in service.skeletons.values():
+        skeleton.load_all()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def post(url, path, request):
+    try:
+        with urllib.request.urlopen(url + path, json.dumps(request).encode("utf-8")) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as ex:
+        return ex.code, json.load(ex)
+
+
+def test_clean(url):
+    status, response = post(url, "/clean", {"doc": "doc2", "text": "El|[e1 equipo|e1] ganó", "aligner": "sentence"})
+    assert status == 200
+    assert response["text"] == "El|[e1 equipo|e1] ganó"
+
+
+@pytest.mark.parametrize("path, key, value", [
+    ("/clean", "aligner", "bogus"),
+    ("/clean", "format", "xml"),
+    ("/conllu2text", "format", "xml"),
+])
+def test_unknown_option(url, path, key, value):
+    status, response = post(url, path, {"doc": 0, "text": "Pedro", key: value})
+    assert status == 400
+    assert response["error"].startswith(f"Unknown {key} {value}")
+
+
+@pytest.mark.parametrize("doc", [True, False, 1.0, None, [1]])
+def test_invalid_doc(url, doc):
+    status, response = post(url, "/clean", {"doc": doc, "text": "Pedro"})
+    assert status == 400
+    assert response["error"].startswith(f"Invalid doc {json.dumps(doc)}")
+
+
+@pytest.mark.parametrize("path, key, value", [
+    ("/clean", "zero_mentions", "false"),
+    ("/text2conllu", "zero_mentions", 0),
+    ("/text2conllu", "streaming", "false"),
+    ("/conllu2text", "blind", "false"),
+    ("/conllu2text", "sequential_ids", 1),
+    ("/conllu2text", "no_empty_node_form", None),
+])
+def test_invalid_flag(url, path, key, value):
+    status, response = post(url, path, {"doc": 0, "text": "Pedro", key: value})
+    assert status == 400
+    assert response["error"].startswith(f"Invalid {key} {json.dumps(value)}")
@@ -0,0 +1,26 @@
+from text2text_coref.stats import Stats
+
+
+def worker_stats():
+    stats = Stats(log_interval=None, keep_documents=True)
+    stats.add_document({"words": 3, "path": "exact"})
+    stats.add_document({"words": 2, "path": "aligned"})
+    return stats
+
+
+def test_totals_without_documents():
+    stats = Stats(log_interval=None)
+    stats.merge(worker_stats())
+    stats.add_document({"words": 1, "path": "exact"})
+    assert stats.documents == []
+    assert stats.totals == {"documents": 3, "words": 6, "path=exact": 2, "path=aligned": 1}
+
+
+def test_merge_keeps_documents():
+    stats = Stats(log_interval=None, keep_documents=True)
+    stats.file = "preds.txt"
+    stats.merge(worker_stats())
+    stats.merge(worker_stats())
+    assert [(document["file"], document["document"], document["words"]) for document in stats.documents] == [
+        ("preds.txt", 0, 3), ("preds.txt", 1, 2), ("preds.txt", 2, 3), ("preds.txt", 3, 2)]
+    assert stats.totals == {"documents": 4, "words": 10, "path=exact": 2, "path=aligned": 2}